@@ -0,0 +1,152 @@
+"""Micro-benchmark for AutoMod banned word matching.
+
+Checks synthetic chat messages against banned word lists of several sizes,
+once with the compiled per-guild matcher and once with the search per word
+AutoMod used to do, and reports messages checked per second and the time to
+build the matcher as JSON. The matcher is also timed through AutoMod's cache
+lookup, the path every message takes in on_message.
+
+Usage:
+    python -m benchmarks.automod_banned_words
+    python -m benchmarks.automod_banned_words --sizes 10 1000 10000 --messages 2000 --output results.json
+"""
+import argparse
+import json
+import platform
+import random
+import re
+import string
+import sys
+import time
+
+from cogs.automod import AutoMod
+from utils.wordmatch import BannedWordMatcher
+
+FILLER_WORDS = ("the", "a", "is", "this", "that", "lol", "gg", "ok", "what", "when", "server", "game",
+                "play", "music", "voice", "channel", "today", "tomorrow", "please", "thanks")
+
+
+def make_words(count, rng):
+    """Distinct made-up words and a few two word phrases, lower case like AutoMod stores them."""
+    words = set()
+    while len(words) < count:
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        if rng.random() < 0.1:
+            word += " " + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 7)))
+        words.add(word)
+    return sorted(words)
+
+
+def make_messages(count, words, hit_rate, rng):
+    messages = []
+    for _ in range(count):
+        parts = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(3, 25))]
+        if rng.random() < hit_rate:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(words).upper())
+        messages.append(" ".join(parts))
+    return messages
+
+
+def legacy_search(words, content):
+    """The check before compiled matchers: one regex search per banned word."""
+    for word in words:
+        if re.search(rf'\b{re.escape(word)}\b', content, re.IGNORECASE):
+            return word
+    return None
+
+
+def cached_matcher(words):
+    """Check function going through AutoMod's per-guild matcher cache like on_message does."""
+    cog = AutoMod.__new__(AutoMod)
+    cog.word_matchers = {}
+    config = {"banned_words": words, "banned_words_version": 1}
+    cog.get_word_matcher(1, config)
+    return lambda content: cog.get_word_matcher(1, config).search(content)
+
+
+def measure(check, messages):
+    started = time.perf_counter()
+    hits = sum(1 for content in messages if check(content))
+    return time.perf_counter() - started, hits
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    results = {}
+    for size in args.sizes:
+        words = make_words(size, rng)
+        messages = make_messages(args.messages, words, args.hit_rate, rng)
+
+        build_started = time.perf_counter()
+        matcher = BannedWordMatcher(words)
+        build_seconds = time.perf_counter() - build_started
+
+        elapsed, hits = measure(matcher.search, messages)
+        result = {
+            "build_ms": round(build_seconds * 1000, 2),
+            "compiled": {
+                "messages_per_second": round(len(messages) / elapsed),
+                "us_per_message": round(elapsed / len(messages) * 1e6, 2),
+                "hits": hits,
+            },
+        }
+        lookup_elapsed, lookup_hits = measure(cached_matcher(words), messages)
+        result["cached_lookup"] = {
+            "messages_per_second": round(len(messages) / lookup_elapsed),
+            "us_per_message": round(lookup_elapsed / len(messages) * 1e6, 2),
+            "hits": lookup_hits,
+        }
+        if not args.skip_legacy:
+            # The per word loop is slow enough with large lists to need fewer messages
+            sample = messages[:max(1, min(len(messages), args.legacy_budget // size))]
+            legacy_elapsed, legacy_hits = measure(lambda content: legacy_search(words, content), sample)
+            result["legacy"] = {
+                "messages": len(sample),
+                "messages_per_second": round(len(sample) / legacy_elapsed),
+                "us_per_message": round(legacy_elapsed / len(sample) * 1e6, 2),
+                "hits": legacy_hits,
+            }
+            result["same_matches"] = all(
+                (matcher.search(content) is None) == (legacy_search(words, content) is None) for content in sample[:50]
+            )
+            result["speedup"] = round((legacy_elapsed / len(sample)) / (elapsed / len(messages)), 1)
+        results[str(size)] = result
+
+    return {
+        "benchmark": "automod_banned_words",
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "messages": args.messages,
+            "hit_rate": args.hit_rate,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark AutoMod banned word matching.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000], help="banned word list sizes")
+    parser.add_argument('--messages', type=int, default=5000, help="messages checked per list size")
+    parser.add_argument('--hit-rate', type=float, default=0.05, help="share of messages containing a banned word")
+    parser.add_argument('--legacy-budget', type=int, default=2_000_000,
+                        help="word searches allowed for the per word loop (messages x words)")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for words and messages")
+    parser.add_argument('--skip-legacy', action='store_true', help="don't time the previous implementation")
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,426 @@
+"""Load benchmark for the music subsystem.
+
+Runs N guild MusicPlayer instances against fake voice clients and local audio
+files, without Discord or any network access, and reports event loop lag, CPU
+per stream, memory per player and track transition latency as JSON.
+
+Usage:
+    python -m benchmarks.music_load --guilds 50 --tracks 3 --track-seconds 5
+    python -m benchmarks.music_load --guilds 200 --speed 4 --output results.json
+
+The MongoDB/Redis layer is replaced by an in-memory stand-in so that only the
+player loop, source handling and audio reading are measured. Audio is decoded
+by FFmpeg when it is installed, or read as raw WAV PCM otherwise
+(``--decoder pcm``), which measures the Python side alone.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import platform
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+
+import discord
+
+import cogs.music as music
+from cogs.music import Music
+
+FRAME_SECONDS = 0.02  # Discord sends one 20ms Opus frame at a time
+SAMPLE_RATE = 48000
+CHANNELS = 2
+
+
+class FakeDatabase:
+    """In-memory stand-in for the database methods the music cog uses."""
+
+    def __init__(self):
+        self.current = {}
+
+    async def get_music_settings(self, guild_id):
+        return {"guild_id": guild_id, "volume": 0.5, "auto_play": False, "repeat_mode": "off"}
+
+    async def get_music_queue(self, guild_id):
+        return []
+
+    async def get_current_track(self, guild_id):
+        return self.current.get(guild_id)
+
+    async def set_current_track(self, guild_id, track_data, ex=3600):
+        self.current[guild_id] = track_data
+
+    async def clear_current_track(self, guild_id):
+        self.current.pop(guild_id, None)
+
+    async def get_top_tracks(self, guild_id, period, limit=10):
+        return []
+
+    def __getattr__(self, name):
+        # Every other write is accepted and dropped
+        async def noop(*args, **kwargs):
+            return None
+        return noop
+
+
+class WavPCMAudio(discord.AudioSource):
+    """Reads 48kHz stereo s16le WAV files frame by frame, like FFmpegPCMAudio's output."""
+
+    def __init__(self, source, **kwargs):
+        self._file = wave.open(source, 'rb')
+        self._frame_samples = int(SAMPLE_RATE * FRAME_SECONDS)
+
+    def read(self):
+        data = self._file.readframes(self._frame_samples)
+        if len(data) < discord.opus.Encoder.FRAME_SIZE:
+            return b''
+        return data
+
+    def cleanup(self):
+        self._file.close()
+
+
+def local_source_factory(audio_class):
+    """Replacement for YTDLSource.regather_stream that plays queued local files
+    directly, so the player loop runs without yt-dlp or network access."""
+    async def regather_stream(cls, data, *, loop):
+        source = cls(audio_class(data['url'], options='-vn'), data=dict(data))
+        source.requester = data['requester']
+        return source
+    return classmethod(regather_stream)
+
+
+class FakeVoiceClient:
+    """Plays sources on a thread at Discord's frame cadence and records transitions."""
+
+    def __init__(self, results, speed):
+        self.results = results
+        self.speed = speed
+        self.source = None
+        self._paused = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._ended_at = None
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive() and not self._paused.is_set()
+
+    def is_paused(self):
+        return self._paused.is_set()
+
+    def play(self, source, *, after=None):
+        now = time.perf_counter()
+        if self._ended_at is not None:
+            self.results.transitions.append(now - self._ended_at)
+        self._ended_at = None
+        self.source = source
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(source, after), daemon=True)
+        self._thread.start()
+
+    def _run(self, source, after):
+        interval = FRAME_SECONDS / self.speed
+        next_frame = time.perf_counter()
+        while not self._stopped.is_set():
+            if self._paused.is_set():
+                time.sleep(interval)
+                next_frame = time.perf_counter()
+                continue
+            if not source.read():
+                break
+            self.results.frames += 1
+            next_frame += interval
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.results.late_frames += 1
+        self._ended_at = time.perf_counter()
+        self.results.tracks_played += 1
+        if after:
+            after(None)
+
+    def pause(self):
+        self._paused.set()
+
+    def resume(self):
+        self._paused.clear()
+
+    def stop(self):
+        self._stopped.set()
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+
+
+class FakeMember:
+    def __init__(self, member_id, name):
+        self.id = member_id
+        self.display_name = name
+        self.mention = f"<@{member_id}>"
+        self.bot = False
+
+
+class FakeMessage:
+    def __init__(self, results):
+        self.results = results
+
+    async def edit(self, **kwargs):
+        self.results.messages_edited += 1
+
+    async def delete(self):
+        pass
+
+
+class FakeChannel:
+    def __init__(self, results):
+        self.results = results
+
+    async def send(self, *args, **kwargs):
+        self.results.messages_sent += 1
+        return FakeMessage(self.results)
+
+
+class FakeGuild:
+    def __init__(self, guild_id, voice_client):
+        self.id = guild_id
+        self.voice_client = voice_client
+        self.me = FakeMember(1, "bot")
+
+    def get_member(self, member_id):
+        return None
+
+
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+        self.closed = False
+
+    async def wait_until_ready(self):
+        return None
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeContext:
+    def __init__(self, bot, guild, channel, cog):
+        self.bot = bot
+        self.guild = guild
+        self.channel = channel
+        self.cog = cog
+        self.voice_client = guild.voice_client
+
+
+class Results:
+    def __init__(self):
+        self.transitions = []
+        self.loop_lag = []
+        self.frames = 0
+        self.late_frames = 0
+        self.tracks_played = 0
+        self.messages_sent = 0
+        self.messages_edited = 0
+
+
+def write_tone(path, seconds, frequency):
+    """Write a 48kHz stereo s16le sine tone."""
+    samples = int(SAMPLE_RATE * seconds)
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(CHANNELS)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        chunk = bytearray()
+        for i in range(samples):
+            value = int(8000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE))
+            chunk += struct.pack('<hh', value, value)
+        wav.writeframes(bytes(chunk))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize_ms(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 3) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 3) if values else None,
+        "max_ms": round(max(values) * 1000, 3) if values else None,
+    }
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def probe_loop_lag(results, interval, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        results.loop_lag.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    results = Results()
+    music.db = FakeDatabase()
+    audio_class = WavPCMAudio if args.decoder == 'pcm' else discord.FFmpegPCMAudio
+    music.YTDLSource.regather_stream = local_source_factory(audio_class)
+
+    audio_files = args.audio or []
+    tmpdir = None
+    if not audio_files:
+        tmpdir = tempfile.mkdtemp(prefix='music-bench-')
+        for i in range(args.tracks):
+            path = os.path.join(tmpdir, f'tone-{i}.wav')
+            write_tone(path, args.track_seconds, 220 + 110 * i)
+            audio_files.append(path)
+
+    bot = FakeBot(loop)
+    cog = Music(bot)
+    requester = FakeMember(2, "bench")
+
+    gc.collect()
+    rss_before = rss_bytes()
+    tracemalloc.start()
+    heap_before = tracemalloc.get_traced_memory()[0]
+    players = []
+    for guild_index in range(args.guilds):
+        guild = FakeGuild(1000 + guild_index, FakeVoiceClient(results, args.speed))
+        ctx = FakeContext(bot, guild, FakeChannel(results), cog)
+        players.append(await cog.get_player(ctx))
+    heap_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rss_after_players = rss_bytes()
+
+    stop = asyncio.Event()
+    lag_task = loop.create_task(probe_loop_lag(results, args.lag_interval, stop))
+
+    cpu_before = os.times()
+    wall_before = time.perf_counter()
+    for player in players:
+        for path in audio_files:
+            await player.queue.put({
+                'url': path,
+                'title': os.path.basename(path),
+                'duration': args.track_seconds,
+                'thumbnail': None,
+                'requester': requester,
+                'uploader': 'benchmark',
+                'id': None,
+                'webpage_url': None
+            })
+
+    expected = len(players) * len(audio_files)
+    deadline = wall_before + args.timeout
+    while results.tracks_played < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    wall = time.perf_counter() - wall_before
+    cpu_after = os.times()
+    peak_rss = rss_bytes()
+
+    stop.set()
+    await lag_task
+    bot.closed = True
+    for task in asyncio.all_tasks():
+        if task is not asyncio.current_task():
+            task.cancel()
+    if tmpdir:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    cpu_self = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+    cpu_children = (cpu_after.children_user - cpu_before.children_user) + \
+        (cpu_after.children_system - cpu_before.children_system)
+    stream_seconds = results.frames * FRAME_SECONDS
+
+    return {
+        "benchmark": "music_load",
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "guilds": args.guilds,
+            "tracks_per_guild": len(audio_files),
+            "track_seconds": args.track_seconds,
+            "speed": args.speed,
+            "decoder": args.decoder,
+        },
+        "completed": results.tracks_played >= expected,
+        "tracks_played": results.tracks_played,
+        "wall_seconds": round(wall, 3),
+        "event_loop_lag": summarize_ms(results.loop_lag),
+        "track_transition": summarize_ms(results.transitions),
+        "cpu": {
+            "process_seconds": round(cpu_self, 3),
+            "ffmpeg_seconds": round(cpu_children, 3),
+            # Share of one core needed per second of streamed audio
+            "core_per_stream": round((cpu_self + cpu_children) / stream_seconds, 5) if stream_seconds else None,
+        },
+        "memory": {
+            "python_heap_per_player_bytes": (heap_after - heap_before) // max(1, args.guilds),
+            "rss_per_player_bytes": (rss_after_players - rss_before) // max(1, args.guilds),
+            "rss_peak_bytes": peak_rss,
+        },
+        "frames": {
+            "read": results.frames,
+            "late": results.late_frames,
+        },
+        "messages": {
+            "sent": results.messages_sent,
+            "edited": results.messages_edited,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark concurrent music players without Discord.")
+    parser.add_argument('--guilds', type=int, default=20, help="number of simulated guild players")
+    parser.add_argument('--tracks', type=int, default=3, help="generated tracks queued per guild")
+    parser.add_argument('--track-seconds', type=float, default=5.0, help="length of each generated track")
+    parser.add_argument('--audio', nargs='*', help="local audio files to queue instead of generated tones")
+    parser.add_argument('--speed', type=float, default=1.0, help="playback speed multiplier (>1 reads frames faster than real time)")
+    parser.add_argument('--decoder', choices=['auto', 'ffmpeg', 'pcm'], default='auto',
+                        help="decode through FFmpeg or read WAV PCM directly")
+    parser.add_argument('--lag-interval', type=float, default=0.05, help="event loop lag probe interval in seconds")
+    parser.add_argument('--timeout', type=float, default=600.0, help="give up after this many seconds")
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.decoder == 'auto':
+        args.decoder = 'ffmpeg' if shutil.which('ffmpeg') else 'pcm'
+    if args.decoder == 'pcm' and args.audio and not all(path.endswith('.wav') for path in args.audio):
+        parser.error("--decoder pcm only reads 48kHz stereo WAV files")
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0 if report["completed"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
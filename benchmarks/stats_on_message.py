@@ -0,0 +1,198 @@
+"""Micro-benchmark for the statistics message listener.
+
+Feeds synthetic messages through Statistics.on_message without Discord or a
+database and reports messages processed per second as JSON, alongside the
+per-message dict updates the listener used to do, for comparison.
+
+Usage:
+    python -m benchmarks.stats_on_message --messages 500000
+    python -m benchmarks.stats_on_message --guilds 50 --channels 20 --output results.json
+"""
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import platform
+import random
+import sys
+import time
+
+import cogs.statistics as statistics
+from cogs.statistics import Statistics, StatsRollup
+
+
+class FakeDatabase:
+    """Accepts every statistics read and write without storing anything."""
+
+    async def get_guild_stats(self, guild_id):
+        return None
+
+    def __getattr__(self, name):
+        async def noop(*args, **kwargs):
+            return None
+        return noop
+
+
+class FakeAuthor:
+    __slots__ = ('id', 'bot')
+
+    def __init__(self, author_id):
+        self.id = author_id
+        self.bot = False
+
+
+class FakeObject:
+    __slots__ = ('id',)
+
+    def __init__(self, object_id):
+        self.id = object_id
+
+
+class FakeMessage:
+    __slots__ = ('author', 'guild', 'channel')
+
+    def __init__(self, author, guild, channel):
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+
+
+class FakeBot:
+    guilds = []
+
+    async def wait_until_ready(self):
+        return None
+
+
+def make_messages(args):
+    rng = random.Random(args.seed)
+    authors = [FakeAuthor(100 + i) for i in range(args.authors)]
+    guilds = [FakeObject(10_000 + i) for i in range(args.guilds)]
+    channels = [[FakeObject(guild.id * 1000 + c) for c in range(args.channels)] for guild in guilds]
+    messages = []
+    for _ in range(args.messages):
+        g = rng.randrange(args.guilds)
+        messages.append(FakeMessage(rng.choice(authors), guilds[g], channels[g][rng.randrange(args.channels)]))
+    return messages
+
+
+def make_cog():
+    cog = Statistics.__new__(Statistics)
+    cog.bot = FakeBot()
+    cog.stats_cache = {}
+    cog.pending_updates = {}
+    cog.counters = {}
+    cog.top_k = {}
+    cog.clock = (0, 0)
+    cog.clock_expires = 0.0
+    cog.preload_task = None
+    cog.shared_counters = False
+    cog.rollup = StatsRollup({"minute": 0, "hour": 0, "day": 0, "week": 0})
+    return cog
+
+
+async def legacy_on_message(cog, message):
+    """The listener before per-guild counters: nested dict updates per message."""
+    if message.author.bot:
+        return
+    if not message.guild:
+        return
+    guild_id = str(message.guild.id)
+    channel_id = str(message.channel.id)
+    await cog.initialize_guild_stats(guild_id)
+    cog.increment(guild_id, "messages.total")
+    cog.increment(guild_id, f"messages.by_channel.{channel_id}")
+    hour = str(datetime.datetime.utcnow().hour)
+    cog.increment(guild_id, f"messages.by_hour.{hour}")
+    day = str(datetime.datetime.utcnow().weekday())
+    cog.increment(guild_id, f"messages.by_day.{day}")
+
+
+async def measure(handler, cog, messages):
+    # Warm up every guild so only the steady state is timed
+    seen = set()
+    for message in messages:
+        if message.guild.id not in seen:
+            seen.add(message.guild.id)
+            await handler(cog, message)
+
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for message in messages:
+            await handler(cog, message)
+        elapsed = time.perf_counter() - started
+    finally:
+        gc.enable()
+
+    fold_started = time.perf_counter()
+    cog.fold_counters()
+    fold_elapsed = time.perf_counter() - fold_started
+    return elapsed, fold_elapsed
+
+
+async def run(args):
+    statistics.db = FakeDatabase()
+    messages = make_messages(args)
+
+    results = {}
+    handlers = {"current": Statistics.on_message}
+    if not args.skip_legacy:
+        handlers["legacy"] = legacy_on_message
+
+    for name, handler in handlers.items():
+        cog = make_cog()
+        elapsed, fold_elapsed = await measure(handler, cog, messages)
+        total = sum(stats["messages"]["total"] for stats in cog.stats_cache.values())
+        results[name] = {
+            "seconds": round(elapsed, 4),
+            "messages_per_second": round(len(messages) / elapsed) if elapsed else None,
+            "ns_per_message": round(elapsed / len(messages) * 1e9, 1),
+            "fold_ms": round(fold_elapsed * 1000, 3),
+            # Warm-up messages are counted too
+            "counted": total,
+        }
+
+    report = {
+        "benchmark": "stats_on_message",
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "messages": args.messages,
+            "guilds": args.guilds,
+            "channels_per_guild": args.channels,
+            "authors": args.authors,
+        },
+        "results": results,
+    }
+    if "legacy" in results:
+        report["speedup"] = round(results["legacy"]["seconds"] / results["current"]["seconds"], 2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the statistics message listener without Discord.")
+    parser.add_argument('--messages', type=int, default=200_000, help="messages fed through the listener")
+    parser.add_argument('--guilds', type=int, default=10, help="number of simulated guilds")
+    parser.add_argument('--channels', type=int, default=10, help="channels per guild")
+    parser.add_argument('--authors', type=int, default=1000, help="distinct message authors")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for the message mix")
+    parser.add_argument('--skip-legacy', action='store_true', help="don't time the previous implementation")
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
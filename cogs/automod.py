@@ -1,19 +1,212 @@
 import discord
 from discord.ext import commands, tasks
 import asyncio
-import re
 import json
+import logging
+import time
+from collections import deque
 from datetime import datetime, timedelta
 
+from config.settings import AUTOMOD_WINDOW_BACKEND
 from utils.database import db
+from utils.metrics import registry, timed_listener
+from utils.wordmatch import BannedWordMatcher
+
+logger = logging.getLogger('bot.automod')
+
+TRACKER_SWEEP_MINUTES = 5  # How often windows without recent events are dropped
+WINDOW_SYNC_INTERVAL = 1.0  # Seconds a Redis window may go without a sync while under its threshold
+WINDOW_RETRY_INTERVAL = 5.0  # Seconds windows are counted locally only after a failed Redis sync
+WINDOW_ERROR_LOG_INTERVAL = 60.0  # Seconds between logged Redis window errors
+
+
+class EventWindow:
+    """Events of the last few seconds, as (monotonic time, count) entries in arrival order.
+    Adding an event drops the entries that fell out of the window, so the
+    total is kept up to date with amortized O(1) work per event.
+    """
+    __slots__ = ('entries', 'total', 'seconds', 'last_seen')
+
+    def __init__(self):
+        self.entries = deque()
+        self.total = 0
+        self.seconds = 0
+        self.last_seen = 0.0
+
+    def add(self, now: float, seconds: float, count: int = 1) -> int:
+        """Record count events at now and return the number within the last seconds."""
+        self.expire(now, seconds)
+        self.entries.append((now, count))
+        self.total += count
+        self.seconds = seconds
+        self.last_seen = now
+        return self.total
+
+    def expire(self, now: float, seconds: float):
+        entries = self.entries
+        cutoff = now - seconds
+        while entries and entries[0][0] <= cutoff:
+            self.total -= entries.popleft()[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.total = 0
+
+    def idle(self, now: float) -> bool:
+        """Whether every event has left the window."""
+        return now - self.last_seen >= self.seconds
+
+
+class SharedWindow:
+    """A window counted in Redis by all bot processes.
+    Events are added to pending and only sent to Redis when the window is near
+    its threshold or hasn't been synced for WINDOW_SYNC_INTERVAL, so a busy
+    user costs at most about one round trip per second until they get close
+    to the limit. Between syncs the total is the last Redis total plus pending,
+    and reaching the threshold is always confirmed by a sync. While Redis can't
+    be reached the total falls back to this process's own events, which are
+    also kept in a local EventWindow.
+    """
+    __slots__ = ('key', 'remote', 'pending', 'seconds', 'synced_at', 'last_seen', 'local', 'offline')
+
+    def __init__(self, key: str):
+        self.key = key
+        self.remote = 0
+        self.pending = 0
+        self.seconds = 0
+        self.synced_at = 0.0
+        self.last_seen = 0.0
+        self.local = EventWindow()
+        self.offline = False
+
+    @property
+    def entries(self):
+        return self.local.entries
+
+    @property
+    def total(self) -> int:
+        return self.local.total if self.offline else self.remote + self.pending
+
+    @property
+    def unsent(self) -> int:
+        """Pending events that are still inside the window, so a long outage isn't sent as a burst."""
+        return min(self.pending, self.local.total)
+
+    def add(self, now: float, seconds: float, count: int = 1) -> int:
+        """Record count events at now and return the estimated number within the last seconds."""
+        self.local.add(now, seconds, count)
+        self.pending += count
+        self.seconds = seconds
+        self.last_seen = now
+        return self.total
+
+    def needs_sync(self, now: float, threshold: int) -> bool:
+        return self.total >= threshold or now - self.synced_at >= WINDOW_SYNC_INTERVAL
+
+    def synced(self, now: float, total: int):
+        self.remote = total
+        self.pending = 0
+        self.synced_at = now
+        self.offline = False
+
+    def clear(self):
+        self.remote = 0
+        self.pending = 0
+        self.local.clear()
+
+    def idle(self, now: float) -> bool:
+        """Whether every event has left the window, unsent ones included."""
+        return now - self.last_seen >= self.seconds
+
 
 class AutoMod(commands.Cog):
     def __init__(self, client):
         self.client = client
-        self.spam_trackers = {}
-        self.mention_trackers = {}
-        self.raid_alerts = {}
+        self.spam_trackers = {}  # guild_id -> {user_id: EventWindow of messages}
+        self.mention_trackers = {}  # guild_id -> {user_id: EventWindow of mentions}
+        self.raid_alerts = {}  # guild_id -> EventWindow of joins
+        # With shared windows the counts live in Redis and survive restarts and multiple processes
+        self.shared_windows = AUTOMOD_WINDOW_BACKEND == "redis"
+        self.windows_retry_at = 0.0  # Monotonic time of the next Redis attempt after a failed sync
+        self.window_errors = 0  # Redis window errors not logged yet
+        self.window_error_logged_at = float("-inf")
+        self.word_matchers = {}  # guild_id -> ((list version, length) it was built from, BannedWordMatcher)
         self.check_mutes.start() 
+        self.sweep_trackers.start()
+        registry.register_collector(self.collect_metrics)
+
+    def cog_unload(self):
+        self.check_mutes.cancel()
+        self.sweep_trackers.cancel()
+        registry.unregister_collector(self.collect_metrics)
+
+    def collect_metrics(self):
+        """Gauges for /metrics with the size of the in-memory trackers."""
+        users = []
+        entries = []
+        for name, trackers in (("spam", self.spam_trackers), ("mention", self.mention_trackers)):
+            windows = [window for guild_windows in trackers.values() for window in guild_windows.values()]
+            users.append(({"tracker": name}, len(windows)))
+            entries.append(({"tracker": name}, sum(len(window.entries) for window in windows)))
+        entries.append(({"tracker": "raid"}, sum(len(window.entries) for window in self.raid_alerts.values())))
+        return [
+            ("bot_automod_tracked_users", "Users with a spam or mention window in memory", users),
+            ("bot_automod_tracked_entries", "Timestamps held by the automod windows", entries),
+            ("bot_automod_word_matchers", "Compiled banned word matchers in memory", [({}, len(self.word_matchers))]),
+        ]
+
+    def new_window(self, key: str):
+        return SharedWindow(key) if self.shared_windows else EventWindow()
+
+    def user_window(self, trackers: dict, kind: str, guild_id: int, user_id: int):
+        guild_windows = trackers.get(guild_id)
+        if guild_windows is None:
+            guild_windows = trackers[guild_id] = {}
+        window = guild_windows.get(user_id)
+        if window is None:
+            window = guild_windows[user_id] = self.new_window(f"automod:window:{kind}:{guild_id}:{user_id}")
+        return window
+
+    async def sync_windows(self, now: float, checks: list):
+        """Send the pending counts of shared windows to Redis in one call and take back their totals.
+        checks holds (window, threshold) pairs, only windows that need a sync are sent.
+        """
+        due = [window for window, threshold in checks if window.needs_sync(now, threshold)]
+        if not due:
+            return
+        if now < self.windows_retry_at:
+            # Redis failed recently, don't wait on it for every message
+            for window in due:
+                window.offline = True
+            return
+        try:
+            totals = await db.count_sliding_windows([(window.key, window.seconds, window.unsent) for window in due])
+        except Exception as e:
+            # Decide on this process's own counts, pending ones are sent once Redis is back
+            for window in due:
+                window.offline = True
+            self.windows_retry_at = now + WINDOW_RETRY_INTERVAL
+            self.log_window_error(now, "Error syncing windows with Redis", e)
+            return
+        for window, total in zip(due, totals):
+            window.synced(now, total)
+
+    def log_window_error(self, now: float, message: str, error: Exception):
+        """Log Redis window errors at most once per WINDOW_ERROR_LOG_INTERVAL."""
+        self.window_errors += 1
+        if now - self.window_error_logged_at < WINDOW_ERROR_LOG_INTERVAL:
+            return
+        logger.error(f"{message}, counting locally ({self.window_errors} errors since the last report): {str(error)}")
+        self.window_errors = 0
+        self.window_error_logged_at = now
+
+    async def reset_window(self, window):
+        window.clear()
+        if self.shared_windows:
+            try:
+                await db.redis_delete(window.key)
+            except Exception as e:
+                self.log_window_error(time.monotonic(), f"Error resetting window {window.key}", e)
 
     async def get_automod_config(self, guild_id: int):
         """Retrieve automod configuration for a guild."""
@@ -35,6 +228,24 @@ class AutoMod(commands.Cog):
         """Update automod configuration for a guild."""
         await db.update_one("automod_config", {"guild_id": guild_id}, {"$set": new_config}, upsert=True)
 
+    def get_word_matcher(self, guild_id: int, config: dict) -> BannedWordMatcher:
+        """Compiled matcher for a guild's banned words.
+        The word commands bump banned_words_version, so a list changed by any process
+        is noticed with an O(1) check per message instead of comparing the whole list.
+        """
+        banned_words = config.get("banned_words", [])
+        key = (config.get("banned_words_version", 0), len(banned_words))
+        cached = self.word_matchers.get(guild_id)
+        if cached is None or cached[0] != key:
+            cached = self.word_matchers[guild_id] = (key, BannedWordMatcher(banned_words))
+        return cached[1]
+
+    async def save_banned_words(self, guild_id: int, config: dict):
+        """Save a changed banned word list under a new version, so every process rebuilds its matcher."""
+        config["banned_words_version"] = config.get("banned_words_version", 0) + 1
+        await self.update_automod_config(guild_id, config)
+        self.word_matchers.pop(guild_id, None)
+
     async def log_action(self, guild: discord.Guild, action: str, user: discord.Member, reason: str):
         config = await self.get_automod_config(guild.id)
         log_channel_id = config.get("log_channel_id")
@@ -131,6 +342,7 @@ class AutoMod(commands.Cog):
                 print(f"[AutoMod] Error during mute action: {e}")
 
     @commands.Cog.listener()
+    @timed_listener
     async def on_message(self, message: discord.Message):
         if message.author.bot or not message.guild:
             return
@@ -141,63 +353,52 @@ class AutoMod(commands.Cog):
 
         banned_words = config.get("banned_words", [])
         if banned_words:
-            for word in banned_words:
-                if re.search(rf'\b{re.escape(word)}\b', message.content, re.IGNORECASE):
-                    action = config.get("banned_word_action", "delete") # Default to delete
-                    await self.perform_action(message, action, f"Use of banned word/phrase: '{word}'")
-                    if action == "delete": 
-                        return 
-                    break
+            word = self.get_word_matcher(message.guild.id, config).search(message.content)
+            if word:
+                action = config.get("banned_word_action", "delete") # Default to delete
+                await self.perform_action(message, action, f"Use of banned word/phrase: '{word}'")
+                if action == "delete": 
+                    return 
 
         spam_config = config.get("spam_threshold", {"count": 5, "seconds": 10, "action": "warn"})
         user_id = message.author.id
         guild_id = message.guild.id
-        current_time = datetime.utcnow()
-
-        if guild_id not in self.spam_trackers:
-            self.spam_trackers[guild_id] = {}
-        if user_id not in self.spam_trackers[guild_id]:
-            self.spam_trackers[guild_id][user_id] = []
+        now = time.monotonic()
 
-        self.spam_trackers[guild_id][user_id] = [
-            ts for ts in self.spam_trackers[guild_id][user_id]
-            if current_time - ts < timedelta(seconds=spam_config["seconds"])
-        ]
-        self.spam_trackers[guild_id][user_id].append(current_time)
+        mention_config = config.get("mention_threshold", {"count": 5, "seconds": 10, "action": "warn"})
+        num_mentions = len(message.mentions) + len(message.role_mentions)
 
-        if len(self.spam_trackers[guild_id][user_id]) >= spam_config["count"]:
+        spam_window = self.user_window(self.spam_trackers, "spam", guild_id, user_id)
+        spam_window.add(now, spam_config["seconds"])
+        checks = [(spam_window, spam_config["count"])]
+        mention_window = None
+        if num_mentions > 0:
+            # One entry per message, counting all of its mentions
+            mention_window = self.user_window(self.mention_trackers, "mention", guild_id, user_id)
+            mention_window.add(now, mention_config["seconds"], num_mentions)
+            checks.append((mention_window, mention_config["count"]))
+        if self.shared_windows:
+            # At most one Redis call per message, for all of its windows
+            await self.sync_windows(now, checks)
+
+        if spam_window.total >= spam_config["count"]:
             await self.perform_action(message, spam_config["action"], "Spamming messages")
-            self.spam_trackers[guild_id][user_id] = []
+            await self.reset_window(spam_window)
             if spam_config["action"] == "delete":
                 return
 
-        mention_config = config.get("mention_threshold", {"count": 5, "seconds": 10, "action": "warn"})
-        num_mentions = len(message.mentions) + len(message.role_mentions)
-
-        if num_mentions > 0:
-            if guild_id not in self.mention_trackers:
-                self.mention_trackers[guild_id] = {}
-            if user_id not in self.mention_trackers[guild_id]:
-                self.mention_trackers[guild_id][user_id] = {"timestamps": [], "count": 0}
-
-            self.mention_trackers[guild_id][user_id]["timestamps"] = [
-                ts for ts in self.mention_trackers[guild_id][user_id]["timestamps"]
-                if current_time - ts < timedelta(seconds=mention_config["seconds"])
-            ]
-            for _ in range(num_mentions):
-                 self.mention_trackers[guild_id][user_id]["timestamps"].append(current_time)
-
-            if len(self.mention_trackers[guild_id][user_id]["timestamps"]) >= mention_config["count"]:
-                action_to_perform = mention_config["action"]
-                await self.perform_action(message, action_to_perform, "Excessive mentions")
-                self.mention_trackers[guild_id][user_id]["timestamps"] = [] 
-                # If action was mute, message is already handled by perform_action.
-                # If action was delete, we need to return to prevent further processing on a deleted message.
-                if action_to_perform == "delete":
-                    return
-                # For 'warn', we don't need to return, other checks might still apply or message might be kept.
+        if mention_window is not None and mention_window.total >= mention_config["count"]:
+            action_to_perform = mention_config["action"]
+            await self.perform_action(message, action_to_perform, "Excessive mentions")
+            await self.reset_window(mention_window)
+            # If action was mute, message is already handled by perform_action.
+            # If action was delete, we need to return to prevent further processing on a deleted message.
+            if action_to_perform == "delete":
+                return
+            # For 'warn', we don't need to return, other checks might still apply or message might be kept.
 
     @commands.Cog.listener()
+    @timed_listener
     async def on_member_join(self, member: discord.Member):
         guild = member.guild
         config = await self.get_automod_config(guild.id)
@@ -205,20 +406,19 @@ class AutoMod(commands.Cog):
             return
 
         raid_config = config.get("raid_threshold", {"joins": 5, "seconds": 10, "action": "kick"})
-        current_time = datetime.now(datetime.timezone.utc)
 
-        if guild.id not in self.raid_alerts:
-            self.raid_alerts[guild.id] = []
+        joins = self.raid_alerts.get(guild.id)
+        if joins is None:
+            joins = self.raid_alerts[guild.id] = self.new_window(f"automod:window:raid:{guild.id}")
 
-        self.raid_alerts[guild.id] = [
-            ts for ts in self.raid_alerts[guild.id]
-            if current_time - ts < timedelta(seconds=raid_config["seconds"])
-        ]
-        self.raid_alerts[guild.id].append(current_time)
+        now = time.monotonic()
+        joins.add(now, raid_config["seconds"])
+        if self.shared_windows:
+            await self.sync_windows(now, [(joins, raid_config["joins"])])
 
-        if len(self.raid_alerts[guild.id]) >= raid_config["joins"]:
-            await self.log_action(guild, "Raid Detected", member, f"{len(self.raid_alerts[guild.id])} joins in {raid_config['seconds']}s")
-            self.raid_alerts[guild.id] = [] 
+        if joins.total >= raid_config["joins"]:
+            await self.log_action(guild, "Raid Detected", member, f"{joins.total} joins in {raid_config['seconds']}s")
+            await self.reset_window(joins)
 
             if raid_config["action"] == "kick":
                 try:
@@ -298,7 +498,7 @@ class AutoMod(commands.Cog):
         word = word.lower()
         if word not in config["banned_words"]:
             config["banned_words"].append(word)
-            await self.update_automod_config(ctx.guild.id, config)
+            await self.save_banned_words(ctx.guild.id, config)
             await ctx.send(f"Added '{word}' to the banned words list.")
         else:
             await ctx.send(f"'{word}' is already in the banned words list.")
@@ -311,7 +511,7 @@ class AutoMod(commands.Cog):
         word = word.lower()
         if word in config["banned_words"]:
             config["banned_words"].remove(word)
-            await self.update_automod_config(ctx.guild.id, config)
+            await self.save_banned_words(ctx.guild.id, config)
             await ctx.send(f"Removed '{word}' from the banned words list.")
         else:
             await ctx.send(f"'{word}' is not in the banned words list.")
@@ -419,6 +619,20 @@ class AutoMod(commands.Cog):
         except Exception as e:
             print(f"[AutoMod Check Mutes] Error fetching Redis keys: {e}")
 
+    @tasks.loop(minutes=TRACKER_SWEEP_MINUTES)
+    async def sweep_trackers(self):
+        """Drop the windows of users and guilds with no events left in them."""
+        now = time.monotonic()
+        for trackers in (self.spam_trackers, self.mention_trackers):
+            for guild_id in list(trackers):
+                guild_windows = trackers[guild_id]
+                for user_id in [user_id for user_id, window in guild_windows.items() if window.idle(now)]:
+                    del guild_windows[user_id]
+                if not guild_windows:
+                    del trackers[guild_id]
+        for guild_id in [guild_id for guild_id, window in self.raid_alerts.items() if window.idle(now)]:
+            del self.raid_alerts[guild_id]
+
     @check_mutes.before_loop
     async def before_check_mutes(self):
         await self.client.wait_until_ready()
@@ -5,6 +5,7 @@ import datetime
 import json
 from typing import Optional, Dict, Tuple, List, Any
 from utils.database import db
+from utils.metrics import timed_listener
 
 class Greeting(commands.Cog):
     def __init__(self, client):
@@ -510,6 +511,7 @@ class Greeting(commands.Cog):
         await ctx.send(embed=embed)
 
     @commands.Cog.listener()
+    @timed_listener
     async def on_member_join(self, member):
         """Handle member join events"""
         guild_id = member.guild.id
@@ -639,6 +641,7 @@ class Greeting(commands.Cog):
                     pass
 
     @commands.Cog.listener()
+    @timed_listener
     async def on_member_remove(self, member):
         """Handle member leave events"""
         guild_id = member.guild.id
@@ -4,6 +4,7 @@ from discord.ext import commands
 import asyncio
 import json
 from utils.database import db
+from utils.metrics import timed_listener
 
 class Moderation(commands.Cog):
     def __init__(self, client):
@@ -23,6 +24,7 @@ class Moderation(commands.Cog):
         # - mod:ban:{guild_id}:{user_id} -> JSON with ban info  
 
     @commands.Cog.listener()
+    @timed_listener
     async def on_guild_join(self, guild):
         # Initialize warnings in memory for quick access
         self.client.warnings[guild.id] = {}
@@ -669,6 +671,7 @@ class Moderation(commands.Cog):
         await ctx.send(f"Set the muted role to {role.name} ({role_id}).")
         
     @commands.Cog.listener()
+    @timed_listener
     async def on_ready(self):
         """Load muted role IDs from database when bot starts"""
         for guild in self.client.guilds:
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, UTC
 import discord
 import asyncio
 import yt_dlp
@@ -6,10 +6,14 @@ import re
 import itertools
 import logging
 import json
-from discord.ext import commands
+import sys
+import time
+from collections import OrderedDict, deque
+from discord.ext import commands, tasks
 from async_timeout import timeout
 from functools import partial
 from utils.database import db
+from utils.metrics import CACHE_REQUESTS, registry
 
 logger = logging.getLogger('music')
 
@@ -39,6 +43,64 @@ YTDL_OPTIONS = {
     'source_address': '0.0.0.0',
 }
 
+# Flat extraction of YouTube "Mix" playlists, used to find related tracks for autoplay
+RELATED_YTDL_OPTIONS = {
+    'extract_flat': 'in_playlist',
+    'playlistend': 25,
+    'nocheckcertificate': True,
+    'ignoreerrors': True,
+    'logtostderr': False,
+    'quiet': True,
+    'no_warnings': True,
+    'source_address': '0.0.0.0',
+}
+
+RELATED_CACHE_TTL = 6 * 60 * 60  # Related tracks rarely change, keep them for 6 hours
+RELATED_CACHE_LOCAL_SIZE = 512  # Videos kept in the in-process layer of the related cache
+RECENTLY_PLAYED_SIZE = 50  # Video IDs autoplay avoids repeating per guild
+
+HISTORY_FLUSH_INTERVAL = 30  # Seconds between batched listening history writes
+HISTORY_MAX_BUFFER = 2000  # Plays kept in memory while MongoDB is unavailable
+HISTORY_RETENTION_DAYS = 30  # Raw history expires through a TTL index
+RESOLVE_CACHE_TTL = 30 * 60  # Stream URLs stay valid for hours, reuse resolutions for 30 minutes
+RESOLVE_CACHE_SIZE = 1024
+POPULAR_PREFETCH_COUNT = 5  # Top tracks of the week resolved when a guild player starts
+PLAY_BATCH_LIMIT = 10  # Queries accepted by a single !play
+PLAY_BATCH_CONCURRENCY = 4  # Extractions run at once for a batch
+
+FRAME_SECONDS = 0.02  # Each read() of an audio source yields 20ms of audio
+SEEK_CLEANUP_DELAY = 1  # Seconds a replaced source stays open so a read() in progress can finish
+EVICTION_SWEEP_INTERVAL = 60  # Seconds between idle player sweeps
+IDLE_EVICT_AFTER = 5 * 60  # Evict players with nothing playing after 5 minutes, like the player loop's idle timeout
+PAUSED_EVICT_AFTER = 10 * 60  # Evict paused players after 10 minutes
+SNAPSHOT_TTL = 24 * 60 * 60  # Evicted players can be restored for a day
+RESTORE_WAIT_TIMEOUT = 20  # Seconds a command waits for a restored track to start
+RESTORE_COMMANDS = ('play', 'resume', 'join', 'playlist play')  # Commands that bring an evicted player back
+
+PANEL_TICK_INTERVAL = 5  # Seconds between now-playing panel refresh passes
+PANEL_PROGRESS_INTERVAL = 15  # Minimum seconds between progress-only edits of a panel
+PANEL_EDIT_BUDGET = 25  # Panel edits allowed across all guilds per budget window
+PANEL_BUDGET_WINDOW = 10  # Seconds
+PROGRESS_BAR_LENGTH = 16
+
+
+def resolve_cache_key(query):
+    """Key of a query in the resolve cache. Only free text searches are case-insensitive,
+    URL paths and video IDs are not."""
+    query = query.strip()
+    if '://' in query or YTDL_REGEX.match(query):
+        return query
+    return query.lower()
+
+
+def ffmpeg_options(url, start_at=0):
+    """Build FFmpeg options for a stream URL, optionally starting mid-track."""
+    options = dict(FFMPEG_OPTIONS)
+    if start_at:
+        # -ss before the input seeks in the demuxer instead of decoding up to the position
+        options['before_options'] = f"-ss {start_at:.2f} {options.get('before_options', '')}".strip()
+    return options
+
 
 class YTDLSource(discord.PCMVolumeTransformer):
     def __init__(self, source, *, data, volume=0.5):
@@ -49,8 +111,28 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.duration = data.get('duration')
         self.thumbnail = data.get('thumbnail')
         self.uploader = data.get('uploader', 'Unknown')
+        self.video_id = data.get('id')
+        self.webpage_url = data.get('webpage_url')
+        self.start_at = data.get('start_at') or 0
+        self.frames_read = 0
+        self.seek_requested_at = None
         self.requester = None
 
+    def read(self):
+        data = super().read()
+        if data:
+            self.frames_read += 1
+            if self.seek_requested_at is not None:
+                latency = (time.perf_counter() - self.seek_requested_at) * 1000
+                self.seek_requested_at = None
+                logger.info(f"Seek to {self.start_at:.1f}s of {self.title} played first audio after {latency:.0f}ms")
+        return data
+
+    @property
+    def position(self):
+        """Playback position in seconds, counted from the frames handed to the voice client."""
+        return self.start_at + self.frames_read * FRAME_SECONDS
+
     @classmethod
     async def create_source(cls, search: str, *, loop, requester=None):
         logger.info(f"Attempting to create source for search: {search}")
@@ -72,7 +154,9 @@ class YTDLSource(discord.PCMVolumeTransformer):
                 'duration': data.get('duration'),
                 'thumbnail': data.get('thumbnail'),
                 'requester': requester,
-                'uploader': data.get('uploader', 'Unknown')
+                'uploader': data.get('uploader', 'Unknown'),
+                'id': data.get('id'),
+                'webpage_url': data.get('webpage_url')
             }
             
             logger.info(f"Source created successfully for: {data.get('title')}")
@@ -101,9 +185,14 @@ class YTDLSource(discord.PCMVolumeTransformer):
             extracted_data['thumbnail'] = extracted_data.get('thumbnail') or original_thumbnail
             extracted_data['uploader'] = extracted_data.get('uploader') or original_uploader
             extracted_data['duration'] = extracted_data.get('duration') or original_duration
+            # The stream URL has no YouTube identity of its own, keep the original one
+            extracted_data['id'] = data.get('id')
+            extracted_data['webpage_url'] = data.get('webpage_url')
+            extracted_data['start_at'] = data.get('start_at') or 0
             
             logger.debug(f"Creating FFmpegPCMAudio with URL: {extracted_data['url']}")
-            source = cls(discord.FFmpegPCMAudio(extracted_data['url'], **FFMPEG_OPTIONS), data=extracted_data)
+            options = ffmpeg_options(extracted_data['url'], extracted_data['start_at'])
+            source = cls(discord.FFmpegPCMAudio(extracted_data['url'], **options), data=extracted_data)
             source.requester = requester
             
            
@@ -120,6 +209,255 @@ class YTDLSource(discord.PCMVolumeTransformer):
             raise e
 
 
+class RelatedTrackCache:
+    """Per-video cache of related tracks used by autoplay.
+    Lookups hit a small in-process LRU first, then Redis, and only extract the
+    YouTube mix for the video when both miss. Concurrent lookups for the same
+    video share a single extraction.
+    """
+
+    def __init__(self, max_entries=RELATED_CACHE_LOCAL_SIZE, ttl=RELATED_CACHE_TTL):
+        self.ytdl = yt_dlp.YoutubeDL(RELATED_YTDL_OPTIONS)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = OrderedDict()  # video_id -> (expires_at, tracks)
+        self._pending = {}
+
+    async def get(self, video_id: str, *, loop) -> list:
+        """Return the related tracks for a video, in YouTube mix order."""
+        cached = self._local.get(video_id)
+        if cached and cached[0] > time.monotonic():
+            self._local.move_to_end(video_id)
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="related_tracks", result="hit")
+            return cached[1]
+
+        pending = self._pending.get(video_id)
+        if pending is None:
+            pending = loop.create_task(self._fetch(video_id, loop))
+            self._pending[video_id] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(video_id, None))
+
+        tracks = await asyncio.shield(pending)
+        self._local[video_id] = (time.monotonic() + self.ttl, tracks)
+        self._local.move_to_end(video_id)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+        return tracks
+
+    async def _fetch(self, video_id: str, loop) -> list:
+        try:
+            tracks = await db.get_related_tracks(video_id)
+            if tracks is not None:
+                self.hits += 1
+                CACHE_REQUESTS.inc(cache="related_tracks", result="hit")
+                logger.debug(f"Related tracks for {video_id} loaded from Redis")
+                return tracks
+        except Exception as e:
+            logger.error(f"Error reading related tracks from Redis: {str(e)}", exc_info=True)
+
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="related_tracks", result="miss")
+        logger.info(f"Extracting related tracks for video: {video_id}")
+        mix_url = f"https://www.youtube.com/watch?v={video_id}&list=RD{video_id}"
+        to_run = partial(self.ytdl.extract_info, url=mix_url, download=False)
+        data = await loop.run_in_executor(None, to_run)
+
+        tracks = []
+        for entry in (data or {}).get('entries') or []:
+            if not entry or not entry.get('id') or entry['id'] == video_id:
+                continue
+            tracks.append({
+                'id': entry['id'],
+                'title': entry.get('title'),
+                'url': f"https://www.youtube.com/watch?v={entry['id']}",
+                'duration': entry.get('duration'),
+                'uploader': entry.get('uploader') or entry.get('channel', 'Unknown')
+            })
+
+        try:
+            await db.set_related_tracks(video_id, tracks, ex=self.ttl)
+        except Exception as e:
+            logger.error(f"Error caching related tracks in Redis: {str(e)}", exc_info=True)
+        return tracks
+
+
+class ListeningHistory:
+    """Buffers played tracks and writes them to MongoDB in batches.
+    Each flush appends the raw plays to the history collection and folds them
+    into the per-guild weekly and all-time play counts read by !topsongs.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.uncounted = []  # Plays already in the history whose play counts failed to write
+        self._indexes_ready = False
+        self._lock = asyncio.Lock()
+
+    def record(self, guild_id: int, source):
+        """Queue a play for the next batched write."""
+        self.buffer.append({
+            'guild_id': str(guild_id),
+            'track_id': source.video_id or source.webpage_url or source.title,
+            'title': source.title,
+            'url': source.webpage_url,
+            'duration': source.duration,
+            'requester_id': source.requester.id if source.requester else None,
+            'played_at': datetime.now(UTC)
+        })
+
+    async def flush(self):
+        """Write all buffered plays to the history and the aggregates."""
+        if not self.buffer and not self.uncounted:
+            return
+        async with self._lock:
+            entries, self.buffer = self.buffer, []
+            if entries:
+                try:
+                    if not self._indexes_ready:
+                        await db.ensure_music_history_indexes(HISTORY_RETENTION_DAYS)
+                        self._indexes_ready = True
+                    await db.add_music_history(entries)
+                except Exception as e:
+                    logger.error(f"Error writing listening history: {str(e)}", exc_info=True)
+                    # Nothing was written, retry the whole batch on the next flush
+                    self.buffer = (entries + self.buffer)[-HISTORY_MAX_BUFFER:]
+                    entries = []
+            
+            counted, self.uncounted = self.uncounted + entries, []
+            if not counted:
+                return
+            try:
+                await db.increment_track_plays(counted)
+                logger.debug(f"Flushed {len(counted)} plays to listening history")
+            except Exception as e:
+                logger.error(f"Error updating top track aggregates: {str(e)}", exc_info=True)
+                # The history has these plays already, only their counts are retried
+                self.uncounted = counted[-HISTORY_MAX_BUFFER:]
+
+
+class EditBudget:
+    """Token bucket shared by all now-playing panels.
+    Keeps the total rate of panel edits under a global limit so progress
+    updates never compete with commands for the bot's rate limits.
+    """
+
+    def __init__(self, capacity=PANEL_EDIT_BUDGET, window=PANEL_BUDGET_WINDOW):
+        self.capacity = capacity
+        self.refill_rate = capacity / window
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.skipped = 0
+
+    def take(self, force=False) -> bool:
+        """Spend one edit. Forced edits always go through but still drain the bucket."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+        if self.tokens >= 1 or force:
+            self.tokens -= 1
+            return True
+        self.skipped += 1
+        return False
+
+
+class TrackQueue:
+    """Upcoming tracks of a guild player.
+    Works like an asyncio.Queue with a single consumer, and keeps the waiting
+    tracks in a deque that snapshots and the panel can read.
+    """
+
+    def __init__(self):
+        self.tracks = deque()
+        self._added = asyncio.Event()
+
+    async def put(self, track):
+        self.put_nowait(track)
+
+    def put_nowait(self, track):
+        self.tracks.append(track)
+        self._added.set()
+
+    async def get(self):
+        """Wait for and remove the next track"""
+        while not self.tracks:
+            self._added.clear()
+            await self._added.wait()
+        return self.tracks.popleft()
+
+    def empty(self) -> bool:
+        return not self.tracks
+
+    def qsize(self) -> int:
+        return len(self.tracks)
+
+
+class PlayerPanelView(discord.ui.View):
+    """Control buttons attached to a guild's now-playing panel."""
+
+    def __init__(self, player):
+        super().__init__(timeout=None)
+        self.player = player
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        vc = self.player.guild.voice_client
+        voice = getattr(interaction.user, 'voice', None)
+        if not vc or not voice or voice.channel != vc.channel:
+            await interaction.response.send_message('Join my voice channel to use the player controls.', ephemeral=True)
+            return False
+        return True
+
+    async def _refresh(self, interaction: discord.Interaction):
+        # Answering the interaction edits the panel without touching the edit budget
+        self.player.mark_panel_updated()
+        await interaction.response.edit_message(embed=self.player.build_panel_embed(), view=self)
+
+    async def _seek_by(self, interaction: discord.Interaction, seconds: int):
+        current = self.player.current
+        if not current:
+            return await interaction.response.defer()
+        position = max(0, current.position + seconds)
+        if current.duration and position >= current.duration:
+            return await interaction.response.defer()
+        self.player.seek(position)
+        await self._refresh(interaction)
+
+    @discord.ui.button(emoji='⏪', style=discord.ButtonStyle.secondary)
+    async def rewind_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._seek_by(interaction, -10)
+
+    @discord.ui.button(emoji='⏯️', style=discord.ButtonStyle.primary)
+    async def pause_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        vc = self.player.guild.voice_client
+        if vc.is_paused():
+            vc.resume()
+        elif vc.is_playing():
+            vc.pause()
+        await self._refresh(interaction)
+
+    @discord.ui.button(emoji='⏩', style=discord.ButtonStyle.secondary)
+    async def forward_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._seek_by(interaction, 10)
+
+    @discord.ui.button(emoji='⏭️', style=discord.ButtonStyle.secondary)
+    async def skip_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        vc = self.player.guild.voice_client
+        if vc.is_playing() or vc.is_paused():
+            vc.stop()
+        # The panel is edited in place when the next track starts
+        await interaction.response.defer()
+
+    @discord.ui.button(emoji='⏹️', style=discord.ButtonStyle.danger)
+    async def stop_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.defer()
+        guild = self.player.guild
+        await db.clear_music_queue(str(guild.id))
+        await db.clear_current_track(str(guild.id))
+        await self.player.cog.cleanup(guild, reason=f"Stopped by {interaction.user.display_name}")
+
+
 class MusicPlayer:
     """A class which is assigned to each guild using the bot for music.
     This class implements a queue and loop, which allows for different guilds to listen to different playlists
@@ -127,24 +465,110 @@ class MusicPlayer:
     When the bot disconnects from the Voice it's instance will be destroyed.
     """
 
-    __slots__ = ('bot', 'guild', 'channel', 'cog', 'queue', 'next', 'current', 'volume', 'repeat_mode')
+    __slots__ = ('bot', 'guild', 'channel', 'cog', 'queue', 'next', 'current', 'volume', 'repeat_mode',
+                 'auto_play', 'recently_played', 'autoplay_task', 'tasks', 'playing', 'idle_since',
+                 'restore_paused', 'panel_message', 'panel_view', 'panel_updated_at', 'panel_state')
 
-    def __init__(self, ctx):
+    def __init__(self, ctx, snapshot=None):
         self.bot = ctx.bot
         self.guild = ctx.guild
         self.channel = ctx.channel
         self.cog = ctx.cog
         
-        self.queue = asyncio.Queue()
+        self.queue = TrackQueue()
         self.next = asyncio.Event()
         
         self.volume = 0.5
         self.current = None
         self.repeat_mode = "off"  # off, single, queue
-        
-        ctx.bot.loop.create_task(self.player_loop())
-        ctx.bot.loop.create_task(self._load_settings())
-        ctx.bot.loop.create_task(self._load_queue())
+        self.auto_play = False
+        self.recently_played = deque(maxlen=RECENTLY_PLAYED_SIZE)
+        self.autoplay_task = None
+        self.tasks = set()
+        self.playing = asyncio.Event()
+        self.idle_since = None
+        self.restore_paused = False
+        self.panel_message = None
+        self.panel_view = None
+        self.panel_updated_at = 0
+        self.panel_state = None
+        
+        if snapshot:
+            # Restoring an evicted player needs no database round trips
+            self._restore(snapshot)
+        else:
+            self._spawn(self._load_settings())
+            self._spawn(self._load_queue())
+        self._spawn(self.player_loop())
+
+    def _spawn(self, coro):
+        """Create a task owned by this player so it can be cancelled with it"""
+        task = self.bot.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def cancel_tasks(self):
+        """Cancel every background task of this player"""
+        current = asyncio.current_task()
+        for task in list(self.tasks):
+            if task is not current:
+                task.cancel()
+
+    def snapshot(self) -> dict:
+        """Capture the queue, settings and playback position as plain JSON data"""
+        def serialize(track):
+            data = {key: value for key, value in track.items() if key != 'requester'}
+            requester = track.get('requester')
+            data['requester_id'] = requester.id if requester else None
+            # Stream URLs expire, the page URL can always be extracted again
+            data['url'] = track.get('webpage_url') or track['url']
+            return data
+        
+        current = None
+        if self.current:
+            current = serialize({
+                'url': self.current.url,
+                'title': self.current.title,
+                'duration': self.current.duration,
+                'thumbnail': self.current.thumbnail,
+                'requester': self.current.requester,
+                'uploader': self.current.uploader,
+                'id': self.current.video_id,
+                'webpage_url': self.current.webpage_url,
+                'start_at': round(self.current.position, 2)
+            })
+        
+        vc = self.guild.voice_client
+        return {
+            'guild_id': str(self.guild.id),
+            'voice_channel_id': vc.channel.id if vc and vc.channel else None,
+            'volume': self.volume,
+            'repeat_mode': self.repeat_mode,
+            'auto_play': self.auto_play,
+            'paused': bool(vc and vc.is_paused()),
+            'current': current,
+            'queue': [serialize(track) for track in self.queue.tracks],
+            'recently_played': list(self.recently_played),
+            'snapshot_at': datetime.now(UTC).isoformat()
+        }
+
+    def _restore(self, snapshot):
+        """Load state captured by snapshot(), resuming the current track where it stopped"""
+        self.volume = snapshot.get('volume', 0.5)
+        self.repeat_mode = snapshot.get('repeat_mode', 'off')
+        self.auto_play = snapshot.get('auto_play', False)
+        self.recently_played.extend(snapshot.get('recently_played', []))
+        self.restore_paused = bool(snapshot.get('paused') and snapshot.get('current'))
+        
+        tracks = ([snapshot['current']] if snapshot.get('current') else []) + snapshot.get('queue', [])
+        # Eviction cleared the Redis queue, the snapshot's copy is still JSON data
+        self._spawn(self._save_tracks([dict(track) for track in tracks]))
+        for track in tracks:
+            requester_id = track.pop('requester_id', None)
+            track['requester'] = (self.guild.get_member(requester_id) if requester_id else None) or self.guild.me
+            self.queue.put_nowait(track)
+        logger.info(f"Restored player with {len(tracks)} tracks for guild: {self.guild.id}")
 
     async def _load_settings(self):
         """Load music settings from the database"""
@@ -152,6 +576,7 @@ class MusicPlayer:
             settings = await db.get_music_settings(str(self.guild.id))
             self.volume = settings.get("volume", 0.5)
             self.repeat_mode = settings.get("repeat_mode", "off")
+            self.auto_play = settings.get("auto_play", False)
             logger.info(f"Loaded music settings for guild: {self.guild.id}")
         except Exception as e:
             logger.error(f"Error loading music settings: {str(e)}", exc_info=True)
@@ -171,6 +596,11 @@ class MusicPlayer:
         except Exception as e:
             logger.error(f"Error loading music queue: {str(e)}", exc_info=True)
     
+    async def _save_tracks(self, tracks):
+        """Save restored tracks to the Redis queue"""
+        for track in tracks:
+            await self._save_to_queue(track)
+    
     async def _save_to_queue(self, track):
         """Save a track to the Redis queue"""
         try:
@@ -186,6 +616,16 @@ class MusicPlayer:
         
         while not self.bot.is_closed():
             self.next.clear()
+            cancelled = False
+            
+            # Queue ran dry: use the related track resolved while the last one was playing
+            if self.queue.empty() and self.autoplay_task:
+                candidate = await self._take_autoplay()
+                if candidate and self.queue.empty():
+                    logger.info(f"Autoplay queued: {candidate.get('title')} for guild: {self.guild.id}")
+                    await self.queue.put(candidate)
+                    await self._save_to_queue(candidate)
+            
             logger.debug(f"Waiting for the next song in queue for guild: {self.guild.id}")
             
             # Wait for the next song. If we timeout, cancel the player and disconnect
@@ -222,29 +662,44 @@ class MusicPlayer:
                 
                 logger.info(f"Starting playback of: {source.title} in guild: {self.guild.id}")
                 self.guild.voice_client.play(source, after=lambda e: self.bot.loop.call_soon_threadsafe(self._after_playback, e))
+                if self.restore_paused:
+                    # The player was evicted while paused, restore it paused
+                    self.restore_paused = False
+                    self.guild.voice_client.pause()
+                self.playing.set()
+                if source.video_id:
+                    self.recently_played.append(source.video_id)
+                self.cog.history.record(self.guild.id, source)
+                self.schedule_autoplay()
                 
-                embed = discord.Embed(title="Now playing", description=f"[{source.title}]({source.url})", color=discord.Color.green())
-                embed.set_thumbnail(url=source.thumbnail)
-                embed.add_field(name="Duration", value=self.parse_duration(source.duration))
-                embed.add_field(name="Requested by", value=source.requester.mention)
-                embed.add_field(name="Uploader", value=source.uploader)
-                embed.set_footer(text=f"Volume: {self.volume*100}% | Repeat: {self.repeat_mode}")
-                await self.channel.send(embed=embed)
+                # Track changes always edit the panel, they replace what used to be a new message
+                self.cog.panel_budget.take(force=True)
+                try:
+                    await self.update_panel()
+                except Exception as e:
+                    # The track is already playing, a broken panel must not end it
+                    logger.error(f"Error updating now playing panel for guild: {self.guild.id}: {str(e)}", exc_info=True)
                 
                 logger.debug(f"Waiting for song to finish: {source.title} in guild: {self.guild.id}")
                 await self.next.wait()
+            except asyncio.CancelledError:
+                # The player is being torn down, the track must not be queued again
+                cancelled = True
+                raise
             except Exception as e:
                 logger.error(f"Error during playback: {str(e)}", exc_info=True)
                 await self.channel.send(f"An error occurred during playback: {str(e)}")
                 self.next.set()
                 continue
             finally:
-                if source:
+                self.playing.clear()
+                # source is still the queue entry if regathering failed or was cancelled
+                if isinstance(source, YTDLSource):
                     logger.debug(f"Cleaning up FFmpeg process for: {source.title}")
                     source.cleanup()
                 
                 # Handle repeat modes
-                if self.repeat_mode == "single" and self.current:
+                if self.repeat_mode == "single" and self.current and not cancelled:
                     # Put the current song back in the queue
                     current_data = {
                         'url': source.url,
@@ -256,7 +711,7 @@ class MusicPlayer:
                     }
                     await self.queue.put(current_data)
                     await self._save_to_queue(current_data)
-                elif self.repeat_mode == "queue" and self.queue.empty():
+                elif self.repeat_mode == "queue" and self.queue.empty() and not cancelled:
                     # If queue is empty and repeat mode is queue, reload all tracks
                     logger.info(f"Queue repeat mode: reloading all tracks for guild: {self.guild.id}")
                     try:
@@ -295,6 +750,152 @@ class MusicPlayer:
                 self.current = None
                 logger.debug(f"Playback finished for guild: {self.guild.id}")
     
+    def schedule_autoplay(self):
+        """Start resolving the autoplay candidate while the current track is still playing."""
+        if not self.auto_play or self.repeat_mode != "off" or not self.queue.empty():
+            return
+        if not self.current or not self.current.video_id:
+            return
+        if self.autoplay_task and not self.autoplay_task.done():
+            self.autoplay_task.cancel()
+        self.autoplay_task = self._spawn(self._resolve_autoplay(self.current.video_id))
+    
+    async def _resolve_autoplay(self, video_id):
+        """Pick the first related track that was not played recently and fully resolve it."""
+        try:
+            related = await self.cog.related_cache.get(video_id, loop=self.bot.loop)
+            for track in related:
+                if track['id'] in self.recently_played:
+                    continue
+                logger.debug(f"Resolving autoplay candidate: {track.get('title')} for guild: {self.guild.id}")
+                return await self.cog.resolve_track(track['url'], requester=self.guild.me)
+            logger.info(f"No autoplay candidate left for video: {video_id} in guild: {self.guild.id}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error resolving autoplay candidate: {str(e)}", exc_info=True)
+        return None
+    
+    async def _take_autoplay(self):
+        """Return the prepared autoplay candidate, if autoplay is still wanted."""
+        task, self.autoplay_task = self.autoplay_task, None
+        if not self.auto_play or self.repeat_mode != "off":
+            task.cancel()
+            return None
+        try:
+            return await task
+        except asyncio.CancelledError:
+            return None
+    
+    def panel_state_key(self):
+        """Everything shown on the panel apart from the progress bar"""
+        vc = self.guild.voice_client
+        return (
+            id(self.current) if self.current else None,
+            bool(vc and vc.is_paused()),
+            self.volume,
+            self.repeat_mode,
+            self.auto_play,
+            self.queue.qsize()
+        )
+
+    def mark_panel_updated(self):
+        self.panel_updated_at = time.monotonic()
+        self.panel_state = self.panel_state_key()
+
+    def build_panel_embed(self) -> discord.Embed:
+        """Build the now-playing panel for the current state of the player"""
+        source = self.current
+        footer = f"Volume: {int(self.volume * 100)}% | Repeat: {self.repeat_mode} | Autoplay: {'on' if self.auto_play else 'off'}"
+        if not source:
+            embed = discord.Embed(title="Nothing playing", description="Add songs with `!play <song>`", color=discord.Color.dark_grey())
+            embed.set_footer(text=footer)
+            return embed
+
+        vc = self.guild.voice_client
+        paused = bool(vc and vc.is_paused())
+        embed = discord.Embed(
+            title="Paused" if paused else "Now playing",
+            description=f"[{source.title}]({source.webpage_url or source.url})",
+            color=discord.Color.orange() if paused else discord.Color.green()
+        )
+        if source.thumbnail:
+            embed.set_thumbnail(url=source.thumbnail)
+        embed.add_field(name="Progress", value=self.progress_bar(source.position, source.duration), inline=False)
+        embed.add_field(name="Requested by", value=source.requester.mention)
+        embed.add_field(name="Uploader", value=source.uploader)
+        if not self.queue.empty():
+            embed.add_field(name="Up next", value=f"{self.queue.tracks[0].get('title')} (+{self.queue.qsize() - 1} more)", inline=False)
+        embed.set_footer(text=footer)
+        return embed
+
+    def progress_bar(self, position, duration):
+        elapsed = self.parse_duration(int(position))
+        if not duration:
+            return f"{elapsed} / Unknown"
+        filled = min(PROGRESS_BAR_LENGTH - 1, int(position / duration * PROGRESS_BAR_LENGTH))
+        bar = "▬" * filled + "🔘" + "▬" * (PROGRESS_BAR_LENGTH - filled - 1)
+        return f"{bar} `{elapsed} / {self.parse_duration(duration)}`"
+
+    async def update_panel(self):
+        """Edit the panel message in place, sending it first if there is none"""
+        if self.panel_view is None:
+            self.panel_view = PlayerPanelView(self)
+        embed = self.build_panel_embed()
+        view = self.panel_view if self.current else None
+        self.mark_panel_updated()
+        try:
+            if self.panel_message:
+                try:
+                    await self.panel_message.edit(embed=embed, view=view)
+                    return
+                except discord.NotFound:
+                    logger.debug(f"Panel message was deleted, sending a new one for guild: {self.guild.id}")
+            self.panel_message = await self.channel.send(embed=embed, view=view)
+        except discord.HTTPException as e:
+            logger.error(f"Error updating now playing panel: {str(e)}")
+
+    async def close_panel(self, reason):
+        """Leave a final state on the panel and remove its controls"""
+        if self.panel_view:
+            self.panel_view.stop()
+        if not self.panel_message:
+            return
+        embed = discord.Embed(title=reason, color=discord.Color.dark_grey())
+        try:
+            await self.panel_message.edit(embed=embed, view=None)
+        except discord.HTTPException:
+            pass
+        self.panel_message = None
+
+    def seek(self, position: float):
+        """Restart the current track at position seconds.
+        The new FFmpeg process reads the stream URL that was
+        already resolved for this track, so no yt-dlp extraction is needed.
+        """
+        requested_at = time.perf_counter()
+        old = self.current
+        data = dict(old.data, start_at=position)
+        
+        new = YTDLSource(discord.FFmpegPCMAudio(old.url, **ffmpeg_options(old.url, position)), data=data, volume=self.volume)
+        new.requester = old.requester
+        new.title = old.title
+        new.thumbnail = old.thumbnail
+        new.uploader = old.uploader
+        new.duration = old.duration
+        new.seek_requested_at = requested_at
+        
+        # Swapping the source doesn't fire the after callback, but it resumes playback
+        vc = self.guild.voice_client
+        paused = vc.is_paused()
+        vc.source = new
+        if paused:
+            vc.pause()
+        self.current = new
+        # The audio thread may still be inside old.read(), killing FFmpeg now would end the track
+        self.bot.loop.call_later(SEEK_CLEANUP_DELAY, old.cleanup)
+        logger.debug(f"Seek source for {new.title} started in {(time.perf_counter() - requested_at) * 1000:.0f}ms in guild: {self.guild.id}")
+    
     def _after_playback(self, error):
         """Callback for when a song finishes playing."""
         if error:
@@ -306,7 +907,7 @@ class MusicPlayer:
         if duration is None:
             return "Unknown"
         
-        minutes, seconds = divmod(duration, 60)
+        minutes, seconds = divmod(int(duration), 60)
         hours, minutes = divmod(minutes, 60)
         
         duration_str = ""
@@ -316,9 +917,26 @@ class MusicPlayer:
         duration_str += f"{minutes:02d}:{seconds:02d}"
         return duration_str
 
+    @staticmethod
+    def parse_timestamp(timestamp):
+        """Parse seconds, mm:ss or hh:mm:ss into seconds. Returns None when invalid."""
+        try:
+            parts = [int(part) for part in timestamp.strip().split(':')]
+        except ValueError:
+            return None
+        if not 1 <= len(parts) <= 3 or any(part < 0 for part in parts):
+            return None
+        
+        seconds = 0
+        for part in parts:
+            seconds = seconds * 60 + part
+        return seconds
+
     def destroy(self, guild):
         """Disconnect and cleanup the player."""
         # Save settings before destroying
+        if self.autoplay_task:
+            self.autoplay_task.cancel()
         self.bot.loop.create_task(self._save_settings())
         return self.bot.loop.create_task(self.cog.cleanup(guild))
         
@@ -327,7 +945,8 @@ class MusicPlayer:
         try:
             settings = {
                 "volume": self.volume,
-                "repeat_mode": self.repeat_mode
+                "repeat_mode": self.repeat_mode,
+                "auto_play": self.auto_play
             }
             await db.update_music_settings(str(self.guild.id), settings)
             logger.info(f"Saved music settings for guild: {self.guild.id}")
@@ -335,14 +954,142 @@ class MusicPlayer:
             logger.error(f"Error saving music settings: {str(e)}", exc_info=True)
 
 
+def _approx_size(obj, seen=None):
+    """Rough deep size of plain data (dicts, lists, strings, numbers) in bytes.
+    Discord objects are shared with the client cache and are not counted.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_approx_size(k, seen) + _approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(_approx_size(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return 0
+    return size
+
+
+class PlayerResourceManager:
+    """Tracks the memory and tasks held by guild players and evicts idle ones.
+    Evicted players are snapshotted to Redis and restored by the next command
+    that needs playback, or by the next player created for the guild, so idle and
+    paused guilds don't pin a player, its tasks and a voice connection.
+    """
+
+    def __init__(self, cog):
+        self.cog = cog
+        self.evicted = 0
+        self.restored = 0
+
+    def usage(self, player) -> dict:
+        """Task count and approximate memory of a single player"""
+        memory = _approx_size(list(player.queue.tracks)) + _approx_size(player.recently_played)
+        if player.current:
+            memory += _approx_size(player.current.data)
+        return {'tasks': len(player.tasks), 'memory_bytes': memory}
+
+    def summary(self) -> dict:
+        """Totals across all live players"""
+        usages = [self.usage(player) for player in self.cog.players.values()]
+        return {
+            'players': len(usages),
+            'tasks': sum(usage['tasks'] for usage in usages),
+            'memory_bytes': sum(usage['memory_bytes'] for usage in usages),
+            'evicted': self.evicted,
+            'restored': self.restored
+        }
+
+    async def sweep(self):
+        """Evict players that have been paused or idle for too long"""
+        now = time.monotonic()
+        for player in list(self.cog.players.values()):
+            vc = player.guild.voice_client
+            if vc and vc.is_playing():
+                player.idle_since = None
+                continue
+            if player.idle_since is None:
+                player.idle_since = now
+                continue
+            
+            limit = PAUSED_EVICT_AFTER if vc and vc.is_paused() else IDLE_EVICT_AFTER
+            if now - player.idle_since >= limit:
+                await self.evict(player)
+        logger.debug(f"Player resources: {self.summary()}")
+
+    async def evict(self, player):
+        """Snapshot a player to Redis and release it"""
+        guild = player.guild
+        try:
+            await db.set_player_snapshot(str(guild.id), player.snapshot(), ex=SNAPSHOT_TTL)
+        except Exception as e:
+            logger.error(f"Error saving player snapshot, keeping player: {str(e)}", exc_info=True)
+            return
+        await self.cog.cleanup(guild, reason="Parked while idle - !play or !resume picks up where it left off")
+        try:
+            # The snapshot holds the queue now, a new player must not load it from Redis as well
+            await db.clear_music_queue(str(guild.id))
+        except Exception as e:
+            logger.error(f"Error clearing queue of evicted player: {str(e)}", exc_info=True)
+        self.evicted += 1
+        logger.info(f"Evicted idle player for guild: {guild.id}")
+
+    async def take_snapshot(self, guild_id):
+        """Remove and return the snapshot of an evicted player, if there is one"""
+        try:
+            snapshot = await db.get_player_snapshot(str(guild_id))
+            if snapshot:
+                await db.delete_player_snapshot(str(guild_id))
+        except Exception as e:
+            logger.error(f"Error reading player snapshot: {str(e)}", exc_info=True)
+            return None
+        return snapshot
+
+    async def restore(self, ctx) -> bool:
+        """Recreate an evicted player for the guild of ctx, if it has a snapshot"""
+        snapshot = await db.get_player_snapshot(str(ctx.guild.id))
+        if not snapshot:
+            return False
+        
+        channel = ctx.author.voice.channel if getattr(ctx.author, 'voice', None) else None
+        channel = channel or ctx.guild.get_channel(snapshot.get('voice_channel_id') or 0)
+        if not channel:
+            logger.info(f"No voice channel to restore player into for guild: {ctx.guild.id}")
+            return False
+        if not ctx.voice_client:
+            await channel.connect()
+        # Only drop the snapshot once the player has somewhere to play again
+        await db.delete_player_snapshot(str(ctx.guild.id))
+        
+        player = MusicPlayer(ctx, snapshot=snapshot)
+        self.cog.players[ctx.guild.id] = player
+        self.restored += 1
+        
+        if snapshot.get('current'):
+            # Let the command see the restored track instead of an empty player
+            try:
+                await asyncio.wait_for(player.playing.wait(), timeout=RESTORE_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Restored track did not start in time for guild: {ctx.guild.id}")
+        return True
+
+
 class Music(commands.Cog):
     """Music related commands."""
 
-    __slots__ = ('bot', 'players')
+    __slots__ = ('bot', 'players', 'related_cache', 'history', 'resolved', 'resources', 'panel_budget')
 
     def __init__(self, bot):
         self.bot = bot
         self.players = {}
+        self.related_cache = RelatedTrackCache()
+        self.history = ListeningHistory()
+        self.resolved = OrderedDict()  # normalized query -> (expires_at, source)
+        self.resources = PlayerResourceManager(self)
+        self.panel_budget = EditBudget()
         logger.info("Initializing Music cog and setting up yt-dlp")
         try:
             self.ytdl = yt_dlp.YoutubeDL(YTDL_OPTIONS)
@@ -351,37 +1098,193 @@ class Music(commands.Cog):
             logger.info("Music cog initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing yt-dlp: {str(e)}", exc_info=True)
+        
+        self.flush_history_task.start()
+        self.evict_idle_players_task.start()
+        self.refresh_panels_task.start()
+        registry.register_collector(self.collect_metrics)
 
-    async def cleanup(self, guild):
+    def cog_unload(self):
+        """Stop background tasks and write out buffered history"""
+        self.flush_history_task.cancel()
+        self.evict_idle_players_task.cancel()
+        self.refresh_panels_task.cancel()
+        registry.unregister_collector(self.collect_metrics)
+        self.bot.loop.create_task(self.history.flush())
+
+    def collect_metrics(self):
+        """Gauges for /metrics, read from memory only"""
+        queue_sizes = [player.queue.qsize() for player in self.players.values()]
+        ffmpeg_processes = 0
+        for vc in self.bot.voice_clients:
+            source = getattr(vc, 'source', None)
+            # YTDLSource wraps the FFmpeg audio source
+            source = getattr(source, 'original', source)
+            process = getattr(source, '_process', None)
+            if process is not None and process.poll() is None:
+                ffmpeg_processes += 1
+        return [
+            ("bot_music_players", "Guild music players in memory", [({}, len(self.players))]),
+            ("bot_music_queued_songs", "Songs waiting in all guild queues", [({}, sum(queue_sizes))]),
+            ("bot_music_longest_queue", "Songs waiting in the longest guild queue", [({}, max(queue_sizes, default=0))]),
+            ("bot_music_ffmpeg_processes", "Running FFmpeg processes", [({}, ffmpeg_processes)]),
+            ("bot_music_resolve_cache_entries", "Entries in the resolved track cache", [({}, len(self.resolved))]),
+        ]
+
+    async def cog_before_invoke(self, ctx):
+        """Lazily restore a player that was evicted while idle"""
+        if not ctx.guild or ctx.guild.id in self.players:
+            return
+        if ctx.command.name in ('stop', 'leave'):
+            # The queue is being thrown away, so is the snapshot
+            await db.delete_player_snapshot(str(ctx.guild.id))
+            return
+        if ctx.command.qualified_name not in RESTORE_COMMANDS:
+            return
+        try:
+            await self.resources.restore(ctx)
+        except Exception as e:
+            logger.error(f"Error restoring player: {str(e)}", exc_info=True)
+
+    @tasks.loop(seconds=EVICTION_SWEEP_INTERVAL)
+    async def evict_idle_players_task(self):
+        """Periodically evict idle and paused players"""
+        try:
+            await self.resources.sweep()
+        except Exception as e:
+            logger.error(f"Error evicting idle players: {str(e)}", exc_info=True)
+
+    @evict_idle_players_task.before_loop
+    async def before_evict_idle_players(self):
+        """Wait for bot to be ready before starting task"""
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=PANEL_TICK_INTERVAL)
+    async def refresh_panels_task(self):
+        """Refresh stale now-playing panels within the global edit budget"""
+        now = time.monotonic()
+        changed, progressed = [], []
+        for player in list(self.players.values()):
+            try:
+                if not player.panel_message:
+                    continue
+                if player.panel_state != player.panel_state_key():
+                    changed.append(player)
+                elif now - player.panel_updated_at >= PANEL_PROGRESS_INTERVAL:
+                    vc = player.guild.voice_client
+                    if player.current and vc and vc.is_playing():
+                        progressed.append(player)
+            except Exception as e:
+                logger.error(f"Error checking now playing panel for guild: {player.guild.id}: {str(e)}", exc_info=True)
+
+        # State changes first, then the panels that have waited longest for a progress edit
+        progressed.sort(key=lambda player: player.panel_updated_at)
+        due = []
+        for player in changed + progressed:
+            if not self.panel_budget.take():
+                break
+            due.append(player)
+
+        # One broken panel must not end the loop for every other guild
+        results = await asyncio.gather(*(player.update_panel() for player in due), return_exceptions=True)
+        for player, result in zip(due, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error refreshing now playing panel for guild: {player.guild.id}: {str(result)}", exc_info=result)
+        deferred = len(changed) + len(progressed) - len(due)
+        if deferred:
+            logger.debug(f"Panel edit budget exhausted, deferred {deferred} panel updates")
+
+    @refresh_panels_task.before_loop
+    async def before_refresh_panels(self):
+        """Wait for bot to be ready before starting task"""
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=HISTORY_FLUSH_INTERVAL)
+    async def flush_history_task(self):
+        """Periodically write the buffered listening history"""
+        await self.history.flush()
+
+    @flush_history_task.before_loop
+    async def before_flush_history(self):
+        """Wait for bot to be ready before starting task"""
+        await self.bot.wait_until_ready()
+
+    async def resolve_track(self, search: str, requester=None):
+        """Resolve a query to a queueable source, reusing recent resolutions."""
+        key = resolve_cache_key(search)
+        cached = self.resolved.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.resolved.move_to_end(key)
+            logger.debug(f"Resolve cache hit for: {search}")
+            CACHE_REQUESTS.inc(cache="resolve", result="hit")
+            return dict(cached[1], requester=requester)
+        
+        CACHE_REQUESTS.inc(cache="resolve", result="miss")
+        source = await YTDLSource.create_source(search, loop=self.bot.loop, requester=requester)
+        entry = (time.monotonic() + RESOLVE_CACHE_TTL, dict(source, requester=None))
+        for alias in {key, source.get('webpage_url') or ''} - {''}:
+            self.resolved[alias] = entry
+            self.resolved.move_to_end(alias)
+        while len(self.resolved) > RESOLVE_CACHE_SIZE:
+            self.resolved.popitem(last=False)
+        return source
+
+    async def prefetch_popular_tracks(self, guild_id: int):
+        """Resolve a guild's most played tracks of the week ahead of demand."""
+        try:
+            week = datetime.now(UTC).strftime("%G-W%V")
+            top_tracks = await db.get_top_tracks(str(guild_id), week, limit=POPULAR_PREFETCH_COUNT)
+            for track in top_tracks:
+                query = track.get('url') or track.get('title')
+                if not query:
+                    continue
+                cached = self.resolved.get(resolve_cache_key(query))
+                if cached and cached[0] > time.monotonic():
+                    continue
+                await self.resolve_track(query)
+            logger.debug(f"Prefetched {len(top_tracks)} popular tracks for guild: {guild_id}")
+        except Exception as e:
+            logger.error(f"Error prefetching popular tracks: {str(e)}", exc_info=True)
+
+    async def cleanup(self, guild, *, reason="Stopped"):
         logger.info(f"Cleaning up player for guild: {guild.id}")
+        player = self.players.pop(guild.id, None)
+        if player:
+            # Stop the player loop first, disconnecting ends the track and would wake it
+            player.cancel_tasks()
+            if player.current:
+                await db.clear_current_track(str(guild.id))
+        
         try:
-            # Save current queue to Redis before disconnecting
-            if guild.id in self.players:
-                player = self.players[guild.id]
-                if player.current:
-                    await db.clear_current_track(str(guild.id))
-            
             await guild.voice_client.disconnect()
             logger.debug(f"Voice client disconnected for guild: {guild.id}")
         except AttributeError:
             logger.debug(f"No voice client to disconnect for guild: {guild.id}")
-            pass
         
-        try:  
-            del self.players[guild.id]
+        if player:
+            await player.close_panel(reason)
             logger.debug(f"Player deleted for guild: {guild.id}")
-        except KeyError:
+        else:
             logger.debug(f"No player to delete for guild: {guild.id}")
-            pass
 
-    def get_player(self, ctx):
-        """Retrieve the guild player, or generate one."""
-        try:
-            player = self.players[ctx.guild.id]
-        except KeyError:
-            player = MusicPlayer(ctx)
-            self.players[ctx.guild.id] = player
-        
+    async def get_player(self, ctx):
+        """Retrieve the guild player, or generate one.
+        A new player takes over the snapshot of an evicted one, so its queue isn't left behind.
+        """
+        player = self.players.get(ctx.guild.id)
+        if player is not None:
+            return player
+        
+        snapshot = await self.resources.take_snapshot(ctx.guild.id)
+        player = self.players.get(ctx.guild.id)
+        if player is not None:
+            # Another command created the player in the meantime
+            return player
+        player = MusicPlayer(ctx, snapshot=snapshot)
+        self.players[ctx.guild.id] = player
+        if snapshot:
+            self.resources.restored += 1
+        self.bot.loop.create_task(self.prefetch_popular_tracks(ctx.guild.id))
         return player
 
     @commands.command(name='join', aliases=['connect'])
@@ -453,9 +1356,11 @@ class Music(commands.Cog):
         Searches for and plays the requested song from YouTube.
         If a song is already playing, the requested song will be added to the queue.
         The bot will automatically join your voice channel if it isn't already connected.
+        Several songs can be queued at once by separating them with | or new lines.
         
         Usage:
         !play <search terms or URL>
+        !play <song> | <song> | ...
         
         Parameters:
         - search: The song to play (YouTube URL or search terms)
@@ -463,6 +1368,7 @@ class Music(commands.Cog):
         Examples:
         !play https://www.youtube.com/watch?v=dQw4w9WgXcQ
         !play never gonna give you up
+        !play never gonna give you up | take on me | africa toto
         """
         logger.info(f"Play command invoked by {ctx.author} with search: {search}")
         async with ctx.channel.typing():
@@ -480,11 +1386,15 @@ class Music(commands.Cog):
             # Log voice client status
             logger.debug(f"Voice client status - Connected: {vc.is_connected()}, Playing: {vc.is_playing() if vc else False}")
             
-            player = self.get_player(ctx)
+            player = await self.get_player(ctx)
+            
+            queries = [query.strip() for query in re.split(r'[|\n]', search) if query.strip()]
+            if len(queries) > 1:
+                return await self._play_batch(ctx, player, queries)
 
             try:
                 logger.info(f"Attempting to create source for: {search}")
-                source = await YTDLSource.create_source(search, loop=self.bot.loop, requester=ctx.author)
+                source = await self.resolve_track(search, requester=ctx.author)
                 logger.debug(f"Source created successfully: {source['title']}")
             except Exception as e:
                 logger.error(f"Error creating source: {str(e)}", exc_info=True)
@@ -498,6 +1408,50 @@ class Music(commands.Cog):
                 await ctx.send(f'**{source["title"]}** has been added to the queue.')
                 logger.debug(f"Queue size after adding song: {player.queue.qsize()}")
 
+    async def _play_batch(self, ctx, player, queries):
+        """Resolve several queries concurrently and queue them in the order given.
+        
+        Each song is queued as soon as it and every song before it have resolved,
+        so playback can start while the rest of the batch is still extracting.
+        """
+        skipped = queries[PLAY_BATCH_LIMIT:]
+        queries = queries[:PLAY_BATCH_LIMIT]
+        logger.info(f"Resolving {len(queries)} queries for guild: {ctx.guild.id}")
+        semaphore = asyncio.Semaphore(PLAY_BATCH_CONCURRENCY)
+        
+        async def resolve(query):
+            async with semaphore:
+                return await self.resolve_track(query, requester=ctx.author)
+        
+        pending = [asyncio.create_task(resolve(query)) for query in queries]
+        added = []
+        failed = []
+        try:
+            for query, task in zip(queries, pending):
+                try:
+                    source = await task
+                except Exception as e:
+                    logger.error(f"Error creating source for {query}: {str(e)}")
+                    failed.append(query)
+                    continue
+                await player.queue.put(source)
+                await player._save_to_queue(source)
+                added.append(source['title'])
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        logger.debug(f"Queue size after batch: {player.queue.qsize()}")
+        lines = []
+        if added:
+            lines.append(f"Added **{len(added)}** songs to the queue:")
+            lines.extend(f"`{i}.` {title}" for i, title in enumerate(added[:PLAY_BATCH_LIMIT], start=1))
+        if failed:
+            lines.append("Could not find: " + ", ".join(f"`{query[:50]}`" for query in failed))
+        if skipped:
+            lines.append(f"Skipped {len(skipped)} songs, only {PLAY_BATCH_LIMIT} can be queued at once.")
+        await ctx.send("\n".join(lines)[:2000])
+
     @commands.command(name='pause')
     async def pause_(self, ctx):
         """Pause the currently playing song.
@@ -559,6 +1513,97 @@ class Music(commands.Cog):
         vc.stop()
         await ctx.send(f'**{ctx.author}**: Skipped the song!')
 
+    async def _seek_to(self, ctx, position):
+        """Seek the current song of this guild, validating the position"""
+        vc = ctx.voice_client
+        
+        if not vc or not vc.is_connected():
+            return await ctx.send('I am not currently playing anything!')
+        
+        player = await self.get_player(ctx)
+        if not player.current or not (vc.is_playing() or vc.is_paused()):
+            return await ctx.send('I am not currently playing anything!')
+        
+        position = max(0, position)
+        if player.current.duration and position >= player.current.duration:
+            return await ctx.send(f'This song is only {player.parse_duration(player.current.duration)} long.')
+        
+        try:
+            player.seek(position)
+        except Exception as e:
+            logger.error(f"Error seeking: {str(e)}", exc_info=True)
+            return await ctx.send(f'An error occurred while seeking: {str(e)}')
+        
+        await ctx.send(f'**{ctx.author}**: Jumped to **{player.parse_duration(int(position))}**')
+
+    @commands.command(name='seek')
+    async def seek_(self, ctx, *, position: str):
+        """Jump to a position in the current song.
+        
+        Restarts the current song at the given position without searching it again.
+        
+        Usage:
+        !seek <position>
+        
+        Parameters:
+        - position: Seconds, mm:ss or hh:mm:ss
+        
+        Examples:
+        !seek 90
+        !seek 1:30
+        """
+        seconds = MusicPlayer.parse_timestamp(position)
+        if seconds is None:
+            return await ctx.send('Invalid position. Please use seconds, mm:ss or hh:mm:ss.')
+        
+        await self._seek_to(ctx, seconds)
+
+    @commands.command(name='forward', aliases=['ff'])
+    async def forward_(self, ctx, seconds: int = 10):
+        """Fast-forward the current song.
+        
+        Usage:
+        !forward [seconds]
+        
+        Parameters:
+        - seconds: How far to skip ahead (optional, defaults to 10)
+        
+        Examples:
+        !forward
+        !forward 30
+        
+        Aliases:
+        !ff
+        """
+        player = self.players.get(ctx.guild.id)
+        if not player or not player.current:
+            return await ctx.send('I am not currently playing anything!')
+        
+        await self._seek_to(ctx, player.current.position + seconds)
+
+    @commands.command(name='rewind', aliases=['rw'])
+    async def rewind_(self, ctx, seconds: int = 10):
+        """Rewind the current song.
+        
+        Usage:
+        !rewind [seconds]
+        
+        Parameters:
+        - seconds: How far to go back (optional, defaults to 10)
+        
+        Examples:
+        !rewind
+        !rewind 30
+        
+        Aliases:
+        !rw
+        """
+        player = self.players.get(ctx.guild.id)
+        if not player or not player.current:
+            return await ctx.send('I am not currently playing anything!')
+        
+        await self._seek_to(ctx, player.current.position - seconds)
+
     @commands.command(name='queue', aliases=['q'])
     async def queue_info(self, ctx):
         """Display the current music queue.
@@ -632,18 +1677,20 @@ class Music(commands.Cog):
         if not vc or not vc.is_connected():
             return await ctx.send('I am not currently connected to voice!')
         
-        player = self.get_player(ctx)
+        player = await self.get_player(ctx)
         if not player.current:
             return await ctx.send('I am not currently playing anything!')
         
-        embed = discord.Embed(title="Now playing", description=f"[{player.current.title}]({player.current.url})", color=discord.Color.green())
-        embed.set_thumbnail(url=player.current.thumbnail)
-        embed.add_field(name="Duration", value=player.parse_duration(player.current.duration))
-        embed.add_field(name="Requested by", value=player.current.requester.mention)
-        embed.add_field(name="Uploader", value=player.current.uploader)
-        embed.set_footer(text=f"Volume: {player.volume*100}%")
-        
-        await ctx.send(embed=embed)
+        # Move the panel down to this channel instead of adding another message
+        old_panel = player.panel_message
+        player.panel_message = None
+        player.channel = ctx.channel
+        if old_panel:
+            try:
+                await old_panel.delete()
+            except discord.HTTPException:
+                pass
+        await player.update_panel()
 
     @commands.command(name='volume', aliases=['vol'])
     async def change_volume(self, ctx, *, volume: float=None):
@@ -670,7 +1717,7 @@ class Music(commands.Cog):
         if not vc or not vc.is_connected():
             return await ctx.send('I am not currently connected to voice!')
         
-        player = self.get_player(ctx)
+        player = await self.get_player(ctx)
         
         # If no volume specified, display current volume
         if volume is None:
@@ -750,7 +1797,7 @@ class Music(commands.Cog):
         if not vc or not vc.is_connected():
             return await ctx.send('I am not currently connected to voice!')
         
-        player = self.get_player(ctx)
+        player = await self.get_player(ctx)
         
         # If no mode specified, display current mode
         if mode is None:
@@ -769,6 +1816,91 @@ class Music(commands.Cog):
         
         await ctx.send(f'**{ctx.author}**: Set repeat mode to **{mode}**')
     
+    @commands.command(name='topsongs', aliases=['top'])
+    async def top_songs_(self, ctx, period: str = 'week'):
+        """Display the most played songs in this server.
+        
+        Shows the songs played most often this week or of all time.
+        
+        Usage:
+        !topsongs [week/all]
+        
+        Parameters:
+        - period: week or all (optional, defaults to week)
+        
+        Examples:
+        !topsongs
+        !topsongs all
+        
+        Aliases:
+        !top
+        """
+        period = period.lower()
+        if period not in ['week', 'all']:
+            return await ctx.send('Invalid period. Please use: week or all.')
+        
+        key = datetime.now(UTC).strftime("%G-W%V") if period == 'week' else 'all'
+        top_tracks = await db.get_top_tracks(str(ctx.guild.id), key, limit=10)
+        
+        if not top_tracks:
+            return await ctx.send('No songs have been played yet.')
+        
+        track_list = []
+        for i, track in enumerate(top_tracks):
+            title = f"[{track['title']}]({track['url']})" if track.get('url') else track['title']
+            track_list.append(f"`{i+1}.` {title} - {track['plays']} plays")
+        
+        embed = discord.Embed(
+            title="Top Songs This Week" if period == 'week' else "Top Songs of All Time",
+            description="\n".join(track_list),
+            color=discord.Color.green()
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command(name='autoplay', aliases=['ap'])
+    async def autoplay_(self, ctx, mode: str = None):
+        """Toggle autoplay of related songs.
+        
+        When autoplay is on and the queue runs out, the bot keeps playing
+        songs related to the last one, skipping songs played recently.
+        Autoplay is only used while the repeat mode is off.
+        
+        Usage:
+        !autoplay [on/off]
+        
+        Parameters:
+        - mode: on or off (optional, toggles when omitted)
+        
+        Examples:
+        !autoplay - Toggle autoplay
+        !autoplay on - Turn on autoplay
+        
+        Aliases:
+        !ap
+        """
+        vc = ctx.voice_client
+        
+        if not vc or not vc.is_connected():
+            return await ctx.send('I am not currently connected to voice!')
+        
+        player = await self.get_player(ctx)
+        
+        if mode is None:
+            enabled = not player.auto_play
+        elif mode.lower() in ['on', 'off']:
+            enabled = mode.lower() == 'on'
+        else:
+            return await ctx.send('Invalid autoplay mode. Please use: on or off.')
+        
+        player.auto_play = enabled
+        if enabled:
+            # Resolve the candidate now so the current song hands over without a gap
+            player.schedule_autoplay()
+        
+        await db.update_music_settings(str(ctx.guild.id), {"auto_play": enabled})
+        
+        await ctx.send(f'**{ctx.author}**: Autoplay is now **{"on" if enabled else "off"}**')
+    
     # Playlist commands
     @commands.group(name='playlist', aliases=['pl'], invoke_without_command=True)
     async def playlist_(self, ctx):
@@ -925,7 +2057,7 @@ class Music(commands.Cog):
         # Search for the song
         async with ctx.channel.typing():
             try:
-                source = await YTDLSource.create_source(search, loop=self.bot.loop, requester=ctx.author)
+                source = await self.resolve_track(search, requester=ctx.author)
                 
                 # Add to playlist
                 track_data = {
@@ -1034,7 +2166,7 @@ class Music(commands.Cog):
                 return await ctx.send("Failed to connect to voice channel. Please try again.")
         
         # Get player
-        player = self.get_player(ctx)
+        player = await self.get_player(ctx)
         
         # Add tracks to queue
         added_count = 0
@@ -4,6 +4,7 @@ import re
 import json
 import asyncio
 from utils.database import db
+from utils.metrics import timed_listener
 
 class Polls(commands.Cog):
     def __init__(self, client):
@@ -387,6 +388,7 @@ class Polls(commands.Cog):
                 poll_data['votes'][poll_data['options'][option_idx]] += 1
     
     @commands.Cog.listener()
+    @timed_listener
     async def on_reaction_add(self, reaction, user):
         if user == self.client.user:
             return
@@ -449,6 +451,7 @@ class Polls(commands.Cog):
                 print(f"Error removing reactions: {e}")
     
     @commands.Cog.listener()
+    @timed_listener
     async def on_reaction_remove(self, reaction, user):
         if user == self.client.user:
             return
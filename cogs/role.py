@@ -2,6 +2,7 @@ import discord
 from discord.ext import commands
 from utils.database import db
 import json
+from utils.metrics import timed_listener
 
 class Role(commands.Cog):
     def __init__(self, client):
@@ -10,6 +11,7 @@ class Role(commands.Cog):
         self.client.loop.create_task(self.load_reaction_roles())
 
     @commands.Cog.listener()
+    @timed_listener
     async def on_raw_reaction_add(self, payload):
         for role_id, msg_id, emoji in self.reaction_roles:
             if msg_id == payload.message_id and emoji == str(payload.emoji.name.encode("utf-8")):
@@ -34,6 +36,7 @@ class Role(commands.Cog):
                 return
 
     @commands.Cog.listener()
+    @timed_listener
     async def on_raw_reaction_remove(self, payload):
         for role_id, msg_id, emoji in self.reaction_roles:
             if msg_id == payload.message_id and emoji == str(payload.emoji.name.encode("utf-8")):
@@ -2,97 +2,597 @@ import discord
 import asyncio
 import logging
 import datetime
+import io
 import json
+import multiprocessing
+import os
+import socket
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from discord.ext import commands, tasks
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
+from config.settings import (
+    STATS_COUNTER_BACKEND, STATS_REDIS_MERGE_INTERVAL, STATS_MINUTE_RETENTION_DAYS,
+    STATS_HOUR_RETENTION_DAYS, STATS_DAY_RETENTION_DAYS, STATS_WEEK_RETENTION_DAYS
+)
+from utils import charts
 from utils.database import db
+from utils.export import EXPORT_FORMATS, ExportWriter
+from utils.histogram import LogHistogram
+from utils.metrics import CACHE_REQUESTS, registry, timed_listener
+from utils.rate_window import CHANNEL_WINDOW_SECONDS, GUILD_WINDOW_SECONDS, GuildActivity
+from utils.topk import SpaceSaving
 
 logger = logging.getLogger('bot.statistics')
 
+MEMBER_COUNT_RETENTION_DAYS = 30
+AGGREGATOR_LOCK_KEY = "stats:aggregator_lock"
+AGGREGATOR_LOCK_TTL = 14 * 60  # Expires before the next 15 minute save so another process can take over
+SAVE_INTERVAL = 15 * 60  # Every guild with changes is saved once per interval
+SAVE_SLOTS = 30  # Guilds are spread over this many saves per interval
+SAVE_BATCH_SIZE = 100  # Guilds per bulk write
+SAVE_CONCURRENCY = 2  # Bulk writes in flight at once
+ACTIVE_USERS_RETENTION_DAYS = 31  # Daily HyperLogLogs kept, enough for a 30 day count
+CHART_WORKERS = 2
+CHART_FRESH_SECONDS = 60  # A cached chart is reused for this long even if its data changed
+CHART_CACHE_TTL = 15 * 60  # Unchanged data keeps its chart this long
+CHART_CACHE_SIZE = 256
+CHART_MAX_POINTS = 720  # Member history is thinned to this many points before rendering
+ROLLUP_METRICS = {
+    "messages.total": "messages",
+    "commands.total": "commands",
+    "voice.total_minutes": "voice_minutes"
+}
+ROLLUP_GRACE = datetime.timedelta(minutes=2)  # Late minute writes from other processes still land before a roll up
+TREND_BUCKETS = {"hour": 24, "day": 14, "week": 12}
+TOP_K_DEFAULT = 50  # Channels and commands tracked per guild
+TOP_K_MIN = 5
+TOP_K_MAX = 500
+VOICE_CHECKPOINT_INTERVAL = 60  # Seconds between crediting open voice sessions and saving them to Redis
+VOICE_CHECKPOINT_TTL = 60 * 60
+VOICE_MAX_DOWNTIME_CREDIT = 30 * 60  # Seconds credited for a restart when a member never left their channel
+VOICE_RECONCILE_ATTEMPTS = 4  # Checkpoint reads at startup, 1s apart and doubling, before the checkpoint loop starts without them
+LATENCY_RETENTION_DAYS = 30
+LATENCY_WINDOW_HOURS = 24  # Range shown by !stats latency
+LIVE_SPARKLINE_BUCKETS = 10  # Bars in the !stats live history line
+SPARKLINE_BARS = "▁▂▃▄▅▆▇█"
+# Sketch name -> (stats section, sketch field, unbounded dict it replaces)
+TOP_K_FIELDS = {
+    "channels": ("messages", "top_channels", "by_channel"),
+    "commands": ("commands", "top_commands", "by_name")
+}
+TOP_K_DELTA_PREFIX = "top_k:"  # Shared counters: "top_k:<sketch>:<key>" counts merged into the sketches by the aggregator
+
+SAVE_DURATION = registry.histogram(
+    "bot_stats_save_duration_seconds", "Time taken to write one slot of statistics changes to MongoDB"
+)
+
+
+def save_slot(guild_id: str) -> int:
+    """Save slot of a guild, from the timestamp bits of its id (the low bits are mostly zero)"""
+    return (int(guild_id) >> 22) % SAVE_SLOTS
+
+
+class GuildCounters:
+    """Message and command counts of one guild that haven't been folded into its stats yet.
+    Plain slots, fixed lists for the hour/day buckets and integer channel keys
+    keep counting a message down to a few increments with no string building.
+    """
+    __slots__ = ('messages', 'by_channel', 'by_hour', 'by_day', 'commands', 'by_command', 'active_users', 'activity')
+    
+    def __init__(self):
+        self.messages = 0
+        self.by_channel = {}
+        self.by_hour = [0] * 24
+        self.by_day = [0] * 7
+        self.commands = 0
+        self.by_command = {}
+        self.active_users = set()  # Authors not yet added to today's HyperLogLog
+        self.activity = GuildActivity()  # Per-second message rates, never drained
+    
+    def count_message(self, channel_id: int, author_id: int, clock, second: int):
+        """Count a message sent in a channel at the (hour, weekday) clock and monotonic second"""
+        self.messages += 1
+        self.activity.add(channel_id, second)
+        self.active_users.add(author_id)
+        by_channel = self.by_channel
+        by_channel[channel_id] = by_channel.get(channel_id, 0) + 1
+        self.by_hour[clock[0]] += 1
+        self.by_day[clock[1]] += 1
+    
+    def count_command(self, name: str):
+        """Count a command invocation"""
+        self.commands += 1
+        self.by_command[name] = self.by_command.get(name, 0) + 1
+    
+    def drain(self) -> Tuple[List[tuple], Dict[int, int], Dict[str, int]]:
+        """Return the counts as (stats path, amount) pairs plus the per-channel
+        and per-command counts, and reset them"""
+        changes = []
+        by_channel = self.by_channel
+        by_command = self.by_command
+        if self.messages:
+            changes.append(("messages.total", self.messages))
+            changes.extend((f"messages.by_hour.{hour}", count) for hour, count in enumerate(self.by_hour) if count)
+            changes.extend((f"messages.by_day.{day}", count) for day, count in enumerate(self.by_day) if count)
+            self.messages = 0
+            self.by_channel = {}
+            self.by_hour = [0] * 24
+            self.by_day = [0] * 7
+        if self.commands:
+            changes.append(("commands.total", self.commands))
+            self.commands = 0
+            self.by_command = {}
+        return changes, by_channel, by_command
+
+
+class VoiceSession:
+    __slots__ = ('channel_id', 'muted', 'started')
+    
+    def __init__(self, channel_id: int, muted: bool, started: float):
+        self.channel_id = channel_id
+        self.muted = muted
+        self.started = started  # time.monotonic() at the start of the current segment
+
+
+class VoiceSessions:
+    """Open voice sessions keyed by (guild_id, member_id).
+    A session is split into segments whenever the member moves channel or
+    mutes/deafens, so each segment is credited to one channel and state.
+    """
+    
+    def __init__(self):
+        self.sessions: Dict[Tuple[int, int], VoiceSession] = {}
+        self.checkpointed_guilds = set()
+    
+    @staticmethod
+    def is_muted(state) -> bool:
+        return bool(state.self_mute or state.mute or state.self_deaf or state.deaf)
+    
+    def open(self, guild_id: int, member_id: int, channel_id: int, muted: bool, started: float):
+        self.sessions[(guild_id, member_id)] = VoiceSession(channel_id, muted, started)
+    
+    def close(self, guild_id: int, member_id: int, now: float) -> Optional[Tuple[int, bool, float]]:
+        """End a session, returning its (channel_id, muted, minutes)"""
+        session = self.sessions.pop((guild_id, member_id), None)
+        if session is None:
+            return None
+        return session.channel_id, session.muted, (now - session.started) / 60
+    
+    def split_all(self, now: float) -> List[Tuple[int, int, bool, float]]:
+        """End the current segment of every session, returning (guild_id, channel_id, muted, minutes)"""
+        segments = []
+        for (guild_id, _), session in self.sessions.items():
+            segments.append((guild_id, session.channel_id, session.muted, (now - session.started) / 60))
+            session.started = now
+        return segments
+    
+    def checkpoint(self, wall: float) -> Dict[str, Dict[str, str]]:
+        """Open sessions per guild as "channel_id:muted:since" strings, right after split_all"""
+        guilds = {}
+        for (guild_id, member_id), session in self.sessions.items():
+            guilds.setdefault(str(guild_id), {})[str(member_id)] = f"{session.channel_id}:{int(session.muted)}:{wall:.0f}"
+        return guilds
+
+
+class StatsRollup:
+    """Activity totals kept in minute buckets and rolled up into hours, days and weeks.
+    Minute buckets are written with $inc as counters are folded. Each roll up
+    step then rebuilds the closed buckets of the next tier from the one below,
+    a bounded range at a time, and every tier expires on its own retention.
+    """
+    SOURCES = {"hour": "minute", "day": "hour", "week": "day"}
+    MAX_SPAN = {
+        "hour": datetime.timedelta(hours=3),
+        "day": datetime.timedelta(days=14),
+        "week": datetime.timedelta(weeks=8)
+    }
+    
+    def __init__(self, retention_days: Dict[str, int]):
+        self.retention_days = retention_days  # tier -> days, 0 keeps it forever
+        self.minute_totals = {}  # guild_id -> {metric: amount} not yet written
+        self.watermarks = {}  # tier -> rolled up until
+        self.indexes_ready = False
+        self.lock = asyncio.Lock()
+    
+    def add(self, guild_id: str, metric: str, amount: Union[int, float]):
+        """Count activity towards the current minute"""
+        totals = self.minute_totals.setdefault(guild_id, {})
+        totals[metric] = totals.get(metric, 0) + amount
+    
+    @staticmethod
+    def floor(moment: datetime.datetime, tier: str) -> datetime.datetime:
+        """Start of the bucket of a tier containing a moment (weeks start on Monday)"""
+        if tier == "minute":
+            return moment.replace(second=0, microsecond=0)
+        if tier == "hour":
+            return moment.replace(minute=0, second=0, microsecond=0)
+        day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        if tier == "day":
+            return day
+        return day - datetime.timedelta(days=day.weekday())
+    
+    def expires_at(self, tier: str, bucket: datetime.datetime) -> Optional[datetime.datetime]:
+        days = self.retention_days[tier]
+        return bucket + datetime.timedelta(days=days) if days else None
+    
+    async def flush(self):
+        """Write the totals counted since the last flush into the current minute bucket"""
+        if not self.minute_totals:
+            return
+        totals, self.minute_totals = self.minute_totals, {}
+        bucket = self.floor(datetime.datetime.utcnow(), "minute")
+        try:
+            if not self.indexes_ready:
+                await db.ensure_stats_rollup_indexes()
+                self.indexes_ready = True
+            await db.increment_stats_rollups("minute", bucket, totals, self.expires_at("minute", bucket))
+        except Exception as e:
+            logger.error(f"Error writing minute stats: {str(e)}", exc_info=True)
+            for guild_id, metrics in totals.items():
+                for metric, amount in metrics.items():
+                    self.add(guild_id, metric, amount)
+    
+    async def roll_up(self):
+        """Roll closed minutes into hours, hours into days and days into weeks"""
+        async with self.lock:
+            now = datetime.datetime.utcnow() - ROLLUP_GRACE
+            for tier in ("hour", "day", "week"):
+                await self.roll_up_tier(tier, now)
+    
+    async def roll_up_tier(self, tier: str, now: datetime.datetime):
+        source = self.SOURCES[tier]
+        start = self.watermarks.get(tier)
+        if start is None:
+            start = await db.get_rollup_watermark(tier)
+        if start is None:
+            # First run, start from the oldest data the source tier can still hold
+            start = self.floor(now - datetime.timedelta(days=self.retention_days[source] or 365), tier)
+        
+        # Only buckets that are closed and fully rolled up in the source tier
+        source_done = now if source == "minute" else self.watermarks.get(source, start)
+        end = min(self.floor(now, tier), self.floor(source_done, tier), start + self.MAX_SPAN[tier])
+        if end <= start:
+            self.watermarks[tier] = start
+            return
+        
+        buckets = {}
+        for doc in await db.get_stats_rollups(source, start, end):
+            totals = buckets.setdefault((doc["guild_id"], self.floor(doc["bucket"], tier)), {})
+            for metric in ROLLUP_METRICS.values():
+                totals[metric] = totals.get(metric, 0) + doc.get(metric, 0)
+        
+        await db.set_stats_rollups(tier, buckets, self.expires_at)
+        await db.set_rollup_watermark(tier, end)
+        self.watermarks[tier] = end
+        logger.debug(f"Rolled up {len(buckets)} {tier} buckets until {end.isoformat()}")
+
+
 class Statistics(commands.Cog):
     """Track and display server statistics"""
     
     def __init__(self, bot):
         self.bot = bot
         self.stats_cache = {}
+        self.pending_updates = {}  # guild_id -> {"$inc": {...}, "$set": {...}} not yet flushed
+        self.counters: Dict[int, GuildCounters] = {}  # Keyed by the integer guild id
+        self.top_k: Dict[str, Dict[str, SpaceSaving]] = {}  # guild_id -> {"channels": ..., "commands": ...}
+        self.voice = VoiceSessions()
+        self.voice_resume = None  # (sessions opened at startup, wall time) until the checkpoints are read
+        self.latency: Dict[str, LogHistogram] = {}  # Command -> durations not yet saved
+        self.latency_indexes_ready = False
+        self.clock = (0, 0)  # Current UTC (hour, weekday)
+        self.clock_expires = 0.0
+        self.chart_pool = None  # Started on the first chart render
+        self.chart_cache = OrderedDict()  # (guild_id, chart) -> (data version, rendered_at, png)
+        self.rollup = StatsRollup({
+            "minute": STATS_MINUTE_RETENTION_DAYS,
+            "hour": STATS_HOUR_RETENTION_DAYS,
+            "day": STATS_DAY_RETENTION_DAYS,
+            "week": STATS_WEEK_RETENTION_DAYS
+        })
         self.update_interval = 5 * 60  # 5 minutes in seconds
+        self.member_counts_ready = False
+        # With shared counters every process merges into Redis and one of them saves to MongoDB
+        self.shared_counters = STATS_COUNTER_BACKEND == "redis"
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.preload_task = None
+        self.save_slot = 0  # Slot of guilds written by the next save
+        self.exports = set()  # Guilds with an export running
         
         # Start background tasks
         self.aggregate_stats_task.start()
         self.save_stats_task.start()
+        self.flush_active_users_task.start()
+        self.rollup_task.start()
+        self.voice_checkpoint_task.start()
+        if self.shared_counters:
+            self.merge_counters_task.change_interval(seconds=STATS_REDIS_MERGE_INTERVAL)
+            self.merge_counters_task.start()
+        registry.register_collector(self.collect_metrics)
+        # Bot-wide hooks around every command's callback, the after hook also runs when it fails
+        bot.before_invoke(self.start_command_timer)
+        bot.after_invoke(self.stop_command_timer)
+    
+    async def cog_load(self):
+        """Start loading the stats of all guilds"""
+        self.preload_task = asyncio.create_task(self.preload_guild_stats())
     
     def cog_unload(self):
         """Clean up when cog is unloaded"""
+        if self.preload_task:
+            self.preload_task.cancel()
         self.aggregate_stats_task.cancel()
         self.save_stats_task.cancel()
+        self.merge_counters_task.cancel()
+        self.flush_active_users_task.cancel()
+        self.rollup_task.cancel()
+        self.voice_checkpoint_task.cancel()
+        if self.chart_pool:
+            self.chart_pool.shutdown(wait=False, cancel_futures=True)
+        registry.unregister_collector(self.collect_metrics)
+        # discord.py has no public way to remove a bot-wide hook
+        if self.bot._before_invoke == self.start_command_timer:
+            self.bot._before_invoke = None
+        if self.bot._after_invoke == self.stop_command_timer:
+            self.bot._after_invoke = None
+    
+    def collect_metrics(self):
+        """Gauges for /metrics, read from memory only"""
+        return [
+            ("bot_stats_save_backlog_guilds", "Guilds with statistics changes not yet saved",
+             [({}, len(self.pending_updates))]),
+        ]
+    
+    async def ensure_member_counts(self):
+        """Create the member count time-series collection before the first write"""
+        if not self.member_counts_ready:
+            await db.ensure_member_counts_collection(MEMBER_COUNT_RETENTION_DAYS)
+            self.member_counts_ready = True
+    
+    def new_guild_stats(self, guild_id: str) -> Dict:
+        """Empty statistics document for a guild"""
+        return {
+            "guild_id": guild_id,
+            "member_count": {
+                "current": 0
+            },
+            "messages": {
+                "total": 0,
+                "by_hour": {str(i): 0 for i in range(24)},
+                "by_day": {str(i): 0 for i in range(7)}
+            },
+            "commands": {
+                "total": 0
+            },
+            "voice": {
+                "total_minutes": 0,
+                "by_channel": {}
+            },
+            "last_updated": datetime.datetime.utcnow().isoformat()
+        }
+    
+    async def cache_guild_stats(self, guild_id: str, stats: Dict):
+        """Migrate older document layouts and put a guild's stats in the cache"""
+        if "history" in stats.get("member_count", {}):
+            # Older documents embed the member count history, move it out
+            history = stats["member_count"].pop("history")
+            try:
+                await self.ensure_member_counts()
+                await db.migrate_member_count_history(guild_id, history)
+                logger.info(f"Migrated {len(history)} member count entries for guild {guild_id}")
+            except Exception as e:
+                logger.error(f"Error migrating member count history: {str(e)}", exc_info=True)
+        
+        await self.load_top_k(guild_id, stats)
+        
+        # Store in cache
+        self.stats_cache[guild_id] = stats
+    
+    async def preload_guild_stats(self):
+        """Load the stats of every guild in one streamed query and create the missing ones in one insert"""
+        await self.bot.wait_until_ready()
+        started = time.perf_counter()
+        guild_ids = [str(guild.id) for guild in self.bot.guilds if str(guild.id) not in self.stats_cache]
+        loaded = created = 0
+        try:
+            try:
+                await db.ensure_guild_stats_index()
+            except Exception as e:
+                # Existing duplicate documents prevent the unique index, the load still works
+                logger.warning(f"Could not create the unique guild_stats index: {str(e)}")
+            
+            async for stats in db.iter_guild_stats(guild_ids):
+                guild_id = stats["guild_id"]
+                if guild_id not in self.stats_cache:
+                    await self.cache_guild_stats(guild_id, stats)
+                    loaded += 1
+            
+            missing = [self.new_guild_stats(guild_id) for guild_id in guild_ids if guild_id not in self.stats_cache]
+            created = await db.create_guild_stats_many([dict(stats) for stats in missing])
+            for stats in missing:
+                await self.cache_guild_stats(stats["guild_id"], stats)
+        except Exception as e:
+            logger.error(f"Error preloading guild stats: {str(e)}", exc_info=True)
+        
+        logger.info(f"Preloaded stats of {loaded} guilds and created {created} new ones "
+                    f"in {(time.perf_counter() - started) * 1000:.0f}ms")
     
     async def initialize_guild_stats(self, guild_id: str):
         """Initialize statistics tracking for a guild"""
+        if guild_id in self.stats_cache:
+            return
+        if self.preload_task is not None and not self.preload_task.done():
+            # Guilds the bot was in at startup arrive with the preload
+            await asyncio.shield(self.preload_task)
+            if guild_id in self.stats_cache:
+                return
+        
+        # Guilds joined later are loaded on first use
+        stats = await db.get_guild_stats(guild_id)
+        if not stats:
+            stats = self.new_guild_stats(guild_id)
+            # Save initial stats, unless another process created them first
+            await db.create_guild_stats(guild_id, dict(stats))
         if guild_id not in self.stats_cache:
-            # Try to load from database first
-            stats = await db.get_guild_stats(guild_id)
-            
-            if not stats:
-                # Create new stats object if none exists
-                stats = {
-                    "guild_id": guild_id,
-                    "member_count": {
-                        "current": 0,
-                        "history": []
-                    },
-                    "messages": {
-                        "total": 0,
-                        "by_channel": {},
-                        "by_hour": {str(i): 0 for i in range(24)},
-                        "by_day": {str(i): 0 for i in range(7)}
-                    },
-                    "commands": {
-                        "total": 0,
-                        "by_name": {}
-                    },
-                    "voice": {
-                        "total_minutes": 0,
-                        "by_channel": {}
-                    },
-                    "last_updated": datetime.datetime.utcnow().isoformat()
-                }
-                
-                # Save initial stats
-                await db.save_guild_stats(guild_id, stats)
+            await self.cache_guild_stats(guild_id, stats)
+    
+    async def load_top_k(self, guild_id: str, stats: Dict):
+        """Restore the top channel and command sketches of a guild.
+        Older documents keep unbounded by_channel/by_name dicts, which are
+        folded into new sketches and removed from the document.
+        """
+        k = stats.get("top_k", TOP_K_DEFAULT)
+        sketches = {}
+        migrate = {"$set": {}, "$unset": {}}
+        for name, (section, field, old_field) in TOP_K_FIELDS.items():
+            section_stats = stats.setdefault(section, {})
+            saved = section_stats.pop(field, None)
+            sketch = SpaceSaving.from_dict(saved) if saved else SpaceSaving(k)
             
-            # Store in cache
-            self.stats_cache[guild_id] = stats
+            old_counts = section_stats.pop(old_field, None)
+            if old_counts is not None:
+                sketch.update({str(key): int(count) for key, count in old_counts.items()})
+                migrate["$set"][f"{section}.{field}"] = sketch.to_dict()
+                migrate["$unset"][f"{section}.{old_field}"] = ""
+            sketches[name] = sketch
+        self.top_k[guild_id] = sketches
+        
+        if migrate["$unset"]:
+            try:
+                await db.update_one("guild_stats", {"guild_id": guild_id}, migrate)
+                logger.info(f"Migrated channel and command counts to top-{k} sketches for guild {guild_id}")
+            except Exception as e:
+                logger.error(f"Error migrating top channels and commands: {str(e)}", exc_info=True)
+    
+    def count_top(self, guild_id: str, name: str, counts: Dict[str, int]):
+        """Add counts to one of a guild's top-k sketches and queue the sketch for saving.
+        With shared counters the counts themselves are queued instead, since every
+        process only holds its own part of the guild's sketch.
+        """
+        sketch = self.top_k[guild_id][name]
+        sketch.update(counts)
+        pending = self.pending_updates.setdefault(guild_id, {"$inc": {}, "$set": {}})
+        if self.shared_counters:
+            deltas = pending["$inc"]
+            for key, amount in counts.items():
+                path = f"{TOP_K_DELTA_PREFIX}{name}:{key}"
+                deltas[path] = deltas.get(path, 0) + amount
+            return
+        section, field, _ = TOP_K_FIELDS[name]
+        pending["$set"][f"{section}.{field}"] = sketch.to_dict()
+    
+    def increment(self, guild_id: str, path: str, amount: Union[int, float] = 1):
+        """Add to a counter in the cached stats and record the delta for the next save"""
+        node = self.stats_cache[guild_id]
+        *parents, leaf = path.split(".")
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = node.get(leaf, 0) + amount
+        
+        deltas = self.pending_updates.setdefault(guild_id, {"$inc": {}, "$set": {}})["$inc"]
+        deltas[path] = deltas.get(path, 0) + amount
+        
+        metric = ROLLUP_METRICS.get(path)
+        if metric:
+            self.rollup.add(guild_id, metric, amount)
+    
+    def set_value(self, guild_id: str, path: str, value):
+        """Set a field in the cached stats and record it for the next save"""
+        node = self.stats_cache[guild_id]
+        *parents, leaf = path.split(".")
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = value
+        
+        self.pending_updates.setdefault(guild_id, {"$inc": {}, "$set": {}})["$set"][path] = value
+    
+    def current_clock(self):
+        """Current UTC (hour, weekday), recomputed once per hour"""
+        now = time.time()
+        if now >= self.clock_expires:
+            utc = datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+            self.clock = (utc.hour, utc.weekday())
+            self.clock_expires = now - now % 3600 + 3600
+        return self.clock
+    
+    async def get_counters(self, guild_id: int) -> GuildCounters:
+        """Slow path for a guild's first message or command since startup"""
+        await self.initialize_guild_stats(str(guild_id))
+        return self.counters.setdefault(guild_id, GuildCounters())
+    
+    def message_rate(self, guild_id: int, seconds: int = 60, channel_id: Optional[int] = None) -> int:
+        """Messages sent in a guild, or one of its channels, in the last seconds.
+        Reads memory only, so other cogs can call it on every event.
+        """
+        counters = self.counters.get(guild_id)
+        if counters is None:
+            return 0
+        second = int(time.monotonic())
+        if channel_id is None:
+            return counters.activity.messages.total(second, seconds)
+        window = counters.activity.channels.get(channel_id)
+        return window.total(second, seconds) if window else 0
+    
+    def busiest_channels(self, guild_id: int, n: int = 5, seconds: int = 60) -> List[Tuple[int, int]]:
+        """The n channels of a guild with the most messages in the last seconds, as (channel id, messages)"""
+        counters = self.counters.get(guild_id)
+        if counters is None:
+            return []
+        return counters.activity.busiest_channels(int(time.monotonic()), n, seconds)
+    
+    def fold_counters(self, guild_id: Optional[str] = None):
+        """Move counted messages and commands into the cached stats and pending updates"""
+        guild_ids = [int(guild_id)] if guild_id else list(self.counters)
+        for key in guild_ids:
+            counters = self.counters.get(key)
+            if counters is None or str(key) not in self.stats_cache:
+                continue
+            changes, by_channel, by_command = counters.drain()
+            for path, amount in changes:
+                self.increment(str(key), path, amount)
+            if by_channel:
+                self.count_top(str(key), "channels", {str(channel_id): count for channel_id, count in by_channel.items()})
+            if by_command:
+                self.count_top(str(key), "commands", by_command)
+    
+    def requeue_updates(self, updates: Dict[str, Dict]):
+        """Merge updates that failed to save back into the pending ones"""
+        for guild_id, update in updates.items():
+            pending = self.pending_updates.setdefault(guild_id, {"$inc": {}, "$set": {}})
+            for path, amount in update["$inc"].items():
+                pending["$inc"][path] = pending["$inc"].get(path, 0) + amount
+            for path, value in update["$set"].items():
+                # Newer values win
+                pending["$set"].setdefault(path, value)
     
     @tasks.loop(minutes=5.0)
     async def aggregate_stats_task(self):
         """Periodically aggregate statistics"""
         try:
             logger.info("Running stats aggregation task")
+            samples = []
             for guild in self.bot.guilds:
                 guild_id = str(guild.id)
                 
                 # Initialize stats for this guild if needed
                 await self.initialize_guild_stats(guild_id)
                 
-                # Update member count history
+                # Update member count, an unchanged guild isn't queued for saving
                 current_count = guild.member_count
-                timestamp = datetime.datetime.utcnow().isoformat()
-                
-                # Update member count
-                self.stats_cache[guild_id]["member_count"]["current"] = current_count
-                
-                # Add to history (keep last 30 days of hourly data)
-                history = self.stats_cache[guild_id]["member_count"]["history"]
-                history.append({"count": current_count, "timestamp": timestamp})
-                
-                # Limit history size (24 * 30 = 720 entries for hourly data over 30 days)
-                if len(history) > 720:
-                    self.stats_cache[guild_id]["member_count"]["history"] = history[-720:]
+                now = datetime.datetime.utcnow()
+                if self.stats_cache[guild_id].get("member_count", {}).get("current") != current_count:
+                    self.set_value(guild_id, "member_count.current", current_count)
+                    self.set_value(guild_id, "last_updated", now.isoformat())
+                    logger.debug(f"Updated member count for guild {guild_id}")
                 
-                # Update last_updated timestamp
-                self.stats_cache[guild_id]["last_updated"] = timestamp
-                
-                logger.debug(f"Updated stats for guild {guild_id}")
+                # Add to history, old samples expire from the collection after 30 days
+                samples.append({"guild_id": guild_id, "count": current_count, "timestamp": now})
+            
+            if samples:
+                await self.ensure_member_counts()
+                await db.add_member_counts(samples)
         except Exception as e:
             logger.error(f"Error in stats aggregation task: {str(e)}", exc_info=True)
     
@@ -101,16 +601,365 @@ class Statistics(commands.Cog):
         """Wait for bot to be ready before starting task"""
         await self.bot.wait_until_ready()
     
-    @tasks.loop(minutes=15.0)
+    @tasks.loop(seconds=SAVE_INTERVAL / SAVE_SLOTS)
     async def save_stats_task(self):
-        """Periodically save statistics to database"""
+        """Save the changed guilds of one time slot, so a full interval spreads the writes out"""
+        self.fold_counters()
+        second = int(time.monotonic())
+        for counters in self.counters.values():
+            counters.activity.prune(second)
+        slot = self.save_slot
+        self.save_slot = (slot + 1) % SAVE_SLOTS
+        if self.shared_counters:
+            # The aggregator saves everything merged into Redis once per interval
+            if slot == 0:
+                await self.merge_counters()
+                await self.save_shared_counters()
+            return
+        
+        # Only guilds that changed are written, as $inc deltas
+        updates = {guild_id: self.pending_updates.pop(guild_id)
+                   for guild_id in [guild_id for guild_id in self.pending_updates if save_slot(guild_id) == slot]}
+        failed = await self.write_updates(updates)
+        self.requeue_updates(failed)
+    
+    async def write_updates(self, updates: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Write stats changes in bulk writes of a few guilds each, a bounded number at a time.
+        Returns the updates that failed to save.
+        """
+        if not updates:
+            return {}
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(SAVE_CONCURRENCY)
+        failed = {}
+        
+        async def write(batch):
+            async with semaphore:
+                try:
+                    await db.update_guild_stats_bulk(batch)
+                except Exception as e:
+                    logger.error(f"Error saving stats of {len(batch)} guilds: {str(e)}", exc_info=True)
+                    failed.update(batch)
+        
+        guild_ids = list(updates)
+        await asyncio.gather(*(
+            write({guild_id: updates[guild_id] for guild_id in guild_ids[i:i + SAVE_BATCH_SIZE]})
+            for i in range(0, len(guild_ids), SAVE_BATCH_SIZE)
+        ))
+        
+        elapsed = time.perf_counter() - started
+        SAVE_DURATION.observe(elapsed)
+        logger.debug(f"Saved stats changes for {len(updates) - len(failed)} guilds in {elapsed * 1000:.0f}ms, "
+                     f"{len(self.pending_updates) + len(failed)} guilds waiting")
+        return failed
+    
+    async def merge_counters(self):
+        """Merge this process's counter deltas into the shared Redis counters"""
+        self.fold_counters()
+        updates, self.pending_updates = self.pending_updates, {}
+        if not updates:
+            return
+        try:
+            await db.push_shared_stats(updates)
+            logger.debug(f"Merged stats changes for {len(updates)} guilds into Redis")
+        except Exception as e:
+            logger.error(f"Error merging stats into Redis: {str(e)}", exc_info=True)
+            self.requeue_updates(updates)
+    
+    async def save_shared_counters(self):
+        """Write the shared Redis counters to MongoDB if this process is the aggregator"""
+        try:
+            if not await db.redis_set(AGGREGATOR_LOCK_KEY, self.process_id, ex=AGGREGATOR_LOCK_TTL, nx=True):
+                logger.debug("Another process is aggregating stats, skipping save")
+                return
+            updates = await db.pop_shared_stats()
+        except Exception as e:
+            logger.error(f"Error reading shared stats from Redis: {str(e)}", exc_info=True)
+            return
+        
+        try:
+            writes = await self.merge_top_k(updates)
+        except Exception as e:
+            # The counters are out of Redis now, they are lost unless they go back
+            logger.error(f"Error reading saved top channels and commands: {str(e)}", exc_info=True)
+            await self.return_shared_stats(updates)
+            return
+        
+        failed = await self.write_updates(writes)
+        if failed:
+            # Put the original deltas back for the next aggregator run, not the merged sketches
+            await self.return_shared_stats({guild_id: updates[guild_id] for guild_id in failed})
+    
+    async def return_shared_stats(self, updates: Dict[str, Dict]):
+        """Push deltas taken out of Redis back for the next aggregator run"""
+        try:
+            await db.push_shared_stats(updates)
+        except Exception as e:
+            logger.error(f"Error returning stats to Redis, {len(updates)} guilds lost: {str(e)}", exc_info=True)
+    
+    async def merge_top_k(self, updates: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Turn the top channel and command counts sent by all processes into $set updates of
+        the saved sketches, so the aggregator is the only writer of the sketches"""
+        guild_ids = [guild_id for guild_id, update in updates.items()
+                     if "top_k" in update["$set"] or any(path.startswith(TOP_K_DELTA_PREFIX) for path in update["$inc"])]
+        if not guild_ids:
+            return updates
+        saved = await db.get_top_k_sketches(guild_ids)
+        
+        merged = dict(updates)
+        for guild_id in guild_ids:
+            update = updates[guild_id]
+            increments = {}
+            counts = {name: {} for name in TOP_K_FIELDS}
+            for path, amount in update["$inc"].items():
+                if path.startswith(TOP_K_DELTA_PREFIX):
+                    name, key = path[len(TOP_K_DELTA_PREFIX):].split(":", 1)
+                    counts[name][key] = amount
+                else:
+                    increments[path] = amount
+            
+            values = dict(update["$set"])
+            stats = saved.get(guild_id, {})
+            k = values.get("top_k", stats.get("top_k", TOP_K_DEFAULT))
+            for name, (section, field, _) in TOP_K_FIELDS.items():
+                sketch_data = stats.get(section, {}).get(field)
+                sketch = SpaceSaving.from_dict(sketch_data) if sketch_data else SpaceSaving(k)
+                if sketch.k != k:
+                    sketch.resize(k)
+                sketch.update(counts[name])
+                values[f"{section}.{field}"] = sketch.to_dict()
+            merged[guild_id] = {"$inc": increments, "$set": values}
+        return merged
+    
+    async def flush_active_users(self):
+        """Add the authors seen since the last flush to today's HyperLogLog of each guild"""
+        users = {}
+        for guild_id, counters in self.counters.items():
+            if counters.active_users:
+                users[str(guild_id)], counters.active_users = counters.active_users, set()
+        if not users:
+            return
+        
+        day = datetime.datetime.utcnow().strftime("%Y-%m-%d")
+        try:
+            await db.add_active_users(day, users, ex=ACTIVE_USERS_RETENTION_DAYS * 86400)
+            logger.debug(f"Added active users for {len(users)} guilds")
+        except Exception as e:
+            logger.error(f"Error adding active users: {str(e)}", exc_info=True)
+            for guild_id, user_ids in users.items():
+                counters = self.counters.get(int(guild_id))
+                if counters is not None:
+                    counters.active_users |= user_ids
+    
+    async def count_active_users(self, guild_id: str) -> Dict[str, int]:
+        """Approximate distinct active users today and over the last 7 and 30 days"""
+        today = datetime.datetime.utcnow()
+        days = [(today - datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(30)]
+        return {
+            "today": await db.count_active_users(guild_id, days[:1]),
+            "week": await db.count_active_users(guild_id, days[:7]),
+            "month": await db.count_active_users(guild_id, days)
+        }
+    
+    async def render_chart(self, guild_id: str, name: str, version, render, data) -> Optional[discord.File]:
+        """Render a chart in the process pool, reusing the cached PNG while its data is unchanged.
+        
+        data is the argument passed to the render function, or an async callable
+        that fetches it, which is only called when the chart has to be rendered.
+        """
+        key = (guild_id, name)
+        cached = self.chart_cache.get(key)
+        now = time.monotonic()
+        if cached and now - cached[1] < CHART_CACHE_TTL and (cached[0] == version or now - cached[1] < CHART_FRESH_SECONDS):
+            self.chart_cache.move_to_end(key)
+            logger.debug(f"Chart cache hit for {name} in guild {guild_id}")
+            CACHE_REQUESTS.inc(cache="chart", result="hit")
+            return discord.File(io.BytesIO(cached[2]), filename=f"{name}.png")
+        
+        CACHE_REQUESTS.inc(cache="chart", result="miss")
+        try:
+            if callable(data):
+                data = await data()
+            if self.chart_pool is None:
+                # Spawned workers don't inherit the bot's sockets and threads
+                self.chart_pool = ProcessPoolExecutor(max_workers=CHART_WORKERS,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+            started = time.perf_counter()
+            png = await self.bot.loop.run_in_executor(self.chart_pool, render, data)
+            logger.info(f"Rendered {name} chart for guild {guild_id} in {(time.perf_counter() - started) * 1000:.0f}ms")
+        except Exception as e:
+            logger.error(f"Error rendering {name} chart: {str(e)}", exc_info=True)
+            return None
+        
+        self.chart_cache[key] = (version, time.monotonic(), png)
+        self.chart_cache.move_to_end(key)
+        while len(self.chart_cache) > CHART_CACHE_SIZE:
+            self.chart_cache.popitem(last=False)
+        return discord.File(io.BytesIO(png), filename=f"{name}.png")
+    
+    async def send_stats(self, ctx, embed: discord.Embed, chart: Optional[discord.File]):
+        """Send a statistics embed with its chart image, if one was rendered"""
+        if chart is None:
+            return await ctx.send(embed=embed)
+        embed.set_image(url=f"attachment://{chart.filename}")
+        await ctx.send(embed=embed, file=chart)
+    
+    @tasks.loop(minutes=1.0)
+    async def flush_active_users_task(self):
+        """Periodically add active users to the Redis HyperLogLogs"""
+        await self.flush_active_users()
+    
+    @flush_active_users_task.before_loop
+    async def before_flush_active_users(self):
+        """Wait for bot to be ready before starting task"""
+        await self.bot.wait_until_ready()
+    
+    @tasks.loop(minutes=1.0)
+    async def rollup_task(self):
+        """Write this minute's activity and roll up closed hours, days and weeks"""
+        self.fold_counters()
+        await self.rollup.flush()
+        await self.flush_latency()
+        try:
+            await self.rollup.roll_up()
+        except Exception as e:
+            logger.error(f"Error rolling up stats: {str(e)}", exc_info=True)
+    
+    async def flush_latency(self):
+        """Add the command durations recorded since the last flush to this hour's histograms"""
+        if not self.latency:
+            return
+        histograms, self.latency = self.latency, {}
+        hour = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
         try:
-            logger.info("Running stats save task")
-            for guild_id, stats in self.stats_cache.items():
-                await db.save_guild_stats(guild_id, stats)
-                logger.debug(f"Saved stats for guild {guild_id} to database")
+            if not self.latency_indexes_ready:
+                await db.ensure_command_latency_indexes()
+                self.latency_indexes_ready = True
+            await db.add_command_latency(hour, {name: histogram.to_dict() for name, histogram in histograms.items()},
+                                         expires_at=hour + datetime.timedelta(days=LATENCY_RETENTION_DAYS))
         except Exception as e:
-            logger.error(f"Error in stats save task: {str(e)}", exc_info=True)
+            logger.error(f"Error saving command latency: {str(e)}", exc_info=True)
+            for name, histogram in histograms.items():
+                self.latency.setdefault(name, LogHistogram()).merge(histogram)
+    
+    async def start_command_timer(self, ctx):
+        ctx.stats_started = time.perf_counter()
+    
+    async def stop_command_timer(self, ctx):
+        """Record how long a command's callback took and whether it failed"""
+        started = getattr(ctx, "stats_started", None)
+        if started is None:
+            return
+        ctx.stats_started = None
+        histogram = self.latency.get(ctx.command.qualified_name)
+        if histogram is None:
+            histogram = self.latency[ctx.command.qualified_name] = LogHistogram()
+        histogram.add((time.perf_counter() - started) * 1000, ctx.command_failed)
+    
+    @rollup_task.before_loop
+    async def before_rollup(self):
+        """Wait for bot to be ready before starting task"""
+        await self.bot.wait_until_ready()
+    
+    async def credit_voice(self, guild_id: str, channel_id: int, muted: bool, minutes: float):
+        """Add a finished voice segment to the guild's stats"""
+        if minutes <= 0:
+            return
+        await self.initialize_guild_stats(guild_id)
+        self.increment(guild_id, "voice.total_minutes", minutes)
+        self.increment(guild_id, f"voice.by_channel.{channel_id}", minutes)
+        if muted:
+            self.increment(guild_id, "voice.muted_minutes", minutes)
+    
+    async def reconcile_voice_sessions(self):
+        """Open sessions for everyone already in voice, resuming checkpoints from before a restart"""
+        # Sessions start now and are backdated once the checkpoints are read, so
+        # voice time keeps counting while Redis is still unavailable
+        now = time.monotonic()
+        wall = time.time()
+        opened = {}
+        for guild in self.bot.guilds:
+            for channel in guild.voice_channels:
+                for member in channel.members:
+                    # Members who joined since the bot became ready already have a session
+                    if member.bot or (guild.id, member.id) in self.voice.sessions:
+                        continue
+                    self.voice.open(guild.id, member.id, channel.id, VoiceSessions.is_muted(member.voice), now)
+                    opened[(guild.id, member.id)] = self.voice.sessions[(guild.id, member.id)]
+        self.voice_resume = (opened, wall)
+        
+        # A few quick attempts, after that the checkpoint loop keeps trying every interval
+        for attempt in range(VOICE_RECONCILE_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(2 ** (attempt - 1))
+            if await self.resume_voice_checkpoints():
+                return
+        logger.warning(f"Voice checkpoints not readable after {VOICE_RECONCILE_ATTEMPTS} attempts, "
+                       f"crediting voice without them until Redis answers")
+    
+    async def resume_voice_checkpoints(self) -> bool:
+        """Backdate the sessions opened at startup from the checkpoints saved before the restart.
+        Returns False while the checkpoints can't be read.
+        """
+        opened, wall = self.voice_resume
+        try:
+            checkpoints = await db.get_voice_sessions([str(guild.id) for guild in self.bot.guilds])
+        except Exception as e:
+            logger.debug(f"Voice checkpoints not readable yet: {str(e)}")
+            return False
+        self.voice_resume = None
+        
+        resumed = 0
+        for guild_id, saved in checkpoints.items():
+            self.voice.checkpointed_guilds.add(guild_id)
+            for member_id, entry in saved.items():
+                key = (int(guild_id), int(member_id))
+                session = opened.get(key)
+                # Only sessions still open since the bot started, a voice event since then ended that segment
+                if session is None or self.voice.sessions.get(key) is not session:
+                    continue
+                channel_id, _, since = entry.split(":")
+                if int(channel_id) == session.channel_id:
+                    # Still in the same channel, credit the time since the last checkpoint
+                    session.started -= min(max(0.0, wall - float(since)), VOICE_MAX_DOWNTIME_CREDIT)
+                    resumed += 1
+        logger.info(f"Reconciled {len(self.voice.sessions)} open voice sessions ({resumed} resumed from checkpoints)")
+        return True
+    
+    @tasks.loop(seconds=VOICE_CHECKPOINT_INTERVAL)
+    async def voice_checkpoint_task(self):
+        """Credit open voice sessions and save them to Redis in one batch"""
+        now = time.monotonic()
+        for guild_id, channel_id, muted, minutes in self.voice.split_all(now):
+            await self.credit_voice(str(guild_id), channel_id, muted, minutes)
+        
+        if self.voice_resume is not None and not await self.resume_voice_checkpoints():
+            # Saving before the old checkpoints were read would overwrite them
+            logger.debug("Skipping voice checkpoint until Redis is reachable")
+            return
+        sessions = self.voice.checkpoint(time.time())
+        cleared = self.voice.checkpointed_guilds - set(sessions)
+        try:
+            await db.save_voice_sessions(sessions, cleared, ex=VOICE_CHECKPOINT_TTL)
+            self.voice.checkpointed_guilds = set(sessions)
+        except Exception as e:
+            logger.error(f"Error checkpointing voice sessions: {str(e)}", exc_info=True)
+    
+    @voice_checkpoint_task.before_loop
+    async def before_voice_checkpoint(self):
+        """Wait for bot to be ready, then pick up sessions that are already open"""
+        await self.bot.wait_until_ready()
+        await self.reconcile_voice_sessions()
+    
+    @tasks.loop(seconds=10.0)
+    async def merge_counters_task(self):
+        """Periodically merge local counters into Redis (shared counter mode)"""
+        await self.merge_counters()
+    
+    @merge_counters_task.before_loop
+    async def before_merge_counters(self):
+        """Wait for bot to be ready before starting task"""
+        await self.bot.wait_until_ready()
     
     @save_stats_task.before_loop
     async def before_save_stats(self):
@@ -118,6 +967,7 @@ class Statistics(commands.Cog):
         await self.bot.wait_until_ready()
     
     @commands.Cog.listener()
+    @timed_listener
     async def on_message(self, message):
         """Track message statistics"""
         # Ignore messages from bots
@@ -125,98 +975,52 @@ class Statistics(commands.Cog):
             return
             
         # Ignore DMs
-        if not message.guild:
+        guild = message.guild
+        if not guild:
             return
-            
-        guild_id = str(message.guild.id)
-        channel_id = str(message.channel.id)
-        
-        # Initialize stats for this guild if needed
-        await self.initialize_guild_stats(guild_id)
-        
-        # Update total message count
-        self.stats_cache[guild_id]["messages"]["total"] += 1
         
-        # Update by-channel stats
-        channel_stats = self.stats_cache[guild_id]["messages"]["by_channel"]
-        if channel_id not in channel_stats:
-            channel_stats[channel_id] = 0
-        channel_stats[channel_id] += 1
-        
-        # Update by-hour stats
-        hour = str(datetime.datetime.utcnow().hour)
-        self.stats_cache[guild_id]["messages"]["by_hour"][hour] += 1
-        
-        # Update by-day stats
-        day = str(datetime.datetime.utcnow().weekday())
-        self.stats_cache[guild_id]["messages"]["by_day"][day] += 1
+        # Fast path never awaits, only a guild's first message loads its stats
+        counters = self.counters.get(guild.id)
+        if counters is None:
+            counters = await self.get_counters(guild.id)
+        counters.count_message(message.channel.id, message.author.id, self.current_clock(), int(time.monotonic()))
     
     @commands.Cog.listener()
+    @timed_listener
     async def on_command(self, ctx):
         """Track command usage statistics"""
         # Ignore DMs
         if not ctx.guild:
             return
             
-        guild_id = str(ctx.guild.id)
-        command_name = ctx.command.qualified_name
-        
-        # Initialize stats for this guild if needed
-        await self.initialize_guild_stats(guild_id)
-        
-        # Update total command count
-        self.stats_cache[guild_id]["commands"]["total"] += 1
-        
-        # Update by-name stats
-        command_stats = self.stats_cache[guild_id]["commands"]["by_name"]
-        if command_name not in command_stats:
-            command_stats[command_name] = 0
-        command_stats[command_name] += 1
+        counters = self.counters.get(ctx.guild.id)
+        if counters is None:
+            counters = await self.get_counters(ctx.guild.id)
+        counters.count_command(ctx.command.qualified_name)
     
     @commands.Cog.listener()
+    @timed_listener
     async def on_voice_state_update(self, member, before, after):
         """Track voice channel usage statistics"""
         # Ignore bots
         if member.bot:
             return
-            
-        guild_id = str(member.guild.id)
         
-        # Initialize stats for this guild if needed
-        await self.initialize_guild_stats(guild_id)
+        # Streaming and video toggles don't change how the time is counted
+        muted = VoiceSessions.is_muted(after)
+        if before.channel == after.channel and VoiceSessions.is_muted(before) == muted:
+            return
         
-        # If user joined a voice channel
-        if before.channel is None and after.channel is not None:
-            # Store join time in Redis with 24h expiration
-            channel_id = str(after.channel.id)
-            join_time = datetime.datetime.utcnow().isoformat()
-            await db.redis_set(f"voice_join:{guild_id}:{member.id}", 
-                              f"{channel_id}:{join_time}", 
-                              ex=86400)  # 24 hours
-        
-        # If user left a voice channel
-        elif before.channel is not None and (after.channel is None or after.channel.id != before.channel.id):
-            # Get join time from Redis
-            join_data = await db.redis_get(f"voice_join:{guild_id}:{member.id}")
-            if join_data:
-                channel_id, join_time_str = join_data.split(':', 1)
-                join_time = datetime.datetime.fromisoformat(join_time_str)
-                leave_time = datetime.datetime.utcnow()
-                
-                # Calculate duration in minutes
-                duration_minutes = (leave_time - join_time).total_seconds() / 60
-                
-                # Update voice stats
-                self.stats_cache[guild_id]["voice"]["total_minutes"] += duration_minutes
-                
-                # Update by-channel stats
-                channel_stats = self.stats_cache[guild_id]["voice"]["by_channel"]
-                if channel_id not in channel_stats:
-                    channel_stats[channel_id] = 0
-                channel_stats[channel_id] += duration_minutes
-                
-                # Remove join time from Redis
-                await db.redis_delete(f"voice_join:{guild_id}:{member.id}")
+        # Joins, leaves, moves and mute/deafen changes all end the current
+        # segment (if any) and start a new one in the channel the member is in now
+        guild_id = member.guild.id
+        now = time.monotonic()
+        if before.channel is not None:
+            segment = self.voice.close(guild_id, member.id, now)
+            if segment:
+                await self.credit_voice(str(guild_id), *segment)
+        if after.channel is not None:
+            self.voice.open(guild_id, member.id, after.channel.id, muted, now)
     
     @commands.group(name="stats", invoke_without_command=True)
     async def stats(self, ctx):
@@ -226,6 +1030,7 @@ class Statistics(commands.Cog):
             
             # Initialize stats for this guild if needed
             await self.initialize_guild_stats(guild_id)
+            self.fold_counters(guild_id)
             
             # Get stats from cache
             stats = self.stats_cache[guild_id]
@@ -265,6 +1070,18 @@ class Statistics(commands.Cog):
                 inline=True
             )
             
+            # Add distinct active users
+            try:
+                await self.flush_active_users()
+                active = await self.count_active_users(guild_id)
+                embed.add_field(
+                    name="🟢 Active Users",
+                    value=f"Today: {active['today']}\n7 days: {active['week']}\n30 days: {active['month']}",
+                    inline=True
+                )
+            except Exception as e:
+                logger.error(f"Error counting active users: {str(e)}", exc_info=True)
+            
             # Add last updated timestamp
             last_updated = datetime.datetime.fromisoformat(stats["last_updated"])
             embed.set_footer(text=f"Last updated: {last_updated.strftime('%Y-%m-%d %H:%M:%S UTC')}")
@@ -278,6 +1095,7 @@ class Statistics(commands.Cog):
         
         # Initialize stats for this guild if needed
         await self.initialize_guild_stats(guild_id)
+        self.fold_counters(guild_id)
         
         # Get stats from cache
         stats = self.stats_cache[guild_id]
@@ -298,16 +1116,14 @@ class Statistics(commands.Cog):
         )
         
         # Add top 5 channels
-        channel_stats = message_stats["by_channel"]
-        if channel_stats:
-            # Sort channels by message count
-            sorted_channels = sorted(channel_stats.items(), key=lambda x: x[1], reverse=True)[:5]
-            
+        top_channels = self.top_k[guild_id]["channels"].top(5)
+        if top_channels:
             channels_text = ""
-            for channel_id, count in sorted_channels:
+            for channel_id, count, error in top_channels:
                 channel = ctx.guild.get_channel(int(channel_id))
                 channel_name = channel.name if channel else f"Unknown ({channel_id})"
-                channels_text += f"#{channel_name}: {count} messages\n"
+                approx = "~" if error else ""
+                channels_text += f"#{channel_name}: {approx}{count} messages\n"
             
             embed.add_field(
                 name="Top Channels",
@@ -346,7 +1162,10 @@ class Statistics(commands.Cog):
                 inline=False
             )
         
-        await ctx.send(embed=embed)
+        # Hourly activity chart
+        by_hour = tuple(hour_stats.get(str(hour), 0) for hour in range(24))
+        chart = await self.render_chart(guild_id, "hourly_activity", by_hour, charts.render_hourly_activity, by_hour)
+        await self.send_stats(ctx, embed, chart)
     
     @stats.command(name="commands")
     async def stats_commands(self, ctx):
@@ -355,6 +1174,7 @@ class Statistics(commands.Cog):
         
         # Initialize stats for this guild if needed
         await self.initialize_guild_stats(guild_id)
+        self.fold_counters(guild_id)
         
         # Get stats from cache
         stats = self.stats_cache[guild_id]
@@ -375,14 +1195,12 @@ class Statistics(commands.Cog):
         )
         
         # Add top 10 commands
-        by_name = command_stats["by_name"]
-        if by_name:
-            # Sort commands by usage count
-            sorted_commands = sorted(by_name.items(), key=lambda x: x[1], reverse=True)[:10]
-            
+        top_commands = self.top_k[guild_id]["commands"].top(10)
+        if top_commands:
             commands_text = ""
-            for cmd_name, count in sorted_commands:
-                commands_text += f"{cmd_name}: {count} uses\n"
+            for cmd_name, count, error in top_commands:
+                approx = "~" if error else ""
+                commands_text += f"{cmd_name}: {approx}{count} uses\n"
             
             embed.add_field(
                 name="Top Commands",
@@ -399,6 +1217,7 @@ class Statistics(commands.Cog):
         
         # Initialize stats for this guild if needed
         await self.initialize_guild_stats(guild_id)
+        self.fold_counters(guild_id)
         
         # Get stats from cache
         stats = self.stats_cache[guild_id]
@@ -419,18 +1238,14 @@ class Statistics(commands.Cog):
         )
         
         # Add history info if available
-        history = member_stats["history"]
-        if len(history) > 1:
-            oldest = history[0]
-            newest = history[-1]
-            
-            oldest_count = oldest["count"]
-            oldest_time = datetime.datetime.fromisoformat(oldest["timestamp"])
-            
-            change = newest["count"] - oldest_count
+        since = datetime.datetime.utcnow() - datetime.timedelta(days=MEMBER_COUNT_RETENTION_DAYS)
+        oldest = await db.get_member_count_history(guild_id, since=since, limit=1)
+        newest = await db.get_member_count_history(guild_id, since=since, limit=1, newest_first=True)
+        if oldest and newest and oldest[0]["timestamp"] != newest[0]["timestamp"]:
+            change = newest[0]["count"] - oldest[0]["count"]
             change_sign = "+" if change >= 0 else ""
             
-            time_diff = datetime.datetime.utcnow() - oldest_time
+            time_diff = datetime.datetime.utcnow() - oldest[0]["timestamp"]
             days = time_diff.days
             
             embed.add_field(
@@ -438,6 +1253,16 @@ class Statistics(commands.Cog):
                 value=f"{change_sign}{change} members",
                 inline=False
             )
+            
+            # Member growth chart, only fetched when the newest sample changed
+            async def load_points():
+                history = await db.get_member_count_history(guild_id, since=since)
+                step = max(1, len(history) // CHART_MAX_POINTS)
+                return [(entry["timestamp"], entry["count"]) for entry in history[::step]]
+            
+            version = (oldest[0]["timestamp"], newest[0]["timestamp"], newest[0]["count"])
+            chart = await self.render_chart(guild_id, "member_growth", version, charts.render_member_growth, load_points)
+            return await self.send_stats(ctx, embed, chart)
         
         await ctx.send(embed=embed)
     
@@ -448,6 +1273,7 @@ class Statistics(commands.Cog):
         
         # Initialize stats for this guild if needed
         await self.initialize_guild_stats(guild_id)
+        self.fold_counters(guild_id)
         
         # Get stats from cache
         stats = self.stats_cache[guild_id]
@@ -471,6 +1297,14 @@ class Statistics(commands.Cog):
             inline=False
         )
         
+        muted_minutes = int(voice_stats.get("muted_minutes", 0))
+        if muted_minutes:
+            embed.add_field(
+                name="Muted or Deafened",
+                value=f"{muted_minutes // 60} hours, {muted_minutes % 60} minutes",
+                inline=False
+            )
+        
         # Add top 5 channels
         channel_stats = voice_stats["by_channel"]
         if channel_stats:
@@ -490,9 +1324,222 @@ class Statistics(commands.Cog):
                 value=channels_text or "No data",
                 inline=False
             )
+            
+            # Voice time by channel chart
+            named = []
+            for channel_id, minutes in sorted_channels:
+                channel = ctx.guild.get_channel(int(channel_id))
+                named.append((channel.name if channel else channel_id, round(minutes, 1)))
+            named = tuple(named)
+            chart = await self.render_chart(guild_id, "voice_by_channel", named, charts.render_voice_by_channel, named)
+            return await self.send_stats(ctx, embed, chart)
         
         await ctx.send(embed=embed)
     
+    @stats.command(name="trend")
+    async def stats_trend(self, ctx, period: str = "day"):
+        """Display activity over the last hours, days or weeks (hour/day/week)"""
+        period = period.lower()
+        if period not in TREND_BUCKETS:
+            return await ctx.send("Please choose `hour`, `day` or `week`.")
+        guild_id = str(ctx.guild.id)
+        
+        # Only closed, rolled up buckets are read
+        count = TREND_BUCKETS[period]
+        end = self.rollup.floor(datetime.datetime.utcnow(), period)
+        step = {"hour": datetime.timedelta(hours=1), "day": datetime.timedelta(days=1), "week": datetime.timedelta(weeks=1)}[period]
+        start = end - step * count
+        buckets = await db.get_stats_rollups(period, start, end, guild_id=guild_id)
+        
+        embed = discord.Embed(
+            title=f"📈 Activity Trend for {ctx.guild.name}",
+            description=f"Last {count} {period}s",
+            color=discord.Color.blue(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        if not buckets:
+            embed.add_field(name="No data", value="Trends appear once the first full period has been rolled up.", inline=False)
+            return await ctx.send(embed=embed)
+        
+        messages = sum(bucket.get("messages", 0) for bucket in buckets)
+        commands_used = sum(bucket.get("commands", 0) for bucket in buckets)
+        voice_minutes = int(sum(bucket.get("voice_minutes", 0) for bucket in buckets))
+        busiest = max(buckets, key=lambda bucket: bucket.get("messages", 0))
+        label = "%Y-%m-%d %H:00" if period == "hour" else "%Y-%m-%d"
+        
+        embed.add_field(name="💬 Messages", value=str(messages), inline=True)
+        embed.add_field(name="⌨️ Commands", value=str(commands_used), inline=True)
+        embed.add_field(name="🎤 Voice", value=f"{voice_minutes} minutes", inline=True)
+        embed.add_field(
+            name="Busiest",
+            value=f"{busiest['bucket'].strftime(label)} UTC ({busiest.get('messages', 0)} messages)",
+            inline=False
+        )
+        
+        tick = "%H:00" if period == "hour" else "%b %d"
+        points = tuple((bucket["bucket"].strftime(tick), bucket.get("messages", 0)) for bucket in buckets)
+        chart = await self.render_chart(guild_id, f"trend_{period}", points, charts.render_trend, points)
+        await self.send_stats(ctx, embed, chart)
+    
+    @stats.command(name="live")
+    async def stats_live(self, ctx):
+        """Display the current message rate of the server and its busiest channels"""
+        counters = self.counters.get(ctx.guild.id)
+        second = int(time.monotonic())
+        history = counters.activity.messages.series(second) if counters else [0] * GUILD_WINDOW_SECONDS
+        last_minute = sum(history[-60:])
+        
+        embed = discord.Embed(
+            title=f"🔴 Live Activity for {ctx.guild.name}",
+            description=f"Messages in the last {GUILD_WINDOW_SECONDS // 60} minutes, updated as they arrive",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        embed.add_field(name="💬 Last minute", value=f"{last_minute} messages", inline=True)
+        embed.add_field(name="⚡ Last 10 seconds", value=f"{sum(history[-10:])} messages", inline=True)
+        embed.add_field(
+            name=f"📊 Last {GUILD_WINDOW_SECONDS // 60} minutes",
+            value=f"{sum(history)} messages, peak {max(history)}/s",
+            inline=True
+        )
+        
+        # One bar per equal slice of the window, oldest first
+        width = GUILD_WINDOW_SECONDS // LIVE_SPARKLINE_BUCKETS
+        buckets = [sum(history[i:i + width]) for i in range(0, GUILD_WINDOW_SECONDS, width)]
+        top = max(buckets) or 1
+        sparkline = "".join(SPARKLINE_BARS[count * (len(SPARKLINE_BARS) - 1) // top] for count in buckets)
+        embed.add_field(name=f"History ({width}s per bar)", value=f"`{sparkline}`", inline=False)
+        
+        busiest = counters.activity.busiest_channels(second, 5, CHANNEL_WINDOW_SECONDS) if counters else []
+        embed.add_field(
+            name="🔥 Busiest channels (last minute)",
+            value="\n".join(f"<#{channel_id}>: {count} messages" for channel_id, count in busiest) or "No messages",
+            inline=False
+        )
+        await ctx.send(embed=embed)
+    
+    @stats.command(name="latency")
+    @commands.check_any(commands.is_owner(), commands.has_permissions(administrator=True))
+    async def stats_latency(self, ctx, *, command_name: str = None):
+        """Display command execution time percentiles and error rates (last 24 hours, all servers, Admin only)"""
+        since = datetime.datetime.utcnow() - datetime.timedelta(hours=LATENCY_WINDOW_HOURS)
+        histograms = {}
+        for doc in await db.get_command_latency(since, command=command_name):
+            histograms.setdefault(doc["command"], LogHistogram()).merge(LogHistogram.from_dict(doc))
+        # Include what hasn't been saved yet
+        for name, histogram in self.latency.items():
+            if command_name is None or name == command_name:
+                histograms.setdefault(name, LogHistogram()).merge(histogram)
+        
+        embed = discord.Embed(
+            title="⏱️ Command Latency",
+            description=f"Last {LATENCY_WINDOW_HOURS} hours" + (f" for `{command_name}`" if command_name else ""),
+            color=discord.Color.blue(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        if not histograms:
+            embed.add_field(name="No data", value="No commands have been timed yet.", inline=False)
+            return await ctx.send(embed=embed)
+        
+        def ms(value):
+            return f"{value / 1000:.1f}s" if value >= 1000 else f"{value:.0f}ms"
+        
+        by_calls = sorted(histograms.items(), key=lambda item: item[1].count, reverse=True)[:10]
+        for name, histogram in by_calls:
+            embed.add_field(
+                name=f"{name} ({histogram.count} calls)",
+                value=(f"p50 {ms(histogram.percentile(50))} · p95 {ms(histogram.percentile(95))} · "
+                       f"p99 {ms(histogram.percentile(99))}\nErrors: {histogram.error_rate:.1%}"),
+                inline=False
+            )
+        await ctx.send(embed=embed)
+    
+    @stats.command(name="topk")
+    @commands.has_permissions(administrator=True)
+    async def stats_topk(self, ctx, k: int = None):
+        """Show or set how many channels and commands are tracked (Admin only)"""
+        guild_id = str(ctx.guild.id)
+        await self.initialize_guild_stats(guild_id)
+        self.fold_counters(guild_id)
+        
+        sketches = self.top_k[guild_id]
+        if k is None:
+            return await ctx.send(f"Tracking the top **{sketches['channels'].k}** channels and commands.")
+        if not TOP_K_MIN <= k <= TOP_K_MAX:
+            return await ctx.send(f"Please choose a value between {TOP_K_MIN} and {TOP_K_MAX}.")
+        
+        self.set_value(guild_id, "top_k", k)
+        for name in TOP_K_FIELDS:
+            sketches[name].resize(k)
+            self.count_top(guild_id, name, {})
+        await ctx.send(f"✅ Now tracking the top **{k}** channels and commands.")
+    
+    async def export_records(self, guild_id: str):
+        """Yield a guild's current stats, member history and rollups as export records"""
+        def flatten(values, prefix=""):
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    yield from flatten(value, f"{prefix}{key}.")
+                else:
+                    yield f"{prefix}{key}", value
+        
+        stats = {key: value for key, value in self.stats_cache[guild_id].items() if key not in ("_id", "guild_id")}
+        for metric, value in flatten(stats):
+            yield {"type": "stats", "metric": metric, "value": value}
+        for name, (section, field, _) in TOP_K_FIELDS.items():
+            sketch = self.top_k[guild_id][name]
+            for key, count, _ in sketch.top(sketch.k):
+                yield {"type": "stats", "metric": f"{section}.{field}.{key}", "value": count}
+        
+        async for sample in db.iter_member_count_history(guild_id):
+            yield {"type": "member_count", **sample}
+        async for bucket in db.iter_stats_rollups(guild_id):
+            yield {"type": "rollup", **bucket}
+    
+    @stats.command(name="export")
+    @commands.has_permissions(administrator=True)
+    async def stats_export(self, ctx, fmt: str = "csv"):
+        """Export statistics, member history and rollups as gzipped CSV or JSON lines (Admin only)"""
+        fmt = fmt.lower()
+        if fmt not in EXPORT_FORMATS:
+            return await ctx.send("Please choose `csv` or `json`.")
+        if ctx.guild.id in self.exports:
+            return await ctx.send("An export for this server is already running.")
+        
+        guild_id = str(ctx.guild.id)
+        self.exports.add(ctx.guild.id)
+        writer = None
+        try:
+            await self.initialize_guild_stats(guild_id)
+            self.fold_counters(guild_id)
+            await ctx.send("📦 Exporting statistics, files are sent as they are ready...")
+            
+            # Parts are sent as soon as they fill up, only one is held at a time
+            name = f"stats-{guild_id}-{datetime.datetime.utcnow():%Y%m%d-%H%M}"
+            writer = ExportWriter(fmt, name, ctx.guild.filesize_limit)
+            async for record in self.export_records(guild_id):
+                part = writer.write(record)
+                if part:
+                    await self.send_export_part(ctx, part)
+            part = writer.finish()
+            if part:
+                await self.send_export_part(ctx, part)
+            await ctx.send(f"✅ Exported {writer.records} records in {writer.parts} file(s).")
+        except Exception as e:
+            logger.error(f"Error exporting stats for guild {guild_id}: {str(e)}", exc_info=True)
+            await ctx.send("❌ The export failed, please try again later.")
+        finally:
+            self.exports.discard(ctx.guild.id)
+            if writer:
+                writer.close()
+    
+    async def send_export_part(self, ctx, part):
+        filename, fp = part
+        try:
+            await ctx.send(file=discord.File(fp, filename=filename))
+        finally:
+            fp.close()
+    
     @stats.command(name="reset")
     @commands.has_permissions(administrator=True)
     async def stats_reset(self, ctx):
@@ -513,6 +1560,9 @@ class Statistics(commands.Cog):
             # Reset stats in cache
             if guild_id in self.stats_cache:
                 del self.stats_cache[guild_id]
+            self.pending_updates.pop(guild_id, None)
+            self.counters.pop(ctx.guild.id, None)
+            self.top_k.pop(guild_id, None)
             
             # Reset stats in database
             await db.delete_guild_stats(guild_id)
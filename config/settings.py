@@ -0,0 +1,32 @@
+"""Optional tuning settings.
+
+Unlike config.py these have working defaults, and each one can be overridden
+with an environment variable of the same name.
+"""
+import os
+
+# Where statistics counters are merged before they reach MongoDB:
+#   "local" - each process saves its own counters ($inc deltas)
+#   "redis" - processes merge counters into shared Redis hashes and a single
+#             aggregator writes them to MongoDB (use when running several shards)
+STATS_COUNTER_BACKEND = os.getenv("STATS_COUNTER_BACKEND", "local")
+
+# Seconds between merges of local counters into Redis ("redis" backend only)
+STATS_REDIS_MERGE_INTERVAL = int(os.getenv("STATS_REDIS_MERGE_INTERVAL", "10"))
+
+# Days each tier of the statistics rollups is kept (0 keeps it forever).
+# Minute buckets must be kept long enough to be rolled up into hours.
+STATS_MINUTE_RETENTION_DAYS = int(os.getenv("STATS_MINUTE_RETENTION_DAYS", "2"))
+STATS_HOUR_RETENTION_DAYS = int(os.getenv("STATS_HOUR_RETENTION_DAYS", "30"))
+STATS_DAY_RETENTION_DAYS = int(os.getenv("STATS_DAY_RETENTION_DAYS", "365"))
+STATS_WEEK_RETENTION_DAYS = int(os.getenv("STATS_WEEK_RETENTION_DAYS", "0"))
+
+# Port of the local Prometheus /metrics endpoint (0 disables it) and the
+# address it listens on
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Where AutoMod's spam, mention and raid windows are counted:
+#   "local" - in the memory of each process
+#   "redis" - in Redis, shared by all processes and kept across restarts
+AUTOMOD_WINDOW_BACKEND = os.getenv("AUTOMOD_WINDOW_BACKEND", "local")
@@ -8,8 +8,10 @@ import os
 
 from config.config import BOT_TOKEN, MONGO_URI, REDIS_URI
 from config.logging_config import setup_logging
+from config.settings import METRICS_HOST, METRICS_PORT
 from utils.ffmpeg_check import check_ffmpeg, get_ffmpeg_path
 from utils.database import db
+from utils.metrics import MetricsServer
 from cogs.role import Role
 from cogs.greetings import Greeting
 from cogs.moderation import Moderation
@@ -88,6 +90,8 @@ async def setup():
     await client.add_cog(Help(client))
     await client.add_cog(Statistics(client))
     await client.add_cog(AutoMod(client))
+    if METRICS_PORT:
+        await MetricsServer(client, METRICS_HOST, METRICS_PORT).start()
 async def run_bot():
     await client.start(BOT_TOKEN)
     
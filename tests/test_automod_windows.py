@@ -0,0 +1,98 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from cogs import automod
+from cogs.automod import WINDOW_RETRY_INTERVAL, AutoMod, SharedWindow
+from utils.database import Database
+
+try:
+    import fakeredis
+    from fakeredis.commands_mixins import server_mixin
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class SlidingWindowScriptTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.second = 1000
+        # The script reads the Redis clock, pin it so windows can be moved through time
+        clock = SimpleNamespace(time=lambda: self.second + 0.5)
+        patcher = mock.patch.object(server_mixin, 'time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = fakeredis.FakeServer()
+
+    def database(self):
+        database = Database()
+        database.redis_client = fakeredis.aioredis.FakeRedis(server=self.server)
+        return database
+
+    async def test_counts_and_expires_per_second(self):
+        database = self.database()
+        self.assertEqual(await database.count_sliding_windows([("a", 10, 3), ("b", 5, 1)]), [3, 1])
+        self.second = 1004
+        self.assertEqual(await database.count_sliding_windows([("a", 10, 2), ("b", 5, 0)]), [5, 1])
+        self.second = 1005
+        self.assertEqual(await database.count_sliding_windows([("a", 10, 0), ("b", 5, 0)]), [5, 0])
+        self.second = 1010
+        self.assertEqual(await database.count_sliding_windows([("a", 10, 0)]), [2])
+        self.assertEqual(await database.redis_client.hgetall("a"), {b"1004": b"2"})
+        self.assertFalse(await database.redis_client.exists("b"))
+
+    async def test_processes_share_windows(self):
+        first, second = self.database(), self.database()
+        self.assertEqual(await first.count_sliding_windows([("a", 10, 2)]), [2])
+        self.assertEqual(await second.count_sliding_windows([("a", 10, 3)]), [5])
+        self.assertEqual(await first.count_sliding_windows([("a", 10, 0)]), [5])
+
+
+class SharedWindowFallbackTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cog = AutoMod.__new__(AutoMod)
+        self.cog.shared_windows = True
+        self.cog.windows_retry_at = 0.0
+        self.cog.window_errors = 0
+        self.cog.window_error_logged_at = float("-inf")
+        self.db = SimpleNamespace(count_sliding_windows=mock.AsyncMock(side_effect=ConnectionError("down")))
+        patcher = mock.patch.object(automod, 'db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def add(self, window, now, threshold=5):
+        window.add(now, 10)
+        await self.cog.sync_windows(now, [(window, threshold)])
+        return window.total
+
+    async def test_counts_locally_and_retries_after_interval(self):
+        window = SharedWindow("w")
+        with self.assertLogs('bot.automod', 'ERROR') as logs:
+            totals = [await self.add(window, 100 + i * 0.5) for i in range(6)]
+        self.assertEqual(totals, [1, 2, 3, 4, 5, 6])
+        self.assertTrue(window.offline)
+        # The first message tries Redis, the rest wait for the retry interval
+        self.assertEqual(self.db.count_sliding_windows.await_count, 1)
+        self.assertEqual(len(logs.records), 1)
+
+        self.db.count_sliding_windows.side_effect = None
+        self.db.count_sliding_windows.return_value = [9]
+        self.assertEqual(await self.add(window, 100 + WINDOW_RETRY_INTERVAL), 9)
+        self.assertFalse(window.offline)
+        # Only events still inside the window are sent once Redis is back
+        self.assertEqual(self.db.count_sliding_windows.await_args.args[0], [("w", 10, 7)])
+
+    async def test_unsent_is_capped_by_local_window(self):
+        window = SharedWindow("w")
+        with self.assertLogs('bot.automod', 'ERROR'):
+            for i in range(4):
+                await self.add(window, 100 + i)
+        self.db.count_sliding_windows.side_effect = None
+        self.db.count_sliding_windows.return_value = [1]
+        await self.add(window, 200)
+        self.assertEqual(self.db.count_sliding_windows.await_args.args[0], [("w", 10, 1)])
+        self.assertEqual(window.total, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import csv
+import gzip
+import io
+import json
+import random
+import unittest
+
+from utils.export import CSV_COLUMNS, PART_MARGIN, ExportWriter, csv_rows
+
+LIMIT = PART_MARGIN + 256 * 1024
+
+
+def random_records(count, seed=3):
+    rng = random.Random(seed)
+    # Hex text only compresses about two to one, so parts fill up quickly
+    return [{"type": "stats", "metric": "%032x" % i + rng.randbytes(1024).hex(), "value": i} for i in range(count)]
+
+
+def write_all(writer, records):
+    parts = []
+    for record in records:
+        part = writer.write(record)
+        if part:
+            parts.append(part)
+    last = writer.finish()
+    if last:
+        parts.append(last)
+    return parts
+
+
+def read_part(part):
+    name, file = part
+    data = file.read()
+    file.close()
+    return name, len(data), gzip.decompress(data).decode("utf-8")
+
+
+class ExportWriterTest(unittest.TestCase):
+    def test_json_parts_are_complete_and_under_limit(self):
+        records = random_records(1500)
+        writer = ExportWriter("json", "stats", LIMIT)
+        parts = [read_part(part) for part in write_all(writer, records)]
+        self.assertGreater(len(parts), 2)
+        self.assertEqual([name for name, _, _ in parts], [f"stats-{i}.ndjson.gz" for i in range(1, len(parts) + 1)])
+        lines = []
+        for _, size, text in parts:
+            self.assertLessEqual(size, LIMIT)
+            lines.extend(text.splitlines())
+        self.assertEqual([json.loads(line) for line in lines], records)
+        self.assertEqual(writer.records, len(records))
+
+    def test_csv_parts_start_with_header(self):
+        records = random_records(1500)
+        writer = ExportWriter("csv", "stats", LIMIT)
+        parts = [read_part(part) for part in write_all(writer, records)]
+        self.assertGreater(len(parts), 2)
+        rows = []
+        for name, size, text in parts:
+            self.assertTrue(name.endswith(".csv.gz"))
+            self.assertLessEqual(size, LIMIT)
+            part_rows = list(csv.reader(io.StringIO(text)))
+            self.assertEqual(tuple(part_rows[0]), CSV_COLUMNS)
+            rows.extend(part_rows[1:])
+        expected = [[str(value) for value in row] for record in records for row in csv_rows(record)]
+        self.assertEqual(rows, expected)
+
+    def test_finish_after_full_part_returns_none(self):
+        writer = ExportWriter("json", "stats", LIMIT)
+        parts = []
+        for record in random_records(1500):
+            part = writer.write(record)
+            if part:
+                parts.append(part)
+                break
+        self.assertEqual(len(parts), 1)
+        self.assertIsNone(writer.finish())
+        parts[0][1].close()
+
+    def test_empty_export_still_has_one_part(self):
+        writer = ExportWriter("csv", "stats", LIMIT)
+        name, _, text = read_part(writer.finish())
+        self.assertEqual(name, "stats-1.csv.gz")
+        self.assertEqual(text.strip(), ",".join(CSV_COLUMNS))
+
+    def test_csv_rows(self):
+        self.assertEqual(list(csv_rows({"type": "stats", "metric": "m", "value": 4})), [("stats", "", "", "m", 4)])
+        rollup = {"type": "rollup", "bucket": None, "tier": "hour", "messages": 5, "voice_minutes": 2}
+        self.assertEqual(list(csv_rows(rollup)), [("rollup", "", "hour", "messages", 5), ("rollup", "", "hour", "voice_minutes", 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
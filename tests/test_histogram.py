@@ -0,0 +1,70 @@
+import math
+import random
+import unittest
+
+from utils.histogram import GROWTH, LogHistogram, bucket_index, bucket_midpoint_ms
+
+
+def exact_percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q / 100 * len(ordered))) - 1]
+
+
+class LogHistogramTest(unittest.TestCase):
+    def test_buckets_grow_geometrically(self):
+        self.assertEqual(bucket_index(0.2), 0)
+        self.assertEqual(bucket_index(1.0), 0)
+        previous = 0
+        for ms in [1.01, 1.5, 2, 10, 100, 1000, 60000]:
+            index = bucket_index(ms)
+            self.assertGreaterEqual(index, previous)
+            previous = index
+            # The midpoint of a value's bucket is within half a bucket of it
+            self.assertLess(abs(math.log(bucket_midpoint_ms(index) / ms, GROWTH)), 0.5 + 1e-9)
+
+    def test_percentiles_within_bucket_error(self):
+        rng = random.Random(1)
+        values = [rng.lognormvariate(4, 1.2) for _ in range(20000)]
+        histogram = LogHistogram()
+        for value in values:
+            histogram.add(value)
+        for q in (50, 90, 95, 99, 99.9):
+            exact = exact_percentile(values, q)
+            estimate = histogram.percentile(q)
+            self.assertLess(abs(estimate - exact) / exact, GROWTH - 1, f"p{q}")
+
+    def test_merge_equals_one_histogram(self):
+        rng = random.Random(2)
+        values = [rng.expovariate(1 / 200) for _ in range(5000)]
+        whole = LogHistogram()
+        parts = [LogHistogram() for _ in range(4)]
+        for i, value in enumerate(values):
+            whole.add(value, error=i % 10 == 0)
+            parts[i % 4].add(value, error=i % 10 == 0)
+        merged = LogHistogram()
+        for part in parts:
+            merged.merge(part)
+        self.assertEqual(merged.buckets, whole.buckets)
+        self.assertEqual(merged.count, whole.count)
+        self.assertEqual(merged.errors, whole.errors)
+        self.assertAlmostEqual(merged.total_ms, whole.total_ms, places=6)
+        self.assertAlmostEqual(merged.error_rate, 0.1)
+
+    def test_round_trip(self):
+        histogram = LogHistogram()
+        for ms in (0.5, 3, 3, 40, 900):
+            histogram.add(ms, error=ms > 100)
+        restored = LogHistogram.from_dict(histogram.to_dict())
+        self.assertEqual(restored.buckets, histogram.buckets)
+        self.assertEqual(restored.percentile(50), histogram.percentile(50))
+        self.assertEqual(restored.errors, 1)
+
+    def test_empty(self):
+        histogram = LogHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean_ms)
+        self.assertEqual(histogram.error_rate, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,268 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import discord
+
+from cogs import music
+from cogs.music import ListeningHistory, Music, MusicPlayer, PlayerResourceManager, TrackQueue, YTDLSource, resolve_cache_key
+
+
+class FakeAudio(discord.AudioSource):
+    def __init__(self, url='', **options):
+        self.url = url
+        self.options = options
+        self.cleaned = False
+
+    def read(self):
+        return b'\0' * 3840
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+class FakeVoiceClient:
+    def __init__(self, source, paused=False):
+        self.source = source
+        self.paused = paused
+
+    def is_paused(self):
+        return self.paused
+
+    def pause(self):
+        self.paused = True
+
+    def __setattr__(self, name, value):
+        # AudioPlayer.set_source resumes playback
+        if name == 'source':
+            object.__setattr__(self, 'paused', False)
+        object.__setattr__(self, name, value)
+
+
+class HelperTest(unittest.TestCase):
+    def test_resolve_cache_key(self):
+        self.assertEqual(resolve_cache_key('  Never Gonna Give You Up '), 'never gonna give you up')
+        self.assertEqual(resolve_cache_key('https://youtu.be/dQw4w9WgXcQ'), 'https://youtu.be/dQw4w9WgXcQ')
+        self.assertEqual(resolve_cache_key('https://example.com/Track.MP3'), 'https://example.com/Track.MP3')
+
+    def test_parse_timestamp(self):
+        self.assertEqual(MusicPlayer.parse_timestamp('90'), 90)
+        self.assertEqual(MusicPlayer.parse_timestamp('1:30'), 90)
+        self.assertEqual(MusicPlayer.parse_timestamp('1:02:03'), 3723)
+        for invalid in ('', 'abc', '1:2:3:4', '-5', '1:-2'):
+            self.assertIsNone(MusicPlayer.parse_timestamp(invalid))
+
+
+class ListeningHistoryTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.db = mock.AsyncMock()
+        patcher = mock.patch.object(music, 'db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.history = ListeningHistory()
+        for title in ('a', 'b'):
+            source = SimpleNamespace(video_id=title, webpage_url=None, title=title, duration=60, requester=None)
+            self.history.record(1, source)
+
+    async def test_failed_counts_are_retried_without_rewriting_history(self):
+        entries = list(self.history.buffer)
+        self.db.increment_track_plays.side_effect = [ConnectionError("down"), None]
+        with self.assertLogs('music', 'ERROR'):
+            await self.history.flush()
+        await self.history.flush()
+
+        self.db.add_music_history.assert_awaited_once_with(entries)
+        self.assertEqual(self.db.increment_track_plays.await_args_list, [mock.call(entries), mock.call(entries)])
+        self.assertEqual(self.history.buffer, [])
+        self.assertEqual(self.history.uncounted, [])
+
+    async def test_failed_history_write_keeps_the_batch(self):
+        entries = list(self.history.buffer)
+        self.db.add_music_history.side_effect = ConnectionError("down")
+        with self.assertLogs('music', 'ERROR'):
+            await self.history.flush()
+        self.assertEqual(self.history.buffer, entries)
+        self.db.increment_track_plays.assert_not_awaited()
+
+
+class TrackQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def test_fifo(self):
+        queue = TrackQueue()
+        for track in 'abc':
+            await queue.put(track)
+        self.assertEqual(queue.qsize(), 3)
+        self.assertEqual([await queue.get() for _ in range(3)], list('abc'))
+        self.assertTrue(queue.empty())
+
+    async def test_get_waits_for_put(self):
+        queue = TrackQueue()
+        waiter = asyncio.create_task(queue.get())
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        queue.put_nowait('a')
+        self.assertEqual(await asyncio.wait_for(waiter, 1), 'a')
+
+
+class PlayerLifecycleTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = mock.Mock()
+        self.db = self.calls.db
+        for name in ('get_player_snapshot', 'delete_player_snapshot', 'set_player_snapshot',
+                     'clear_music_queue', 'clear_current_track'):
+            setattr(self.db, name, mock.AsyncMock())
+        patcher = mock.patch.object(music, 'db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cog = Music.__new__(Music)
+        self.cog.bot = SimpleNamespace(loop=asyncio.get_running_loop())
+        self.cog.players = {}
+        self.cog.resources = PlayerResourceManager(self.cog)
+        self.cog.prefetch_popular_tracks = mock.AsyncMock()
+        self.guild = SimpleNamespace(id=1, voice_client=SimpleNamespace(disconnect=mock.AsyncMock()))
+        self.calls.attach_mock(self.guild.voice_client.disconnect, 'disconnect')
+
+    def make_player(self):
+        player = SimpleNamespace(guild=self.guild, current=object(), cancel_tasks=self.calls.cancel_tasks,
+                                 close_panel=mock.AsyncMock(), snapshot=lambda: {'queue': []})
+        self.cog.players[self.guild.id] = player
+        return player
+
+    async def test_cleanup_cancels_player_before_disconnecting(self):
+        self.make_player()
+        await self.cog.cleanup(self.guild)
+        names = [name for name, _, _ in self.calls.mock_calls]
+        self.assertLess(names.index('cancel_tasks'), names.index('disconnect'))
+        self.assertNotIn(self.guild.id, self.cog.players)
+
+    async def test_evict_clears_redis_queue_after_cleanup(self):
+        player = self.make_player()
+        await self.cog.resources.evict(player)
+        names = [name for name, _, _ in self.calls.mock_calls]
+        self.assertLess(names.index('db.set_player_snapshot'), names.index('cancel_tasks'))
+        self.assertLess(names.index('disconnect'), names.index('db.clear_music_queue'))
+        self.assertEqual(self.cog.resources.evicted, 1)
+
+    async def test_get_player_takes_over_snapshot(self):
+        snapshot = {'queue': [{'title': 'parked'}]}
+        self.db.get_player_snapshot.return_value = snapshot
+        ctx = SimpleNamespace(guild=self.guild)
+        with mock.patch.object(music, 'MusicPlayer') as player_class:
+            player = await self.cog.get_player(ctx)
+            self.assertIs(await self.cog.get_player(ctx), player)
+        player_class.assert_called_once_with(ctx, snapshot=snapshot)
+        self.db.delete_player_snapshot.assert_awaited_once_with('1')
+        self.assertEqual(self.cog.resources.restored, 1)
+
+    async def test_get_player_without_snapshot(self):
+        self.db.get_player_snapshot.return_value = None
+        ctx = SimpleNamespace(guild=self.guild)
+        with mock.patch.object(music, 'MusicPlayer') as player_class:
+            await self.cog.get_player(ctx)
+        player_class.assert_called_once_with(ctx, snapshot=None)
+        self.db.delete_player_snapshot.assert_not_awaited()
+
+
+class PlayerLoopTest(unittest.IsolatedAsyncioTestCase):
+    async def test_panel_error_does_not_end_the_track(self):
+        loop = asyncio.get_running_loop()
+        vc = mock.Mock(is_connected=mock.Mock(return_value=True))
+        player = MusicPlayer.__new__(MusicPlayer)
+        player.bot = SimpleNamespace(loop=loop, wait_until_ready=mock.AsyncMock(), is_closed=lambda: False)
+        player.guild = SimpleNamespace(id=1, voice_client=vc)
+        player.channel = SimpleNamespace(send=mock.AsyncMock())
+        player.cog = SimpleNamespace(history=mock.Mock(), panel_budget=mock.Mock())
+        player.queue = TrackQueue()
+        player.next = asyncio.Event()
+        player.playing = asyncio.Event()
+        player.current = None
+        player.volume = 0.5
+        player.repeat_mode = 'off'
+        player.auto_play = False
+        player.autoplay_task = None
+        player.restore_paused = False
+        player.recently_played = []
+        player.queue.put_nowait({'url': 'http://stream', 'title': 'Song'})
+
+        async def regather_stream(data, *, loop):
+            source = YTDLSource(FakeAudio(data['url']), data=data)
+            source.requester = SimpleNamespace(id=2, display_name='dj')
+            return source
+
+        with mock.patch.object(YTDLSource, 'regather_stream', regather_stream), \
+                mock.patch.object(MusicPlayer, 'update_panel', mock.AsyncMock(side_effect=ValueError("bad embed"))), \
+                mock.patch.object(music, 'db', mock.AsyncMock()):
+            task = loop.create_task(player.player_loop())
+            with self.assertLogs('music', 'ERROR'):
+                await asyncio.wait_for(player.playing.wait(), 1)
+                await asyncio.sleep(0.01)
+            self.assertFalse(player.next.is_set())
+            self.assertFalse(task.done())
+            player.channel.send.assert_not_awaited()
+            vc.play.assert_called_once()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+
+class PlayBatchTest(unittest.IsolatedAsyncioTestCase):
+    async def test_queues_in_request_order(self):
+        delays = {'a': 0.03, 'b': 0.0, 'c': 0.02, 'd': 0.01}
+
+        async def resolve_track(query, requester=None):
+            await asyncio.sleep(delays[query])
+            if query == 'c':
+                raise ValueError('not found')
+            return {'title': query.upper()}
+
+        cog = Music.__new__(Music)
+        cog.resolve_track = resolve_track
+        queue = asyncio.Queue()
+        player = SimpleNamespace(queue=queue, _save_to_queue=mock.AsyncMock())
+        ctx = SimpleNamespace(guild=SimpleNamespace(id=1), author=None, send=mock.AsyncMock())
+
+        with self.assertLogs('music', 'ERROR'):
+            await cog._play_batch(ctx, player, list('abcd'))
+
+        self.assertEqual([queue.get_nowait()['title'] for _ in range(queue.qsize())], ['A', 'B', 'D'])
+        self.assertEqual(player._save_to_queue.await_count, 3)
+        message = ctx.send.await_args.args[0]
+        self.assertIn('Added **3** songs', message)
+        self.assertIn('Could not find: `c`', message)
+
+
+class SeekTest(unittest.IsolatedAsyncioTestCase):
+    def make_player(self, paused):
+        player = MusicPlayer.__new__(MusicPlayer)
+        player.bot = SimpleNamespace(loop=asyncio.get_running_loop())
+        player.volume = 0.5
+        player.current = YTDLSource(FakeAudio('http://stream'), data={'url': 'http://stream', 'title': 'Song'})
+        player.guild = SimpleNamespace(id=1, voice_client=FakeVoiceClient(player.current, paused))
+        return player
+
+    async def seek(self, player, position):
+        with mock.patch.object(discord, 'FFmpegPCMAudio', FakeAudio), mock.patch.object(music, 'SEEK_CLEANUP_DELAY', 0):
+            player.seek(position)
+
+    async def test_seek_keeps_paused_player_paused(self):
+        player = self.make_player(paused=True)
+        await self.seek(player, 30)
+        vc = player.guild.voice_client
+        self.assertTrue(vc.paused)
+        self.assertIs(vc.source, player.current)
+        self.assertEqual(player.current.start_at, 30)
+        self.assertIn('-ss 30.00', player.current.original.options['before_options'])
+
+    async def test_seek_cleans_old_source_later(self):
+        player = self.make_player(paused=False)
+        old = player.current
+        await self.seek(player, 10)
+        self.assertFalse(player.guild.voice_client.paused)
+        self.assertFalse(old.original.cleaned)
+        await asyncio.sleep(0.01)
+        self.assertTrue(old.original.cleaned)
+        self.assertFalse(player.current.original.cleaned)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import random
+import unittest
+from collections import Counter
+
+from utils.rate_window import GuildActivity, RateWindow
+
+
+class RateWindowTest(unittest.TestCase):
+    def test_matches_naive_counts_across_rollovers(self):
+        rng = random.Random(1)
+        size = 10
+        window = RateWindow(size)
+        seen = Counter()
+        second = 1000
+        for _ in range(5000):
+            # Mostly the same or next second, sometimes gaps longer than the ring
+            second += rng.choice([0, 0, 0, 1, 1, 2, 3, 7, 15])
+            window.add(second)
+            seen[second] += 1
+            if rng.random() < 0.1:
+                seconds = rng.randint(1, size)
+                expected = [seen[s] for s in range(second - seconds + 1, second + 1)]
+                self.assertEqual(window.series(second, seconds), expected)
+                self.assertEqual(window.total(second, seconds), sum(expected))
+
+    def test_reading_later_zeroes_skipped_seconds(self):
+        window = RateWindow(5)
+        window.add(100, 3)
+        window.add(101, 2)
+        self.assertEqual(window.series(101), [0, 0, 0, 3, 2])
+        self.assertEqual(window.series(104), [3, 2, 0, 0, 0])
+        self.assertEqual(window.total(105), 2)
+        self.assertEqual(window.total(106), 0)
+
+    def test_gap_longer_than_ring_clears_it(self):
+        window = RateWindow(5)
+        for second in range(100, 105):
+            window.add(second)
+        window.add(200)
+        self.assertEqual(window.series(200), [0, 0, 0, 0, 1])
+
+    def test_old_seconds_are_ignored_by_advance(self):
+        window = RateWindow(5)
+        window.add(100)
+        window.advance(90)
+        self.assertEqual(window.second, 100)
+        self.assertEqual(window.total(100), 1)
+
+
+class GuildActivityTest(unittest.TestCase):
+    def test_busiest_channels_and_prune(self):
+        activity = GuildActivity()
+        for _ in range(3):
+            activity.add(1, 100)
+        activity.add(2, 100)
+        for _ in range(5):
+            activity.add(3, 130)
+        self.assertEqual(activity.busiest_channels(130, n=2), [(3, 5), (1, 3)])
+        self.assertEqual(activity.messages.total(130, 60), 9)
+
+        activity.prune(165)
+        self.assertEqual(set(activity.channels), {3})
+        self.assertEqual(activity.busiest_channels(165), [(3, 5)])
+        # The guild window keeps its longer history
+        self.assertEqual(activity.messages.total(165), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
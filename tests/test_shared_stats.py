@@ -0,0 +1,92 @@
+import unittest
+from unittest import mock
+
+from cogs import statistics
+from cogs.statistics import Statistics
+from utils.database import Database
+from utils.topk import SpaceSaving
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+GUILD = "1"
+
+
+def make_process(name):
+    cog = Statistics.__new__(Statistics)
+    cog.shared_counters = True
+    cog.process_id = name
+    cog.pending_updates = {}
+    cog.counters = {}
+    cog.stats_cache = {GUILD: {}}
+    cog.top_k = {GUILD: {"channels": SpaceSaving(5), "commands": SpaceSaving(5)}}
+    cog.rollup = mock.Mock()
+    return cog
+
+
+def count(cog, messages, channels):
+    cog.increment(GUILD, "messages.total", messages)
+    cog.count_top(GUILD, "channels", channels)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class SharedCountersTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        saved = SpaceSaving(5)
+        saved.update({"10": 100})
+        self.db = Database()
+        self.db.redis_client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer())
+        self.db.get_top_k_sketches = mock.AsyncMock(
+            return_value={GUILD: {"guild_id": GUILD, "top_k": 5, "messages": {"top_channels": saved.to_dict()}}})
+        self.db.update_guild_stats_bulk = mock.AsyncMock()
+        patcher = mock.patch.object(statistics, 'db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def merge_two_processes(self):
+        first, second = make_process("a"), make_process("b")
+        count(first, 4, {"10": 3, "11": 1})
+        count(second, 7, {"10": 2, "12": 5})
+        await first.merge_counters()
+        await second.merge_counters()
+        self.assertEqual(first.pending_updates, {})
+        return first
+
+    async def test_aggregator_merges_counts_into_saved_sketches(self):
+        aggregator = await self.merge_two_processes()
+        await aggregator.save_shared_counters()
+
+        (writes,), _ = self.db.update_guild_stats_bulk.await_args
+        self.assertEqual(writes[GUILD]["$inc"], {"messages.total": 11})
+        channels = SpaceSaving.from_dict(writes[GUILD]["$set"]["messages.top_channels"])
+        self.assertEqual(channels.counts, {"10": 105, "11": 1, "12": 5})
+        self.assertEqual(SpaceSaving.from_dict(writes[GUILD]["$set"]["commands.top_commands"]).counts, {})
+        self.assertEqual(await self.db.pop_shared_stats(), {})
+
+    async def test_failed_sketch_read_returns_counts_to_redis(self):
+        aggregator = await self.merge_two_processes()
+        self.db.get_top_k_sketches.side_effect = ConnectionError("mongo down")
+        with self.assertLogs('bot.statistics', 'ERROR'):
+            await aggregator.save_shared_counters()
+
+        self.db.update_guild_stats_bulk.assert_not_awaited()
+        self.assertEqual(await self.db.pop_shared_stats(), {GUILD: {
+            "$inc": {"messages.total": 11, "top_k:channels:10": 5, "top_k:channels:11": 1, "top_k:channels:12": 5},
+            "$set": {}
+        }})
+
+    async def test_failed_write_returns_deltas_not_sketches(self):
+        aggregator = await self.merge_two_processes()
+        self.db.update_guild_stats_bulk.side_effect = ConnectionError("mongo down")
+        with self.assertLogs('bot.statistics', 'ERROR'):
+            await aggregator.save_shared_counters()
+
+        update = (await self.db.pop_shared_stats())[GUILD]
+        self.assertEqual(update["$inc"]["top_k:channels:10"], 5)
+        self.assertEqual(update["$set"], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
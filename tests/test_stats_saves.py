@@ -0,0 +1,42 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from cogs import statistics
+from cogs.statistics import Statistics
+
+
+class AggregateStatsTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.guild = SimpleNamespace(id=1, member_count=10)
+        self.cog = Statistics.__new__(Statistics)
+        self.cog.bot = SimpleNamespace(guilds=[self.guild])
+        self.cog.stats_cache = {"1": self.cog.new_guild_stats("1")}
+        self.cog.pending_updates = {}
+        self.cog.preload_task = None
+        self.cog.member_counts_ready = True
+        self.db = SimpleNamespace(add_member_counts=mock.AsyncMock())
+        patcher = mock.patch.object(statistics, 'db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def aggregate(self):
+        await self.cog.aggregate_stats_task.coro(self.cog)
+        return self.cog.pending_updates.pop("1", None)
+
+    async def test_only_changed_member_counts_are_queued(self):
+        update = await self.aggregate()
+        self.assertEqual(update["$set"]["member_count.current"], 10)
+        self.assertIn("last_updated", update["$set"])
+
+        # An idle guild with the same member count isn't saved again
+        self.assertIsNone(await self.aggregate())
+
+        self.guild.member_count = 11
+        self.assertEqual((await self.aggregate())["$set"]["member_count.current"], 11)
+        # The history sample is still taken every run
+        self.assertEqual(self.db.add_member_counts.await_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
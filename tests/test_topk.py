@@ -0,0 +1,75 @@
+import random
+import unittest
+from collections import Counter
+
+from utils.topk import SpaceSaving
+
+
+def skewed_stream(n, keys, seed):
+    """Zipf-like stream where key i is roughly twice as common as key i + 1."""
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) ** 1.2 for i in range(keys)]
+    return [f"key{i}" for i in rng.choices(range(keys), weights=weights, k=n)]
+
+
+class SpaceSavingTest(unittest.TestCase):
+    def test_exact_while_keys_fit(self):
+        sketch = SpaceSaving(10)
+        stream = skewed_stream(2000, 8, seed=1)
+        for key in stream:
+            sketch.add(key)
+        self.assertEqual(sketch.counts, dict(Counter(stream)))
+        self.assertTrue(all(error == 0 for error in sketch.errors.values()))
+
+    def test_error_bounds(self):
+        k = 20
+        for seed in range(5):
+            stream = skewed_stream(20000, 500, seed)
+            truth = Counter(stream)
+            sketch = SpaceSaving(k)
+            for key in stream:
+                sketch.add(key)
+
+            self.assertEqual(len(sketch), k)
+            self.assertEqual(sum(sketch.counts.values()), len(stream))
+            for key, count in sketch.counts.items():
+                error = sketch.errors[key]
+                # Counts only overestimate, and by no more than the recorded error
+                self.assertLessEqual(truth[key], count)
+                self.assertLessEqual(count - error, truth[key])
+                self.assertLessEqual(error, len(stream) // k)
+            # Every key seen more than N/k times is guaranteed a slot
+            for key, count in truth.items():
+                if count > len(stream) / k:
+                    self.assertIn(key, sketch.counts)
+
+    def test_top_is_sorted_by_count(self):
+        sketch = SpaceSaving(5)
+        sketch.update({"a": 5, "b": 9, "c": 1, "d": 7})
+        self.assertEqual([key for key, _, _ in sketch.top(3)], ["b", "d", "a"])
+
+    def test_resize_keeps_largest(self):
+        sketch = SpaceSaving(5)
+        sketch.update({"a": 5, "b": 9, "c": 1, "d": 7, "e": 3})
+        sketch.resize(2)
+        self.assertEqual(sketch.counts, {"b": 9, "d": 7})
+        sketch.add("f")
+        # The new key takes the minimum slot and inherits its count as error
+        self.assertEqual(sketch.counts["f"], 8)
+        self.assertEqual(sketch.errors["f"], 7)
+
+    def test_round_trip_continues_identically(self):
+        stream = skewed_stream(3000, 100, seed=3)
+        original = SpaceSaving(10)
+        for key in stream[:1500]:
+            original.add(key)
+        restored = SpaceSaving.from_dict(original.to_dict())
+        for key in stream[1500:]:
+            original.add(key)
+            restored.add(key)
+        self.assertEqual(original.counts, restored.counts)
+        self.assertEqual(original.errors, restored.errors)
+
+
+if __name__ == '__main__':
+    unittest.main()
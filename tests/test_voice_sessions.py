@@ -0,0 +1,68 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from cogs import statistics
+from cogs.statistics import VOICE_RECONCILE_ATTEMPTS, Statistics, VoiceSessions
+
+
+def make_cog():
+    state = SimpleNamespace(self_mute=False, mute=False, self_deaf=False, deaf=False)
+    member = SimpleNamespace(id=7, bot=False, voice=state)
+    guild = SimpleNamespace(id=1, voice_channels=[SimpleNamespace(id=3, members=[member])])
+    cog = Statistics.__new__(Statistics)
+    cog.bot = SimpleNamespace(guilds=[guild])
+    cog.voice = VoiceSessions()
+    cog.voice_resume = None
+    cog.stats_cache = {"1": cog.new_guild_stats("1")}
+    cog.pending_updates = {}
+    cog.preload_task = None
+    cog.rollup = mock.Mock()
+    return cog
+
+
+class ReconcileVoiceTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.db = SimpleNamespace(get_voice_sessions=mock.AsyncMock(side_effect=ConnectionError("down")),
+                                  save_voice_sessions=mock.AsyncMock())
+        patchers = [mock.patch.object(statistics, 'db', self.db),
+                    mock.patch.object(statistics.asyncio, 'sleep', mock.AsyncMock())]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cog = make_cog()
+
+    async def test_checkpoint_loop_runs_while_redis_is_down(self):
+        with self.assertLogs('bot.statistics', 'WARNING'):
+            await self.cog.reconcile_voice_sessions()
+        self.assertEqual(self.db.get_voice_sessions.await_count, VOICE_RECONCILE_ATTEMPTS)
+        self.assertIn((1, 7), self.cog.voice.sessions)
+
+        session = self.cog.voice.sessions[(1, 7)]
+        session.started -= 120
+        await self.cog.voice_checkpoint_task.coro(self.cog)
+        # Open sessions are still credited, but old checkpoints aren't overwritten
+        self.assertAlmostEqual(self.cog.stats_cache["1"]["voice"]["total_minutes"], 2, places=1)
+        self.db.save_voice_sessions.assert_not_awaited()
+
+        # Once Redis answers the startup sessions are backdated and checkpoints saved again
+        self.db.get_voice_sessions.side_effect = None
+        self.db.get_voice_sessions.return_value = {"1": {"7": f"3:0:{time.time() - 300:.0f}"}}
+        await self.cog.voice_checkpoint_task.coro(self.cog)
+        self.assertIsNone(self.cog.voice_resume)
+        self.assertGreaterEqual(time.monotonic() - session.started, 299)
+        self.db.save_voice_sessions.assert_awaited_once()
+
+    async def test_reconcile_resumes_on_first_read(self):
+        self.db.get_voice_sessions.side_effect = None
+        self.db.get_voice_sessions.return_value = {"1": {"7": f"4:0:{time.time() - 300:.0f}"}}
+        await self.cog.reconcile_voice_sessions()
+        self.assertIsNone(self.cog.voice_resume)
+        # A checkpoint from another channel isn't resumed
+        self.assertLess(time.monotonic() - self.cog.voice.sessions[(1, 7)].started, 5)
+        self.assertEqual(self.cog.voice.checkpointed_guilds, {"1"})
+
+
+if __name__ == '__main__':
+    unittest.main()
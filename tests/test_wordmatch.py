@@ -0,0 +1,77 @@
+import random
+import re
+import unittest
+from unittest import mock
+
+from cogs.automod import AutoMod
+from utils.wordmatch import BannedWordMatcher
+
+WORDS = ["bad", "badger", "badge", "ba", "b", "bad word", "bad words", "c++", "a.b", "x|y", "café", "n00b", "foo_bar"]
+FILLER = ["", " ", "  ", ".", ",", "!", "-", "_", "a", "s", "x", "y", "+", "|", "\n", "1", "B", "AD"]
+
+
+def naive_matches(words, text):
+    return [word for word in words if re.search(rf"\b{re.escape(word)}\b", text, re.IGNORECASE)]
+
+
+class BannedWordMatcherTest(unittest.TestCase):
+    def test_agrees_with_per_word_search(self):
+        rng = random.Random(7)
+        for _ in range(3000):
+            words = rng.sample(WORDS, rng.randint(1, len(WORDS)))
+            matcher = BannedWordMatcher(words)
+            pieces = [rng.choice(WORDS + FILLER) for _ in range(rng.randint(0, 6))]
+            text = "".join(rng.choice([p, p.upper()]) + rng.choice(FILLER) for p in pieces)
+            found = matcher.search(text)
+            expected = naive_matches(words, text)
+            with self.subTest(words=words, text=text):
+                self.assertEqual(found is not None, bool(expected))
+                if found is not None:
+                    self.assertIn(found, [word.lower() for word in words])
+                    self.assertTrue(re.search(rf"\b{re.escape(found)}\b", text, re.IGNORECASE))
+
+    def test_whole_words_only(self):
+        matcher = BannedWordMatcher(["bad", "bad word"])
+        self.assertIsNone(matcher.search("badly done"))
+        self.assertIsNone(matcher.search("abad"))
+        self.assertEqual(matcher.search("so BAD."), "bad")
+        self.assertEqual(matcher.search("a Bad Word here"), "bad word")
+
+    def test_empty_list(self):
+        matcher = BannedWordMatcher(["", ""])
+        self.assertIsNone(matcher.regex)
+        self.assertIsNone(matcher.search("anything"))
+
+
+class WordMatcherCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cog = AutoMod.__new__(AutoMod)
+        self.cog.word_matchers = {}
+        self.cog.update_automod_config = mock.AsyncMock()
+
+    async def test_matcher_is_reused_until_the_list_changes(self):
+        config = {"banned_words": ["bad"]}
+        matcher = self.cog.get_word_matcher(1, config)
+        self.assertIs(self.cog.get_word_matcher(1, dict(config)), matcher)
+
+        # A change saved by any process bumps the version stored with the list
+        changed = {"banned_words": ["bad"], "banned_words_version": 1}
+        self.assertIsNot(self.cog.get_word_matcher(1, changed), matcher)
+        # A direct edit that changes the length is noticed too
+        edited = {"banned_words": ["bad", "worse"], "banned_words_version": 1}
+        self.assertEqual(self.cog.get_word_matcher(1, edited).search("even worse"), "worse")
+
+    async def test_saving_the_list_bumps_version_and_drops_matcher(self):
+        config = {"banned_words": ["bad"], "banned_words_version": 3}
+        self.cog.get_word_matcher(1, config)
+        config["banned_words"][0] = "good"
+        await self.cog.save_banned_words(1, config)
+
+        self.assertEqual(config["banned_words_version"], 4)
+        self.assertNotIn(1, self.cog.word_matchers)
+        self.cog.update_automod_config.assert_awaited_once_with(1, config)
+        self.assertEqual(self.cog.get_word_matcher(1, config).search("so good"), "good")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Chart rendering for the statistics commands.
+
+The render functions take plain lists and tuples and return PNG bytes, so they
+can run in a worker process (see ``Statistics.render_chart``) without touching
+the event loop. matplotlib is imported inside the worker only.
+"""
+import io
+
+EMBED_BLUE = "#3498db"
+FIGURE_SIZE = (8, 3.5)
+DPI = 100
+
+
+def _figure():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    return plt, fig, ax
+
+
+def _to_png(plt, fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_hourly_activity(by_hour) -> bytes:
+    """Bar chart of messages per UTC hour (24 counts)."""
+    plt, fig, ax = _figure()
+    ax.bar(range(24), by_hour, color=EMBED_BLUE)
+    ax.set_xticks(range(0, 24, 2))
+    ax.set_xlabel("Hour (UTC)")
+    ax.set_ylabel("Messages")
+    ax.set_title("Messages by hour")
+    return _to_png(plt, fig)
+
+
+def render_member_growth(points) -> bytes:
+    """Line chart of member count over time from (timestamp, count) pairs."""
+    plt, fig, ax = _figure()
+    if points:
+        timestamps, counts = zip(*points)
+        ax.plot(timestamps, counts, color=EMBED_BLUE, linewidth=2)
+        ax.fill_between(timestamps, counts, min(counts), color=EMBED_BLUE, alpha=0.15)
+        fig.autofmt_xdate()
+    ax.set_ylabel("Members")
+    ax.set_title("Member count")
+    return _to_png(plt, fig)
+
+
+def render_voice_by_channel(channels) -> bytes:
+    """Horizontal bar chart of voice hours from (channel name, minutes) pairs."""
+    plt, fig, ax = _figure()
+    if channels:
+        names, minutes = zip(*reversed(channels))
+        ax.barh(names, [m / 60 for m in minutes], color=EMBED_BLUE)
+    ax.set_xlabel("Hours")
+    ax.set_title("Voice time by channel")
+    return _to_png(plt, fig)
+
+
+def render_trend(points) -> bytes:
+    """Bar chart of messages per rolled up bucket from (label, messages) pairs."""
+    plt, fig, ax = _figure()
+    if points:
+        labels, messages = zip(*points)
+        ax.bar(range(len(labels)), messages, color=EMBED_BLUE)
+        step = max(1, len(labels) // 8)
+        ax.set_xticks(range(0, len(labels), step))
+        ax.set_xticklabels(labels[::step])
+    ax.set_ylabel("Messages")
+    ax.set_title("Message trend")
+    return _to_png(plt, fig)
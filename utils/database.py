@@ -1,14 +1,50 @@
 import datetime
 import json
 import logging
-from typing import Dict, List, Optional
-from datetime import datetime, UTC
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, UTC
 
 import motor.motor_asyncio
-import redis.asyncio as redis
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+
+from utils.metrics import MongoCommandTimer, TimedRedis
 
 logger = logging.getLogger('bot.database')
 
+# Sliding windows kept as per-second counters in a hash, one field per second.
+# KEYS are the windows, ARGV holds (window seconds, amount to add) per key.
+# Seconds come from the Redis clock so every bot process agrees on them.
+SLIDING_WINDOW_SCRIPT = """
+local second = tonumber(redis.call('TIME')[1])
+local totals = {}
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[2 * i - 1])
+    local amount = tonumber(ARGV[2 * i])
+    if amount > 0 then
+        redis.call('HINCRBY', key, second, amount)
+    end
+    local total = 0
+    local expired = {}
+    local fields = redis.call('HGETALL', key)
+    for j = 1, #fields, 2 do
+        if tonumber(fields[j]) <= second - window then
+            expired[#expired + 1] = fields[j]
+        else
+            total = total + tonumber(fields[j + 1])
+        end
+    end
+    if #expired > 0 then
+        redis.call('HDEL', key, unpack(expired))
+    end
+    if total > 0 then
+        redis.call('EXPIRE', key, window + 1)
+    end
+    totals[i] = total
+end
+return totals
+"""
+
 class Database:
     """Database connection manager for MongoDB and Redis"""
     
@@ -17,16 +53,17 @@ class Database:
         self.mongo_db = None
         self.redis_client = None
         self.connected = False
+        self.sliding_window_script = None  # Registered on first use
     
     async def connect(self, mongo_uri: str, redis_uri: str, db_name: str = "discord_bot"):
         """Connect to MongoDB and Redis"""
         try:
             # Connect to MongoDB
-            self.mongo_client = motor.motor_asyncio.AsyncIOMotorClient(mongo_uri)
+            self.mongo_client = motor.motor_asyncio.AsyncIOMotorClient(mongo_uri, event_listeners=[MongoCommandTimer()])
             self.mongo_db = self.mongo_client[db_name]
             
             # Connect to Redis
-            self.redis_client = await redis.from_url(redis_uri)
+            self.redis_client = await TimedRedis.from_url(redis_uri)
             
             # Test connections
             await self.mongo_db.command('ping')
@@ -82,10 +119,18 @@ class Database:
         """Delete multiple documents from MongoDB"""
         return await self.mongo_db[collection].delete_many(query)
     
+    async def bulk_write(self, collection: str, operations: List, ordered: bool = False):
+        """Execute a batch of write operations in MongoDB"""
+        return await self.mongo_db[collection].bulk_write(operations, ordered=ordered)
+    
+    async def create_index(self, collection: str, keys, **kwargs):
+        """Create an index on a MongoDB collection if it does not exist"""
+        return await self.mongo_db[collection].create_index(keys, **kwargs)
+    
     # Redis operations
-    async def redis_set(self, key: str, value: str, ex: Optional[int] = None):
-        """Set a key-value pair in Redis with optional expiration"""
-        return await self.redis_client.set(key, value, ex=ex)
+    async def redis_set(self, key: str, value: str, ex: Optional[int] = None, nx: bool = False):
+        """Set a key-value pair in Redis with optional expiration (only if missing when nx is set)"""
+        return await self.redis_client.set(key, value, ex=ex, nx=nx)
     
     async def redis_get(self, key: str) -> Optional[str]:
         """Get a value from Redis by key"""
@@ -96,6 +141,16 @@ class Database:
         """Delete a key from Redis"""
         return await self.redis_client.delete(key)
     
+    async def count_sliding_windows(self, windows: List[Tuple[str, int, int]]) -> List[int]:
+        """Add to several sliding windows and return their totals, atomically in one call.
+        windows holds (key, window seconds, amount to add) triples.
+        """
+        if self.sliding_window_script is None:
+            self.sliding_window_script = self.redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+        keys = [key for key, _, _ in windows]
+        args = [value for _, seconds, amount in windows for value in (int(seconds), int(amount))]
+        return [int(total) for total in await self.sliding_window_script(keys=keys, args=args)]
+    
     async def redis_exists(self, key: str) -> bool:
         """Check if a key exists in Redis"""
         return await self.redis_client.exists(key) > 0
@@ -216,6 +271,35 @@ class Database:
         current_key = f"music:current:{guild_id}"
         return await self.redis_delete(current_key)
     
+    # Autoplay related tracks
+    async def get_related_tracks(self, video_id: str) -> Optional[List[Dict]]:
+        """Get the cached related tracks for a video"""
+        related_key = f"music:related:{video_id}"
+        related_json = await self.redis_get(related_key)
+        return json.loads(related_json) if related_json else None
+    
+    async def set_related_tracks(self, video_id: str, tracks: List[Dict], ex: int = 21600):
+        """Cache the related tracks for a video with expiration"""
+        related_key = f"music:related:{video_id}"
+        return await self.redis_set(related_key, json.dumps(tracks), ex=ex)
+    
+    # Evicted player snapshots
+    async def set_player_snapshot(self, guild_id: str, snapshot: Dict, ex: int = 86400):
+        """Store the state of an evicted player with expiration"""
+        snapshot_key = f"music:snapshot:{guild_id}"
+        return await self.redis_set(snapshot_key, json.dumps(snapshot), ex=ex)
+    
+    async def get_player_snapshot(self, guild_id: str) -> Optional[Dict]:
+        """Get the state of an evicted player"""
+        snapshot_key = f"music:snapshot:{guild_id}"
+        snapshot_json = await self.redis_get(snapshot_key)
+        return json.loads(snapshot_json) if snapshot_json else None
+    
+    async def delete_player_snapshot(self, guild_id: str):
+        """Delete the state of an evicted player"""
+        snapshot_key = f"music:snapshot:{guild_id}"
+        return await self.redis_delete(snapshot_key)
+    
     # Server settings
     async def get_music_settings(self, guild_id: str) -> Dict:
         """Get music settings for a guild"""
@@ -308,6 +392,58 @@ class Database:
             }
         )
     
+    # Listening history
+    async def ensure_music_history_indexes(self, retention_days: int = 30):
+        """Create the TTL and lookup indexes used by the listening history"""
+        await self.create_index("music_history", [("played_at", ASCENDING)],
+                                expireAfterSeconds=retention_days * 86400)
+        await self.create_index("music_history", [("guild_id", ASCENDING), ("played_at", DESCENDING)])
+        await self.create_index("music_top_tracks", [("guild_id", ASCENDING), ("period", ASCENDING), ("track_id", ASCENDING)],
+                                unique=True)
+        await self.create_index("music_top_tracks", [("guild_id", ASCENDING), ("period", ASCENDING), ("plays", DESCENDING)])
+        # Weekly aggregates carry an expiry date, all-time ones don't and are kept
+        await self.create_index("music_top_tracks", [("expires_at", ASCENDING)], expireAfterSeconds=0)
+    
+    async def add_music_history(self, entries: List[Dict]):
+        """Append played tracks to the listening history"""
+        return await self.mongo_db["music_history"].insert_many(entries, ordered=False)
+    
+    async def increment_track_plays(self, entries: List[Dict]):
+        """Fold played tracks into the weekly and all-time play count aggregates"""
+        counts = {}
+        for entry in entries:
+            week = entry["played_at"].strftime("%G-W%V")
+            for period in (week, "all"):
+                key = (entry["guild_id"], period, entry["track_id"])
+                if key not in counts:
+                    counts[key] = [0, entry, week]
+                counts[key][0] += 1
+        
+        operations = []
+        for (guild_id, period, track_id), (plays, entry, week) in counts.items():
+            update = {
+                "$inc": {"plays": plays},
+                "$set": {"title": entry["title"], "url": entry["url"], "last_played": entry["played_at"]}
+            }
+            if period != "all":
+                # Weekly aggregates expire five weeks after their last play
+                update["$set"]["expires_at"] = entry["played_at"] + timedelta(days=35)
+            operations.append(UpdateOne(
+                {"guild_id": guild_id, "period": period, "track_id": track_id},
+                update,
+                upsert=True
+            ))
+        
+        if operations:
+            return await self.bulk_write("music_top_tracks", operations)
+    
+    async def get_top_tracks(self, guild_id: str, period: str, limit: int = 10) -> List[Dict]:
+        """Get the most played tracks of a guild for a period (ISO week or "all")"""
+        cursor = self.mongo_db["music_top_tracks"].find(
+            {"guild_id": guild_id, "period": period}
+        ).sort("plays", DESCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+    
     # Statistics-related methods
     async def get_guild_stats(self, guild_id: str) -> Optional[Dict]:
         """Get statistics for a guild"""
@@ -322,10 +458,308 @@ class Database:
             upsert=True
         )
     
+    async def create_guild_stats(self, guild_id: str, stats: Dict):
+        """Insert initial statistics for a guild without overwriting existing ones"""
+        return await self.update_one(
+            "guild_stats",
+            {"guild_id": guild_id},
+            {"$setOnInsert": stats},
+            upsert=True
+        )
+    
+    async def ensure_guild_stats_index(self):
+        """Create the unique guild index that makes concurrent inserts of the same guild safe"""
+        await self.create_index("guild_stats", [("guild_id", ASCENDING)], unique=True)
+    
+    async def iter_guild_stats(self, guild_ids: List[str], batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Stream the statistics of several guilds from a single query"""
+        cursor = self.mongo_db["guild_stats"].find({"guild_id": {"$in": guild_ids}}, batch_size=batch_size)
+        async for stats in cursor:
+            yield stats
+    
+    async def get_top_k_sketches(self, guild_ids: List[str]) -> Dict[str, Dict]:
+        """Get the saved top channel and command sketches of several guilds, keyed by guild id"""
+        cursor = self.mongo_db["guild_stats"].find(
+            {"guild_id": {"$in": guild_ids}},
+            {"guild_id": 1, "top_k": 1, "messages.top_channels": 1, "commands.top_commands": 1}
+        )
+        return {stats["guild_id"]: stats async for stats in cursor}
+    
+    async def create_guild_stats_many(self, documents: List[Dict]) -> int:
+        """Insert initial statistics for several guilds, skipping guilds another process already created.
+        Returns the number of documents inserted.
+        """
+        if not documents:
+            return 0
+        try:
+            result = await self.mongo_db["guild_stats"].insert_many(documents, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Duplicate key errors only mean the guild exists already
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details.get("nInserted", 0)
+    
+    async def update_guild_stats_bulk(self, updates: Dict[str, Dict]):
+        """Apply $inc/$set updates to the statistics of several guilds in one bulk write"""
+        operations = []
+        for guild_id, update in updates.items():
+            update = {operator: fields for operator, fields in update.items() if fields}
+            if update:
+                operations.append(UpdateOne({"guild_id": guild_id}, update, upsert=True))
+        
+        if operations:
+            return await self.bulk_write("guild_stats", operations)
+    
+    async def push_shared_stats(self, updates: Dict[str, Dict]):
+        """Merge statistics deltas into the Redis counters shared by all bot processes"""
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            for guild_id, update in updates.items():
+                for path, amount in update["$inc"].items():
+                    if isinstance(amount, int):
+                        pipe.hincrby(f"stats:inc:{guild_id}", path, amount)
+                    else:
+                        pipe.hincrbyfloat(f"stats:inc:{guild_id}", path, amount)
+                for path, value in update["$set"].items():
+                    pipe.hset(f"stats:set:{guild_id}", path, json.dumps(value))
+                pipe.sadd("stats:dirty", guild_id)
+            await pipe.execute()
+    
+    async def pop_shared_stats(self) -> Dict[str, Dict]:
+        """Take all pending statistics deltas out of Redis"""
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.smembers("stats:dirty")
+            pipe.delete("stats:dirty")
+            members, _ = await pipe.execute()
+        guild_ids = [member.decode('utf-8') for member in members]
+        if not guild_ids:
+            return {}
+        
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            for guild_id in guild_ids:
+                pipe.hgetall(f"stats:inc:{guild_id}")
+                pipe.hgetall(f"stats:set:{guild_id}")
+                pipe.delete(f"stats:inc:{guild_id}", f"stats:set:{guild_id}")
+            results = await pipe.execute()
+        
+        def number(value):
+            try:
+                return int(value)
+            except ValueError:
+                return float(value)
+        
+        updates = {}
+        for i, guild_id in enumerate(guild_ids):
+            increments, values = results[i * 3], results[i * 3 + 1]
+            updates[guild_id] = {
+                "$inc": {k.decode('utf-8'): number(v) for k, v in increments.items()},
+                "$set": {k.decode('utf-8'): json.loads(v) for k, v in values.items()}
+            }
+        return updates
+    
+    # Statistics rollups
+    async def ensure_stats_rollup_indexes(self):
+        """Create the bucket and expiry indexes of the statistics rollups"""
+        await self.create_index("stats_rollups", [("guild_id", ASCENDING), ("tier", ASCENDING), ("bucket", ASCENDING)],
+                                unique=True)
+        await self.create_index("stats_rollups", [("tier", ASCENDING), ("bucket", ASCENDING)])
+        # Each bucket carries its own expiry date so every tier can have its own retention
+        await self.create_index("stats_rollups", [("expires_at", ASCENDING)], expireAfterSeconds=0)
+    
+    async def increment_stats_rollups(self, tier: str, bucket: datetime, totals: Dict[str, Dict],
+                                      expires_at: Optional[datetime] = None):
+        """Add per-guild totals ({guild_id: {metric: amount}}) to one bucket of a tier"""
+        operations = [
+            UpdateOne(
+                {"guild_id": guild_id, "tier": tier, "bucket": bucket},
+                {"$inc": metrics, "$set": {"expires_at": expires_at}},
+                upsert=True
+            )
+            for guild_id, metrics in totals.items() if metrics
+        ]
+        if operations:
+            return await self.bulk_write("stats_rollups", operations)
+    
+    async def set_stats_rollups(self, tier: str, buckets: Dict[tuple, Dict], expires_at):
+        """Write rolled up totals ({(guild_id, bucket): {metric: amount}}), replacing earlier runs"""
+        operations = [
+            UpdateOne(
+                {"guild_id": guild_id, "tier": tier, "bucket": bucket},
+                {"$set": dict(metrics, expires_at=expires_at(tier, bucket))},
+                upsert=True
+            )
+            for (guild_id, bucket), metrics in buckets.items()
+        ]
+        if operations:
+            return await self.bulk_write("stats_rollups", operations)
+    
+    async def get_stats_rollups(self, tier: str, start: datetime, end: datetime,
+                                guild_id: Optional[str] = None) -> List[Dict]:
+        """Get the buckets of a tier starting in [start, end), for one guild or all of them"""
+        query = {"tier": tier, "bucket": {"$gte": start, "$lt": end}}
+        if guild_id:
+            query["guild_id"] = guild_id
+        cursor = self.mongo_db["stats_rollups"].find(query, {"_id": 0, "expires_at": 0}).sort("bucket", ASCENDING)
+        return await cursor.to_list(length=None)
+    
+    async def iter_stats_rollups(self, guild_id: str, batch_size: int = 1000) -> AsyncIterator[Dict]:
+        """Stream every rollup bucket of a guild, by tier and then time"""
+        cursor = self.mongo_db["stats_rollups"].find(
+            {"guild_id": guild_id}, {"_id": 0, "guild_id": 0, "expires_at": 0}, batch_size=batch_size
+        ).sort([("tier", ASCENDING), ("bucket", ASCENDING)])
+        async for bucket in cursor:
+            yield bucket
+    
+    async def get_rollup_watermark(self, tier: str) -> Optional[datetime]:
+        """Get the time up to which a tier has been rolled up"""
+        state = await self.find_one("stats_rollup_state", {"_id": tier})
+        return state["rolled_until"] if state else None
+    
+    async def set_rollup_watermark(self, tier: str, rolled_until: datetime):
+        """Record the time up to which a tier has been rolled up"""
+        return await self.update_one("stats_rollup_state", {"_id": tier},
+                                     {"$max": {"rolled_until": rolled_until}}, upsert=True)
+    
+    # Command latency
+    async def ensure_command_latency_indexes(self):
+        """Create the lookup and expiry indexes of the hourly command latency histograms"""
+        await self.create_index("command_latency", [("hour", ASCENDING), ("command", ASCENDING)], unique=True)
+        await self.create_index("command_latency", [("expires_at", ASCENDING)], expireAfterSeconds=0)
+    
+    async def add_command_latency(self, hour: datetime, histograms: Dict[str, Dict], expires_at: datetime):
+        """Add histograms ({command: {buckets, count, errors, total_ms}}) to an hour's totals"""
+        operations = []
+        for command, histogram in histograms.items():
+            increments = {f"buckets.{index}": count for index, count in histogram["buckets"].items()}
+            increments.update(count=histogram["count"], errors=histogram["errors"], total_ms=histogram["total_ms"])
+            operations.append(UpdateOne(
+                {"hour": hour, "command": command},
+                {"$inc": increments, "$set": {"expires_at": expires_at}},
+                upsert=True
+            ))
+        if operations:
+            return await self.bulk_write("command_latency", operations)
+    
+    async def get_command_latency(self, since: datetime, command: Optional[str] = None) -> List[Dict]:
+        """Get the hourly latency histograms since a time, for one command or all of them"""
+        query = {"hour": {"$gte": since.replace(minute=0, second=0, microsecond=0)}}
+        if command:
+            query["command"] = command
+        return await self.find_many("command_latency", query)
+    
+    async def add_active_users(self, day: str, users: Dict[str, set], ex: int = 31 * 86400):
+        """Add user IDs to each guild's HyperLogLog of active users for a day (YYYY-MM-DD)"""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for guild_id, user_ids in users.items():
+                key = f"stats:active:{guild_id}:{day}"
+                pipe.pfadd(key, *user_ids)
+                pipe.expire(key, ex)
+            await pipe.execute()
+    
+    async def count_active_users(self, guild_id: str, days: List[str]) -> int:
+        """Approximate number of distinct active users over the given days"""
+        # PFCOUNT over several keys merges them server side without storing the union
+        return await self.redis_client.pfcount(*[f"stats:active:{guild_id}:{day}" for day in days])
+    
+    async def save_voice_sessions(self, sessions: Dict[str, Dict[str, str]], cleared=(), ex: int = 3600):
+        """Checkpoint open voice sessions per guild, dropping guilds that no longer have any"""
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            for guild_id in cleared:
+                pipe.delete(f"stats:voice:{guild_id}")
+            for guild_id, members in sessions.items():
+                key = f"stats:voice:{guild_id}"
+                pipe.delete(key)
+                pipe.hset(key, mapping=members)
+                pipe.expire(key, ex)
+            await pipe.execute()
+    
+    async def get_voice_sessions(self, guild_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        """Get the checkpointed voice sessions of several guilds"""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for guild_id in guild_ids:
+                pipe.hgetall(f"stats:voice:{guild_id}")
+            results = await pipe.execute()
+        return {
+            guild_id: {k.decode('utf-8'): v.decode('utf-8') for k, v in result.items()}
+            for guild_id, result in zip(guild_ids, results) if result
+        }
+    
     async def delete_guild_stats(self, guild_id: str):
         """Delete statistics for a guild"""
+        await self.delete_many("member_counts", {"guild_id": guild_id})
+        await self.delete_many("stats_rollups", {"guild_id": guild_id})
+        await self.redis_client.delete(f"stats:inc:{guild_id}", f"stats:set:{guild_id}")
+        today = datetime.now(UTC)
+        await self.redis_client.delete(*[
+            f"stats:active:{guild_id}:{(today - timedelta(days=i)).strftime('%Y-%m-%d')}" for i in range(32)
+        ])
         return await self.delete_one("guild_stats", {"guild_id": guild_id})
     
+    # Member count history
+    async def ensure_member_counts_collection(self, retention_days: int = 30):
+        """Create the member count time-series collection if it doesn't exist"""
+        try:
+            await self.mongo_db.create_collection(
+                "member_counts",
+                timeseries={"timeField": "timestamp", "metaField": "guild_id", "granularity": "minutes"},
+                expireAfterSeconds=retention_days * 86400
+            )
+        except CollectionInvalid:
+            # Already created
+            pass
+        except OperationFailure:
+            # Time-series collections need MongoDB 5.0, fall back to a plain collection
+            logger.warning("Time-series collections unavailable, storing member counts in a regular collection")
+            await self.create_index("member_counts", [("timestamp", ASCENDING)],
+                                    expireAfterSeconds=retention_days * 86400)
+            await self.create_index("member_counts", [("guild_id", ASCENDING), ("timestamp", ASCENDING)])
+    
+    async def add_member_counts(self, entries: List[Dict]):
+        """Append member count samples ({guild_id, count, timestamp})"""
+        return await self.mongo_db["member_counts"].insert_many(entries, ordered=False)
+    
+    async def get_member_count_history(self, guild_id: str, since: Optional[datetime] = None,
+                                       until: Optional[datetime] = None, limit: int = 0,
+                                       newest_first: bool = False) -> List[Dict]:
+        """Get member count samples for a guild within a time range"""
+        query = {"guild_id": guild_id}
+        if since or until:
+            query["timestamp"] = {}
+            if since:
+                query["timestamp"]["$gte"] = since
+            if until:
+                query["timestamp"]["$lt"] = until
+        cursor = self.mongo_db["member_counts"].find(query, {"_id": 0}).sort(
+            "timestamp", DESCENDING if newest_first else ASCENDING
+        ).limit(limit)
+        return await cursor.to_list(length=limit or None)
+    
+    async def iter_member_count_history(self, guild_id: str, batch_size: int = 1000) -> AsyncIterator[Dict]:
+        """Stream all member count samples of a guild, oldest first"""
+        cursor = self.mongo_db["member_counts"].find(
+            {"guild_id": guild_id}, {"_id": 0, "guild_id": 0}, batch_size=batch_size
+        ).sort("timestamp", ASCENDING)
+        async for sample in cursor:
+            yield sample
+    
+    async def migrate_member_count_history(self, guild_id: str, history: List[Dict]):
+        """Move the history array embedded in a guild_stats document into member_counts"""
+        entries = [
+            {
+                "guild_id": guild_id,
+                "count": entry["count"],
+                "timestamp": datetime.fromisoformat(entry["timestamp"])
+            }
+            for entry in history
+        ]
+        if entries:
+            await self.add_member_counts(entries)
+        return await self.update_one(
+            "guild_stats",
+            {"guild_id": guild_id},
+            {"$unset": {"member_count.history": ""}}
+        )
+    
     async def get_stats_summary(self, guild_id: str) -> Dict:
         """Get a summary of statistics for a guild"""
         stats = await self.get_guild_stats(guild_id)
@@ -0,0 +1,94 @@
+"""Incremental export of guild statistics as gzipped CSV or NDJSON.
+
+Records are compressed as they are written, into a temporary file that only
+moves to disk past a small size. A part is closed and handed out as soon as it
+nears the attachment size limit, so an export never holds more than one part
+and each part is a complete gzip file on its own.
+"""
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+EXPORT_FORMATS = {"csv": "csv", "json": "ndjson"}  # Format -> file extension
+CSV_COLUMNS = ("type", "timestamp", "tier", "metric", "value")
+ROLLUP_COLUMNS = ("messages", "commands", "voice_minutes")
+SPOOL_SIZE = 1024 * 1024  # Parts stay in memory up to this size, then move to a temporary file
+PART_MARGIN = 512 * 1024  # Room left under the limit for data still buffered in the compressor
+
+
+def _timestamp(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else (value or "")
+
+
+def csv_rows(record: Dict) -> Iterator[Tuple]:
+    """Long-format CSV rows of a record, one per value."""
+    kind = record["type"]
+    if kind == "stats":
+        yield kind, "", "", record["metric"], record["value"]
+    elif kind == "member_count":
+        yield kind, _timestamp(record["timestamp"]), "", "members", record["count"]
+    elif kind == "rollup":
+        for metric in ROLLUP_COLUMNS:
+            if metric in record:
+                yield kind, _timestamp(record["bucket"]), record["tier"], metric, record[metric]
+
+
+class ExportWriter:
+    """Writes records into gzipped parts of at most max_bytes each."""
+
+    def __init__(self, fmt: str, name: str, max_bytes: int):
+        self.fmt = fmt
+        self.name = name
+        self.max_bytes = max(max_bytes - PART_MARGIN, PART_MARGIN)
+        self.parts = 0
+        self.records = 0
+        self.part_records = 0
+        self._open()
+
+    def _open(self):
+        self.raw = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self.text = io.TextIOWrapper(gzip.GzipFile(fileobj=self.raw, mode="wb"), encoding="utf-8", newline="")
+        self.csv = None
+        if self.fmt == "csv":
+            self.csv = csv.writer(self.text)
+            self.csv.writerow(CSV_COLUMNS)
+        self.part_records = 0
+
+    def write(self, record: Dict) -> Optional[Tuple[str, object]]:
+        """Add a record. Returns a finished (filename, file) part once the current one is full."""
+        if self.csv:
+            self.csv.writerows(csv_rows(record))
+        else:
+            self.text.write(json.dumps(record, default=_timestamp) + "\n")
+        self.records += 1
+        self.part_records += 1
+        if self.raw.tell() >= self.max_bytes:
+            part = self._close_part()
+            self._open()
+            return part
+        return None
+
+    def finish(self) -> Optional[Tuple[str, object]]:
+        """The last part, or None when nothing was written since the previous one."""
+        if not self.part_records and self.parts:
+            self.text.close()
+            self.raw.close()
+            return None
+        return self._close_part()
+
+    def close(self):
+        """Discard the part being written."""
+        if not self.text.closed:
+            self.text.close()
+        self.raw.close()
+
+    def _close_part(self) -> Tuple[str, object]:
+        # Closing the text and gzip layers writes the gzip trailer but leaves raw open
+        self.text.close()
+        self.raw.seek(0)
+        self.parts += 1
+        return f"{self.name}-{self.parts}.{EXPORT_FORMATS[self.fmt]}.gz", self.raw
@@ -0,0 +1,87 @@
+"""Log-bucketed latency histograms for the statistics cog.
+
+Bucket boundaries grow geometrically, so a few dozen buckets cover everything
+from a millisecond to minutes with a bounded relative error, and histograms
+from different processes or hours merge by adding bucket counts.
+"""
+import math
+from typing import Dict, Optional
+
+GROWTH = 2 ** 0.25  # Each bucket is ~19% wider than the previous one
+MIN_MS = 1.0  # Everything at or below this lands in bucket 0
+
+
+def bucket_index(ms: float) -> int:
+    if ms <= MIN_MS:
+        return 0
+    return int(math.log(ms / MIN_MS, GROWTH)) + 1
+
+
+def bucket_midpoint_ms(index: int) -> float:
+    """Geometric middle of a bucket, within ~9% of any value in it"""
+    return MIN_MS * GROWTH ** (index - 0.5) if index else MIN_MS
+
+
+class LogHistogram:
+    """Counts of durations in logarithmic buckets, plus call and error totals."""
+
+    __slots__ = ('buckets', 'count', 'errors', 'total_ms')
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def add(self, ms: float, error: bool = False):
+        index = bucket_index(ms)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total_ms += ms
+        if error:
+            self.errors += 1
+
+    def merge(self, other: 'LogHistogram'):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.errors += other.errors
+        self.total_ms += other.total_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Estimated q-th percentile (0-100) in ms."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return bucket_midpoint_ms(index)
+        return bucket_midpoint_ms(max(self.buckets))
+
+    @property
+    def mean_ms(self) -> Optional[float]:
+        return self.total_ms / self.count if self.count else None
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.count if self.count else 0.0
+
+    def to_dict(self) -> Dict:
+        """Compact form, only non-empty buckets with string keys"""
+        return {
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": self.total_ms
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LogHistogram':
+        histogram = cls()
+        histogram.buckets = {int(index): count for index, count in data.get("buckets", {}).items()}
+        histogram.count = data.get("count", 0)
+        histogram.errors = data.get("errors", 0)
+        histogram.total_ms = data.get("total_ms", 0.0)
+        return histogram
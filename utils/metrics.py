@@ -0,0 +1,257 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Counters and histograms are updated where things happen; collectors are
+functions registered by cogs that read in-memory state (players, queues) when
+/metrics is scraped. Nothing here queries MongoDB or Redis, so a scrape never
+adds database load. The HTTP endpoint is only started when METRICS_PORT is set.
+"""
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+import redis.asyncio as redis
+from aiohttp import web
+from pymongo import monitoring
+
+logger = logging.getLogger('bot.metrics')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LISTENER_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+LOOP_LAG_INTERVAL = 0.5  # Seconds between event loop lag probes
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in list(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, documentation: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.values: Dict[Tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series(**labels)
+            series[index] += 1
+            series[-1] += value
+
+    def series(self, **labels) -> list:
+        """The counts of one label set, for callers on the event loop to update without the lock"""
+        key = tuple(sorted(labels.items()))
+        series = self.values.get(key)
+        if series is None:
+            series = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+        return series
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(series)) for labels, series in self.values.items()]
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                bucket_labels = labels + (("le", _format_value(bound) if math.isinf(bound) else repr(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """All metrics of the process plus collectors that report gauges on scrape."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors: List[Callable] = []
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable):
+        """Add a function returning [(name, help, [(labels dict, value), ...]), ...] gauges"""
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def unregister_collector(self, collector: Callable):
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in list(self.collectors):
+            try:
+                gauges = collector()
+            except Exception as e:
+                logger.error(f"Error collecting metrics from {collector}: {str(e)}", exc_info=True)
+                continue
+            for name, documentation, samples in gauges:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+EVENT_LOOP_LAG = registry.histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop ran a scheduled wake-up"
+)
+LISTENER_DURATION = registry.histogram(
+    "bot_listener_duration_seconds", "Time spent in cog event listeners", LISTENER_BUCKETS
+)
+DB_OPERATION_DURATION = registry.histogram(
+    "bot_db_operation_duration_seconds", "MongoDB command and Redis command latency"
+)
+DB_OPERATION_ERRORS = registry.counter(
+    "bot_db_operation_errors_total", "Failed MongoDB and Redis commands"
+)
+CACHE_REQUESTS = registry.counter(
+    "bot_cache_requests_total", "Cache lookups by cache and result (hit/miss)"
+)
+
+
+def timed_listener(func):
+    """Record how long a cog listener takes. Goes under @commands.Cog.listener()."""
+    # Listeners only run on the event loop, and this is on the path of every
+    # message, so the counts are updated directly instead of through observe()
+    series = LISTENER_DURATION.series(listener=func.__qualname__)
+    buckets = LISTENER_DURATION.buckets
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - started
+            series[bisect.bisect_left(buckets, elapsed)] += 1
+            series[-1] += elapsed
+    return wrapper
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo command listener feeding the database latency histogram."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        DB_OPERATION_DURATION.observe(event.duration_micros / 1e6, backend="mongo", operation=event.command_name)
+
+    def failed(self, event):
+        DB_OPERATION_DURATION.observe(event.duration_micros / 1e6, backend="mongo", operation=event.command_name)
+        DB_OPERATION_ERRORS.inc(backend="mongo", operation=event.command_name)
+
+
+class TimedRedis(redis.Redis):
+    """Redis client timing each command. Pipelines are sent as one batch and aren't timed."""
+
+    async def execute_command(self, *args, **options):
+        operation = str(args[0]).upper() if args else "UNKNOWN"
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            DB_OPERATION_ERRORS.inc(backend="redis", operation=operation)
+            raise
+        finally:
+            DB_OPERATION_DURATION.observe(time.perf_counter() - started, backend="redis", operation=operation)
+
+
+class MetricsServer:
+    """Embedded aiohttp server for /metrics, plus the event loop lag probe."""
+
+    def __init__(self, bot, host: str, port: int):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.lag_task = None
+        registry.register_collector(self.collect)
+
+    def collect(self):
+        latency = self.bot.latency
+        samples = [({}, latency)] if math.isfinite(latency) else []
+        return [("bot_gateway_latency_seconds", "Discord gateway heartbeat latency", samples)]
+
+    async def handle_metrics(self, request):
+        return web.Response(
+            body=registry.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    async def probe_loop_lag(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.lag_task = asyncio.create_task(self.probe_loop_lag())
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.lag_task:
+            self.lag_task.cancel()
+        if self.runner:
+            await self.runner.cleanup()
+        registry.unregister_collector(self.collect)
@@ -0,0 +1,86 @@
+"""Sliding per-second message counts for live activity views.
+
+A window is a ring of per-second counters in a fixed-size list. Counting a
+message is one increment; slots that fell out of the window are zeroed when
+the ring is advanced, which costs at most one pass over the ring.
+Seconds are integer monotonic clock readings.
+"""
+from typing import Dict, List, Tuple
+
+GUILD_WINDOW_SECONDS = 300  # History kept per guild, enough for a 5 minute view
+CHANNEL_WINDOW_SECONDS = 60  # History kept per channel, enough for messages per minute
+
+
+class RateWindow:
+    """Counts of the last size seconds."""
+
+    __slots__ = ('size', 'counts', 'second')
+
+    def __init__(self, size: int = GUILD_WINDOW_SECONDS):
+        self.size = size
+        self.counts = [0] * size
+        self.second = 0  # Newest second in the ring
+
+    def add(self, second: int, amount: int = 1):
+        if second != self.second:
+            self.advance(second)
+        self.counts[second % self.size] += amount
+
+    def advance(self, second: int):
+        """Move the ring forward to second, zeroing the slots of the seconds skipped."""
+        gap = second - self.second
+        if gap <= 0:
+            return
+        if gap >= self.size:
+            self.counts = [0] * self.size
+        else:
+            counts = self.counts
+            size = self.size
+            for skipped in range(self.second + 1, second + 1):
+                counts[skipped % size] = 0
+        self.second = second
+
+    def series(self, second: int, seconds: int = None) -> List[int]:
+        """Per-second counts of the last seconds up to second, oldest first."""
+        self.advance(second)
+        n = min(seconds or self.size, self.size)
+        start = (second - n + 1) % self.size
+        if start + n <= self.size:
+            return self.counts[start:start + n]
+        return self.counts[start:] + self.counts[:start + n - self.size]
+
+    def total(self, second: int, seconds: int = None) -> int:
+        """Messages in the last seconds up to second."""
+        return sum(self.series(second, seconds))
+
+
+class GuildActivity:
+    """Message rate windows of a guild and each of its recently active channels."""
+
+    __slots__ = ('messages', 'channels')
+
+    def __init__(self):
+        self.messages = RateWindow(GUILD_WINDOW_SECONDS)
+        self.channels: Dict[int, RateWindow] = {}
+
+    def add(self, channel_id: int, second: int):
+        self.messages.add(second)
+        window = self.channels.get(channel_id)
+        if window is None:
+            window = self.channels[channel_id] = RateWindow(CHANNEL_WINDOW_SECONDS)
+        window.add(second)
+
+    def busiest_channels(self, second: int, n: int = 5, seconds: int = CHANNEL_WINDOW_SECONDS) -> List[Tuple[int, int]]:
+        """The n channels with the most messages in the last seconds, as (channel id, messages)."""
+        totals = [(channel_id, window.total(second, seconds)) for channel_id, window in self.channels.items()]
+        return sorted((item for item in totals if item[1]), key=lambda item: item[1], reverse=True)[:n]
+
+    def prune(self, second: int):
+        """Forget channels with no message left in their window."""
+        quiet = []
+        for channel_id, window in self.channels.items():
+            window.advance(second)
+            if not any(window.counts):
+                quiet.append(channel_id)
+        for channel_id in quiet:
+            del self.channels[channel_id]
@@ -0,0 +1,89 @@
+"""Bounded heavy-hitter tracking for the statistics cog.
+
+Implements the Space-Saving algorithm (Metwally, Agrawal and El Abbadi, 2005):
+at most k keys are tracked, and a new key takes over the slot of the current
+minimum, inheriting its count as the overestimation error.
+"""
+import heapq
+from operator import itemgetter
+from typing import Dict, List, Tuple
+
+
+class SpaceSaving:
+    """Approximate top-k counter using a fixed number of slots.
+
+    Each tracked count overestimates the true count by at most its error, and
+    any key seen more than total / k times is guaranteed to be tracked.
+    """
+
+    __slots__ = ('k', 'counts', 'errors', '_heap')
+
+    def __init__(self, k: int = 50):
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._heap: List[Tuple[int, str]] = []  # (count, key), outdated entries are skipped when popped
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key: str, amount: int = 1):
+        """Count amount occurrences of key."""
+        counts = self.counts
+        if key in counts:
+            counts[key] += amount
+        elif len(counts) < self.k:
+            counts[key] = amount
+            self.errors[key] = 0
+        else:
+            evicted, floor = self._pop_min()
+            del counts[evicted]
+            del self.errors[evicted]
+            counts[key] = floor + amount
+            self.errors[key] = floor
+
+        heapq.heappush(self._heap, (counts[key], key))
+        if len(self._heap) > 4 * self.k + 64:
+            self._rebuild()
+
+    def update(self, items: Dict[str, int]):
+        """Count several keys at once."""
+        for key, amount in items.items():
+            self.add(key, amount)
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        """The n largest counts as (key, count, error), without sorting every slot."""
+        return [(key, count, self.errors[key])
+                for key, count in heapq.nlargest(n, self.counts.items(), key=itemgetter(1))]
+
+    def resize(self, k: int):
+        """Change the number of slots, keeping the largest counts when shrinking."""
+        if k < len(self.counts):
+            kept = heapq.nlargest(k, self.counts.items(), key=itemgetter(1))
+            self.counts = dict(kept)
+            self.errors = {key: self.errors[key] for key in self.counts}
+        self.k = k
+        self._rebuild()
+
+    def to_dict(self) -> Dict:
+        """Serializable state, a list of entries so keys never end up as document field names."""
+        return {"k": self.k, "items": [[key, count, self.errors[key]] for key, count in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SpaceSaving':
+        sketch = cls(data.get("k", 50))
+        for key, count, error in data.get("items", []):
+            sketch.counts[key] = count
+            sketch.errors[key] = error
+        sketch._rebuild()
+        return sketch
+
+    def _pop_min(self) -> Tuple[str, int]:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def _rebuild(self):
+        self._heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self._heap)
@@ -0,0 +1,57 @@
+"""Banned word matching for AutoMod.
+
+All words of a guild are compiled into one regular expression shaped like a
+trie, so shared prefixes are matched once: ``bad``, ``badger`` and ``bat``
+become ``\\b(?:ba(?:d(?:ger)?|t))\\b``. At each position of a message the
+engine follows a single path through the trie instead of trying every word in
+turn, and a match still means some word appears with word boundaries on both
+sides, as with one ``\\bword\\b`` search per word.
+"""
+import re
+from typing import Dict, Iterable, Optional
+
+_END = ""  # Trie key marking that a word ends at this node
+
+
+def _trie(words: Iterable[str]) -> Dict:
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[_END] = {}
+    return root
+
+
+def _pattern(node: Dict) -> str:
+    # Runs of single characters become literals, which also keeps the
+    # recursion as shallow as the number of branches on a path
+    literal = []
+    while len(node) == 1 and _END not in node:
+        char, node = next(iter(node.items()))
+        literal.append(re.escape(char))
+    branches = [re.escape(char) + _pattern(child) for char, child in sorted(node.items()) if char != _END]
+    if not branches:
+        return "".join(literal)
+    if len(branches) == 1:
+        body = f"(?:{branches[0]})?" if _END in node else branches[0]
+    else:
+        body = "(?:" + "|".join(branches) + ")" + ("?" if _END in node else "")
+    return "".join(literal) + body
+
+
+class BannedWordMatcher:
+    """Case-insensitive whole word search for any of a list of words or phrases."""
+
+    __slots__ = ('words', 'regex')
+
+    def __init__(self, words: Iterable[str]):
+        self.words = frozenset(word.lower() for word in words if word)
+        self.regex = re.compile(rf"\b(?:{_pattern(_trie(self.words))})\b", re.IGNORECASE) if self.words else None
+
+    def search(self, text: str) -> Optional[str]:
+        """The first banned word in text, or None."""
+        if self.regex is None:
+            return None
+        match = self.regex.search(text)
+        return match.group(0).lower() if match else None